@@ -7,12 +7,15 @@ Objetivo: Ingesta multipar paralela con validación profunda, trazabilidad total
 import os
 import time
 import traceback
+from itertools import repeat
 import logging
 import pandas as pd
-import sqlite3
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from core.anima_broker import AnimaBroker
+from core.anima_broker import AnimaBroker, OHLCVPageError
 from anima_config import cargar_config
+from anima_utils import parse_timeframe
+from anima_db import get_connection
+from observability import ohlcv_insert_latency, ohlcv_ingestion_throughput
 
 logger = logging.getLogger(__name__)
 
@@ -22,20 +25,24 @@ DEFAULT_MINUTES = 60
 MAX_RETRIES = 3
 RETRY_BACKOFF = 2  # segundos
 MAX_API_WORKERS = 8  # límite duro para no saturar la API
+BULK_CHUNK_SIZE = 5000  # filas por transacción en la inserción masiva
+OHLCV_INSERT_COLUMNS = "symbol, timeframe, timestamp, open, high, low, close, volume"
 
 class AnimaData:
     """
     Gestor de almacenamiento de datos OHLCV: SQLite y Parquet.
     """
-    def __init__(self, broker: AnimaBroker, data_dir: str = "data", db_path: str = "ohlcv.sqlite"):
+    def __init__(self, broker: AnimaBroker, data_dir: str = "data", db_path: str = "ohlcv.sqlite",
+                 staging_insert: bool = False):
         os.makedirs(data_dir, exist_ok=True)
         self.broker = broker
         self.data_dir = data_dir
         self.db_path = db_path
+        self.staging_insert = staging_insert
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS ohlcv (
                     symbol TEXT,
@@ -49,6 +56,16 @@ class AnimaData:
                     PRIMARY KEY(symbol, timeframe, timestamp)
                 )
             """)
+            # Huecos ya consultados al broker sin velas (mercado cerrado, festivos)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ohlcv_gaps (
+                    symbol TEXT,
+                    timeframe TEXT,
+                    start INTEGER,
+                    end INTEGER,
+                    PRIMARY KEY(symbol, timeframe, start)
+                )
+            """)
 
     def store_data(self, df: pd.DataFrame, symbol: str, timeframe: str, parquet: bool, sqlite_store: bool):
         """
@@ -66,42 +83,203 @@ class AnimaData:
             df.to_parquet(parquet_path, index=False)
 
         if sqlite_store:
-            with sqlite3.connect(self.db_path) as conn:
-                try:
-                    conn.executemany("""
-                        INSERT OR REPLACE INTO ohlcv
-                        (symbol, timeframe, timestamp, open, high, low, close, volume)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, [tuple(row) for _, row in df.iterrows()])
-                except Exception as e:
-                    logger.error(f"[{symbol}] Error en inserción SQLite: {e}")
+            try:
+                self.bulk_insert_ohlcv(df, symbol, timeframe)
+            except Exception as e:
+                logger.error(f"[{symbol}] Error en inserción SQLite: {e}")
+
+    def bulk_insert_ohlcv(self, df: pd.DataFrame, symbol: str, timeframe: str,
+                          chunk_size: int = BULK_CHUNK_SIZE, staging: bool = None) -> int:
+        """
+        Inserta velas en SQLite a partir de los arrays de columna del DataFrame,
+        en transacciones de `chunk_size` filas. Con `staging` las filas se cargan
+        primero en una tabla temporal y se fusionan con un único
+        `INSERT OR REPLACE ... SELECT` por bloque. Devuelve las filas escritas.
+        """
+        n = len(df)
+        if n == 0:
+            return 0
+        staging = self.staging_insert if staging is None else staging
+        ts = df["timestamp"]
+        if pd.api.types.is_datetime64_any_dtype(ts):
+            ts = ts.astype("datetime64[s]").astype("int64")
+        # tolist() convierte a escalares de Python de una vez (sqlite3 no acepta tipos NumPy)
+        columnas = [ts.to_numpy(dtype="int64").tolist()] + [
+            df[col].to_numpy(dtype="float64").tolist() for col in ("open", "high", "low", "close", "volume")
+        ]
+        filas = list(zip(repeat(symbol, n), repeat(timeframe, n), *columnas))
+
+        start = time.perf_counter()
+        conn = get_connection(self.db_path)
+        if staging:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS ohlcv_staging AS SELECT * FROM ohlcv WHERE 0")
+        for i in range(0, n, chunk_size):
+            bloque = filas[i:i + chunk_size]
+            with conn:
+                if staging:
+                    conn.execute("DELETE FROM ohlcv_staging")
+                    conn.executemany(f"INSERT INTO ohlcv_staging ({OHLCV_INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", bloque)
+                    conn.execute(f"INSERT OR REPLACE INTO ohlcv ({OHLCV_INSERT_COLUMNS}) "
+                                 f"SELECT {OHLCV_INSERT_COLUMNS} FROM ohlcv_staging")
+                else:
+                    conn.executemany(f"INSERT OR REPLACE INTO ohlcv ({OHLCV_INSERT_COLUMNS}) "
+                                     f"VALUES (?, ?, ?, ?, ?, ?, ?, ?)", bloque)
+        elapsed = time.perf_counter() - start
+        ohlcv_insert_latency.observe(elapsed)
+        ohlcv_ingestion_throughput.labels(symbol=symbol).set(n / elapsed if elapsed > 0 else float(n))
+        logger.debug(f"[{symbol}] {n} velas insertadas en {elapsed:.3f}s")
+        return n
 
     def fetch_and_persist_ohlcv(self, symbol: str, timeframe: str, since: int, until: int = None, parquet: bool = True, sqlite_store: bool = True):
         """
-        Descarga datos OHLCV del broker, valida, convierte y guarda. Incluye reintentos.
+        Descarga datos OHLCV del broker página a página, valida, convierte y guarda
+        cada página según llega. Tras un fallo reintenta desde la primera vela
+        no recibida. Devuelve las velas guardadas o None si se agotan los reintentos.
         """
+        until = until or int(time.time())
+        total = 0
+        frames = []
+        last_ts = None   # última vela ya guardada: punto de reanudación tras un error genérico
         attempt = 0
         while attempt < MAX_RETRIES:
             try:
-                ohlcv = self.broker.fetch_ohlcv(symbol, timeframe, since, until)
+                for ohlcv in self._iter_pages(symbol, timeframe, since, until):
+                    if not isinstance(ohlcv, list) or not all(isinstance(row, list) and len(row) == 6 for row in ohlcv):
+                        raise ValueError(f"[{symbol}] Datos OHLCV malformados o corruptos.")
 
-                if not isinstance(ohlcv, list) or not all(isinstance(row, list) and len(row) == 6 for row in ohlcv):
-                    raise ValueError(f"[{symbol}] Datos OHLCV malformados o corruptos.")
+                    df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
+                    df["symbol"] = symbol
+                    df["timeframe"] = timeframe
+                    df = df[["symbol", "timeframe", "timestamp", "open", "high", "low", "close", "volume"]]
 
-                df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-                df["symbol"] = symbol
-                df["timeframe"] = timeframe
-                df = df[["symbol", "timeframe", "timestamp", "open", "high", "low", "close", "volume"]]
-
-                self.store_data(df, symbol, timeframe, parquet, sqlite_store)
-                return len(df)
+                    self.store_data(df, symbol, timeframe, parquet=False, sqlite_store=sqlite_store)
+                    if parquet:
+                        frames.append(df)
+                    total += len(df)
+                    if not df.empty:
+                        last_ts = int(df["timestamp"].max())
+                break
 
+            except OHLCVPageError as e:
+                # Las páginas anteriores ya están guardadas: se reanuda desde la fallida
+                attempt += 1
+                since = e.resume_since
+                logger.error(f"[{symbol}] {e} (intento {attempt} de {MAX_RETRIES})")
+                time.sleep(RETRY_BACKOFF * attempt)
             except Exception:
                 attempt += 1
+                # Las páginas ya guardadas no se vuelven a pedir
+                if last_ts is not None:
+                    since = max(since, last_ts + 1)
                 logger.error(f"[{symbol}] Error en intento {attempt} de {MAX_RETRIES}:")
                 logger.error(traceback.format_exc())
                 time.sleep(RETRY_BACKOFF * attempt)
-        return 0
+        else:
+            return None
+
+        if parquet and frames:
+            # Defensa ante solapes entre páginas: una vela por timestamp (la más reciente)
+            df = pd.concat(frames, ignore_index=True).drop_duplicates("timestamp", keep="last")
+            df.to_parquet(os.path.join(self.data_dir, f"{symbol}_{timeframe}.parquet"), index=False)
+        return total
+
+    def _iter_pages(self, symbol: str, timeframe: str, since: int, until: int):
+        # Brokers sin descarga paginada devuelven el rango completo como una sola página
+        iter_ohlcv = getattr(self.broker, "iter_ohlcv", None)
+        if iter_ohlcv is None:
+            return [self.broker.fetch_ohlcv(symbol, timeframe, since, until)]
+        return iter_ohlcv(symbol, timeframe, since, until)
+
+    def watermark(self, symbol: str, timeframe: str):
+        """Devuelve (primer, último) timestamp almacenado para (symbol, timeframe), o (None, None)."""
+        row = get_connection(self.db_path).execute(
+            "SELECT MIN(timestamp), MAX(timestamp) FROM ohlcv WHERE symbol = ? AND timeframe = ?",
+            (symbol, timeframe)
+        ).fetchone()
+        return row[0], row[1]
+
+    def missing_ranges(self, symbol: str, timeframe: str, since: int, until: int):
+        """
+        Rangos [inicio, fin] de `since`..`until` que faltan en SQLite: el tramo
+        anterior a la primera vela, los huecos intermedios (vía LAG sobre la
+        clave primaria) y el tramo posterior a la marca de agua. Cada rango
+        incluye las velas conocidas que lo delimitan, de modo que la última vela
+        (posiblemente incompleta) se vuelve a descargar. Se omiten los huecos
+        registrados como vacíos en `ohlcv_gaps`.
+        """
+        step = parse_timeframe(timeframe)
+        conn = get_connection(self.db_path)
+        first, last = conn.execute(
+            "SELECT MIN(timestamp), MAX(timestamp) FROM ohlcv "
+            "WHERE symbol = ? AND timeframe = ? AND timestamp BETWEEN ? AND ?",
+            (symbol, timeframe, since, until)
+        ).fetchone()
+        if first is None:
+            rangos = [(since, until)]
+        else:
+            rangos = []
+            if first - since >= step:
+                rangos.append((since, first))
+            huecos = conn.execute("""
+                SELECT prev, timestamp FROM (
+                    SELECT timestamp, LAG(timestamp) OVER (ORDER BY timestamp) AS prev
+                    FROM ohlcv WHERE symbol = ? AND timeframe = ? AND timestamp BETWEEN ? AND ?
+                ) WHERE timestamp - prev > ?
+            """, (symbol, timeframe, first, last, step)).fetchall()
+            rangos.extend(huecos)
+            if until > last:
+                rangos.append((last, until))
+        vacios = conn.execute(
+            "SELECT start, end FROM ohlcv_gaps WHERE symbol = ? AND timeframe = ? AND end >= ? AND start <= ?",
+            (symbol, timeframe, since, until)
+        ).fetchall()
+        return [(a, b) for a, b in rangos if not any(ga <= a and b <= gb for ga, gb in vacios)]
+
+    def sync_ohlcv(self, symbol: str, timeframe: str, since: int, until: int = None,
+                   parquet: bool = True, sqlite_store: bool = True) -> int:
+        """
+        Ingesta incremental: descarga sólo los rangos ausentes de SQLite dentro de
+        [since, until]. Los rangos interiores que el broker devuelve vacíos se
+        registran como huecos conocidos para no volver a pedirlos. El Parquet se
+        exporta al final con la ventana completa leída de SQLite.
+        """
+        until = until or int(time.time())
+        if not sqlite_store:
+            return self.fetch_and_persist_ohlcv(symbol, timeframe, since, until, parquet, sqlite_store) or 0
+        step = parse_timeframe(timeframe)
+        total = 0
+        for inicio, fin in self.missing_ranges(symbol, timeframe, since, until):
+            antes = self._count_range(symbol, timeframe, inicio, fin)
+            registros = self.fetch_and_persist_ohlcv(symbol, timeframe, inicio, fin,
+                                                     parquet=False, sqlite_store=True)
+            if registros is None:
+                continue  # fallo tras reintentos: se reintentará en la próxima ingesta
+            nuevas = self._count_range(symbol, timeframe, inicio, fin) - antes
+            total += nuevas
+            # Sólo se marca vacío un hueco cerrado; el tramo final puede llenarse todavía
+            if nuevas == 0 and until - fin >= step:
+                with get_connection(self.db_path) as conn:
+                    conn.execute("INSERT OR REPLACE INTO ohlcv_gaps (symbol, timeframe, start, end) VALUES (?, ?, ?, ?)",
+                                 (symbol, timeframe, inicio, fin))
+        if parquet:
+            self.export_parquet(symbol, timeframe, since, until)
+        return total
+
+    def _count_range(self, symbol: str, timeframe: str, since: int, until: int) -> int:
+        return get_connection(self.db_path).execute(
+            "SELECT COUNT(*) FROM ohlcv WHERE symbol = ? AND timeframe = ? AND timestamp BETWEEN ? AND ?",
+            (symbol, timeframe, since, until)
+        ).fetchone()[0]
+
+    def export_parquet(self, symbol: str, timeframe: str, since: int, until: int):
+        """Exporta a Parquet las velas de SQLite dentro de [since, until]."""
+        df = pd.read_sql_query(
+            f"SELECT {OHLCV_INSERT_COLUMNS} FROM ohlcv "
+            "WHERE symbol = ? AND timeframe = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp",
+            get_connection(self.db_path), params=(symbol, timeframe, since, until)
+        )
+        if not df.empty:
+            df.to_parquet(os.path.join(self.data_dir, f"{symbol}_{timeframe}.parquet"), index=False)
 
 def load_ingestion_config():
     cfg = cargar_config()
@@ -124,7 +302,8 @@ def get_time_range(minutos):
 
 def run_ohlcv_ingestion(symbol, timeframe, since, until, data_manager, parquet, sqlite_store):
     start = time.time()
-    registros = data_manager.fetch_and_persist_ohlcv(
+    # Sólo se descargan los rangos que faltan en SQLite dentro de la ventana configurada
+    registros = data_manager.sync_ohlcv(
         symbol=symbol,
         timeframe=timeframe,
         since=since,
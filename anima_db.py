@@ -6,24 +6,233 @@ Proporciona interfaces para:
   - Registrar operaciones ejecutadas
   - Registrar errores en la ejecución
   - Cargar señales y operaciones para análisis y backtesting
+  - Conexiones SQLite persistentes por hilo (WAL) compartidas por todo el sistema
 """
 import os
+import queue
 import sqlite3
+import threading
+import time
+import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from anima_config import cargar_config
+from observability import db_write_queue_depth, db_flush_latency, ohlcv_query_latency, error_counter
+
+logger = logging.getLogger(__name__)
+
+# Pragmas aplicados a cada conexión nueva: WAL permite lectores concurrentes con
+# un escritor y, con synchronous=NORMAL, evita un fsync por cada commit.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,        # KiB (negativo) → ~16 MB de caché de páginas
+    'mmap_size': 268435456,      # 256 MB mapeados en memoria para lecturas
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,        # ms esperando locks de otros procesos/hilos
+}
+
+
+class ConnectionManager:
+    """
+    Conexiones SQLite persistentes, una por (hilo, fichero), con los pragmas de
+    `SQLITE_PRAGMAS` aplicados al abrirlas. Evita pagar `sqlite3.connect` y la
+    configuración de la conexión en cada escritura del camino caliente.
+    """
+
+    def __init__(self, pragmas: dict = None):
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        self._local = threading.local()
+
+    def get(self, db_path: str) -> sqlite3.Connection:
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        path = os.path.abspath(db_path)
+        conn = conns.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=self.pragmas.get('busy_timeout', 5000) / 1000)
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name}={value}")
+            conns[path] = conn
+        return conn
+
+    def close_all(self):
+        """Cierra las conexiones abiertas por el hilo actual."""
+        conns = getattr(self._local, 'conns', None) or {}
+        for conn in conns.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        conns.clear()
+
+
+# Gestor compartido por DBHandler, SupervisorMetaCognitivo y AnimaData
+connections = ConnectionManager()
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """Conexión persistente del hilo actual a `db_path`. Usar `with conn:` para transacciones."""
+    return connections.get(db_path)
+
+
+OHLCV_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+SQL_INSERT_SIGNAL = ('INSERT INTO signals (timestamp, pair, strategy, direction, nivel, monto, metadata) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?)')
+SQL_INSERT_OPERATION = ('INSERT INTO operations (timestamp, pair, strategy, result, monto, nivel, balance_before, balance_after) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_INSERT_ERROR = 'INSERT INTO errors (timestamp, module, message) VALUES (?, ?, ?)'
+SQL_INSERT_RL_METRIC = ('INSERT INTO rl_metrics (timestamp, step, action, reward, balance, ensemble_signal, weights_mean, epsilon) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+
+# Marcador interno para despertar al escritor durante el cierre
+_WAKE = object()
+
+
+class WriteBehindWriter(threading.Thread):
+    """
+    Escritor en segundo plano para la telemetría de trading.
+
+    Acepta sentencias INSERT en una cola acotada y las persiste agrupadas por
+    sentencia con `executemany`, en una transacción por lote. El lote se vuelca
+    al alcanzar `batch_size` filas o tras `flush_interval` segundos; `close()`
+    vacía la cola antes de terminar. Si la cola está llena durante más de
+    `put_timeout` segundos la fila se descarta y se contabiliza como error, de
+    modo que el bucle de decisión nunca queda bloqueado por el disco.
+
+    Un lote que falla se reintenta `retries` veces con espera exponencial
+    (`retry_backoff`, 2·`retry_backoff`, ...) y, si sigue fallando, se escribe
+    fila a fila para que una fila inválida no arrastre al resto.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_queue: int = 10000, put_timeout: float = 0.05,
+                 retries: int = 3, retry_backoff: float = 0.1):
+        super().__init__(daemon=True, name="db-writer")
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._closing = threading.Event()
+
+    def submit(self, sql: str, params: tuple) -> bool:
+        """Encola una fila; devuelve False si se descartó por cola llena."""
+        try:
+            self.queue.put((sql, params), timeout=self.put_timeout)
+        except queue.Full:
+            error_counter.labels(component='db_writer').inc()
+            logger.warning("[DBWriter] Cola llena; fila descartada")
+            return False
+        db_write_queue_depth.set(self.queue.qsize())
+        return True
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+                if item is _WAKE:
+                    self.queue.task_done()
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            closing = self._closing.is_set()
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline or closing:
+                # Al cerrar, se recoge todo lo pendiente sin esperar
+                while closing or len(batch) < self.batch_size:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _WAKE:
+                        self.queue.task_done()
+                    else:
+                        batch.append(item)
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                if closing and self.queue.empty():
+                    connections.close_all()
+                    return
+
+    def _flush(self, batch: list):
+        db_write_queue_depth.set(self.queue.qsize())
+        if not batch:
+            return
+        # Agrupar por sentencia manteniendo el orden de llegada de cada tabla
+        grupos = {}
+        for sql, params in batch:
+            grupos.setdefault(sql, []).append(params)
+        inicio = time.perf_counter()
+        try:
+            for intento in range(self.retries + 1):
+                try:
+                    with get_connection(self.db_path) as conn:
+                        for sql, filas in grupos.items():
+                            conn.executemany(sql, filas)
+                    return
+                except Exception as e:
+                    logger.warning(f"[DBWriter] Error volcando {len(batch)} filas "
+                                   f"(intento {intento + 1}/{self.retries + 1}): {e}")
+                    if intento < self.retries:
+                        time.sleep(self.retry_backoff * 2 ** intento)
+            self._flush_rows(batch)
+        finally:
+            db_flush_latency.observe(time.perf_counter() - inicio)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _flush_rows(self, batch: list):
+        """Último recurso tras agotar los reintentos: una transacción por fila."""
+        perdidas = 0
+        for sql, params in batch:
+            try:
+                with get_connection(self.db_path) as conn:
+                    conn.execute(sql, params)
+            except Exception as e:
+                perdidas += 1
+                logger.error(f"[DBWriter] Fila descartada ({sql.split('(')[0].strip()}): {e}")
+        if perdidas:
+            # Igual que las filas descartadas por cola llena
+            error_counter.labels(component='db_writer').inc(perdidas)
+
+    def flush(self):
+        """Bloquea hasta que todas las filas encoladas estén escritas."""
+        if self.is_alive():
+            self.queue.join()
+
+    def close(self, timeout: float = 10.0):
+        """Vacía la cola pendiente y detiene el hilo."""
+        self._closing.set()
+        if self.is_alive():
+            # Despierta al hilo si está bloqueado esperando filas
+            self.queue.put(_WAKE)
+            self.join(timeout=timeout)
+        if self.is_alive():
+            logger.warning(f"[DBWriter] Cierre sin vaciar: {self.queue.qsize()} filas pendientes")
 
 
 class DBHandler:
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, ohlcv_path: str = None):
         cfg = cargar_config()
         base_dir = cfg.get('db_dir', 'data/sqlite')
         os.makedirs(base_dir, exist_ok=True)
         self.db_path = db_path or os.path.join(base_dir, 'operations.db')
+        self.ohlcv_path = ohlcv_path or cfg.get('ohlcv_db_path', 'ohlcv.sqlite')
+        self.writer = None
         self._initialize_db()
 
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             # Tabla de señales
             cursor.execute('''
@@ -76,17 +285,38 @@ class DBHandler:
                 );
             ''')
 
+    def enable_write_behind(self, **kwargs) -> 'WriteBehindWriter':
+        """
+        Activa la escritura diferida: señales, errores y métricas RL se encolan
+        y un hilo de fondo las persiste por lotes (las operaciones siguen
+        siendo síncronas). Los kwargs se pasan a WriteBehindWriter.
+        """
+        if self.writer is None:
+            self.writer = WriteBehindWriter(self.db_path, **kwargs)
+            self.writer.start()
+        return self.writer
+
+    def close(self, timeout: float = 10.0):
+        """Vacía la cola de escritura diferida (si existe) antes de apagar."""
+        if self.writer is not None:
+            self.writer.close(timeout=timeout)
+            self.writer = None
+
+    def _write(self, sql: str, params: tuple, sync: bool = False):
+        # sync=True: filas que no pueden perderse (operaciones) no pasan por la cola
+        if self.writer is not None and not sync:
+            self.writer.submit(sql, params)
+            return
+        with get_connection(self.db_path) as conn:
+            conn.execute(sql, params)
+
     def registrar_signal(self, pair: str, strategy: str, direction: str,
                           nivel: int = None, monto: float = None, metadata: str = None):
         """
         Inserta una señal en la tabla signals.
         """
         ts = datetime.utcnow().isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                'INSERT INTO signals (timestamp, pair, strategy, direction, nivel, monto, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                (ts, pair, strategy, direction, nivel, monto, metadata)
-            )
+        self._write(SQL_INSERT_SIGNAL, (ts, pair, strategy, direction, nivel, monto, metadata))
 
     def registrar_operacion(self, pair: str, strategy: str, result: str,
                              monto: float, nivel: int = None,
@@ -95,22 +325,17 @@ class DBHandler:
         Inserta una operación en la tabla operations.
         """
         ts = datetime.utcnow().isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                'INSERT INTO operations (timestamp, pair, strategy, result, monto, nivel, balance_before, balance_after) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                (ts, pair, strategy, result, monto, nivel, balance_before, balance_after)
-            )
+        # Escritura síncrona: la cola diferida puede descartar filas y operations
+        # es la fuente de verdad del GA y de la contabilidad
+        self._write(SQL_INSERT_OPERATION, (ts, pair, strategy, result, monto, nivel, balance_before, balance_after),
+                    sync=True)
 
     def registrar_error(self, module: str, message: str):
         """
         Inserta un error en la tabla errors.
         """
         ts = datetime.utcnow().isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                'INSERT INTO errors (timestamp, module, message) VALUES (?, ?, ?)',
-                (ts, module, message)
-            )
+        self._write(SQL_INSERT_ERROR, (ts, module, message))
 
     def registrar_rl_metric(self, step: int, action: int, reward: float, balance: float,
                              ensemble_signal: str, weights: list, epsilon: float):
@@ -120,15 +345,10 @@ class DBHandler:
         ts = datetime.utcnow().isoformat()
         weights_mean = float(sum(weights) / len(weights)) if weights else 0.0
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    '''INSERT INTO rl_metrics (timestamp, step, action, reward, balance, ensemble_signal, weights_mean, epsilon)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?);''',
-                    (ts, step, action, reward, balance, ensemble_signal, weights_mean, epsilon)
-                )
+            self._write(SQL_INSERT_RL_METRIC,
+                        (ts, step, action, reward, balance, ensemble_signal, weights_mean, epsilon))
         except Exception as e:
-            # Registrar error de base de datos
-            print(f"[Error DB rl_metrics] {e}")
+            logger.error(f"[DB] Error registrando métrica RL: {e}")
 
     def load_signals(self, since: str = None) -> pd.DataFrame:
         """
@@ -139,40 +359,83 @@ class DBHandler:
         query = 'SELECT timestamp, pair, strategy, direction, nivel, monto, metadata FROM signals'
         if since:
             query += f" WHERE timestamp >= '{since}'"
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql(query, conn, parse_dates=['timestamp'])
+        df = pd.read_sql(query, get_connection(self.db_path), parse_dates=['timestamp'])
         return df
 
-    def load_operations(self, since: str = None) -> pd.DataFrame:
+    def load_operations(self, since: str = None, after_id: int = None) -> pd.DataFrame:
         """
         Carga operaciones de la tabla operations.
         :param since: ISO timestamp para filtrar (opcional)
-        :return: DataFrame con columnas [timestamp, pair, strategy, result, monto, nivel, balance_before, balance_after]
+        :param after_id: sólo operaciones con id mayor (carga incremental, opcional)
+        :return: DataFrame con columnas [id, timestamp, pair, strategy, result, monto, nivel, balance_before, balance_after]
         """
-        query = 'SELECT timestamp, pair, strategy, result, monto, nivel, balance_before, balance_after FROM operations'
+        query = 'SELECT id, timestamp, pair, strategy, result, monto, nivel, balance_before, balance_after FROM operations'
+        filters, params = [], []
         if since:
-            query += f" WHERE timestamp >= '{since}'"
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql(query, conn, parse_dates=['timestamp'])
+            filters.append('timestamp >= ?')
+            params.append(since)
+        if after_id is not None:
+            filters.append('id > ?')
+            params.append(int(after_id))
+        if filters:
+            query += ' WHERE ' + ' AND '.join(filters)
+        query += ' ORDER BY id'
+        df = pd.read_sql(query, get_connection(self.db_path), params=params, parse_dates=['timestamp'])
         return df
 
-    def load_ohlcv(self, symbol: str, timeframe: str = None) -> pd.DataFrame:
+    def load_ohlcv(self, symbol: str, timeframe: str = None, since: int = None, until: int = None,
+                   limit: int = None, as_arrays: bool = False):
         """
-        Carga datos OHLCV desde la base de datos ohlcv.sqlite para un símbolo.
+        Carga velas OHLCV de un símbolo ordenadas de la más antigua a la más reciente.
+
+        Con `timeframe` indicado, los filtros de tiempo se resuelven como un rango
+        sobre la clave primaria (symbol, timeframe, timestamp), sin recorrer la tabla.
+        :param since: timestamp Unix (s); sólo velas posteriores (exclusivo)
+        :param until: timestamp Unix (s); sólo velas hasta ese instante (inclusivo)
+        :param limit: devuelve únicamente las últimas `limit` velas del rango
+        :param as_arrays: devuelve un dict de arrays NumPy por columna en lugar de un DataFrame
         """
-        import sqlite3
-        import pandas as pd
-        db_path = 'ohlcv.sqlite'
-        query = 'SELECT timestamp, open, high, low, close, volume, timeframe FROM ohlcv WHERE symbol = ?'
+        columns = list(OHLCV_COLUMNS) if timeframe else list(OHLCV_COLUMNS) + ['timeframe']
+        query = f"SELECT {', '.join(columns)} FROM ohlcv WHERE symbol = ?"
         params = [symbol]
         if timeframe:
             query += ' AND timeframe = ?'
             params.append(timeframe)
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query(query, conn, params=params, parse_dates=['timestamp'])
-        conn.close()
-        return df
+        if since is not None:
+            query += ' AND timestamp > ?'
+            params.append(int(since))
+        if until is not None:
+            query += ' AND timestamp <= ?'
+            params.append(int(until))
+        if limit is not None:
+            # Recorrido inverso del índice: sólo se leen las `limit` filas necesarias
+            query += ' ORDER BY timestamp DESC LIMIT ?'
+            params.append(int(limit))
+        else:
+            query += ' ORDER BY timestamp'
+
+        inicio = time.perf_counter()
+        rows = get_connection(self.ohlcv_path).execute(query, params).fetchall()
+        ohlcv_query_latency.observe(time.perf_counter() - inicio)
+        if limit is not None:
+            rows.reverse()
 
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        arrays = {}
+        for col, vals in zip(columns, values):
+            if col == 'timestamp':
+                arrays[col] = np.asarray(vals, dtype=np.int64)
+            elif col == 'timeframe':
+                arrays[col] = np.asarray(vals, dtype=object)
+            else:
+                arrays[col] = np.asarray(vals, dtype=np.float64)
+        if as_arrays:
+            return arrays
+        arrays['timestamp'] = arrays['timestamp'].astype('datetime64[s]').astype('datetime64[ns]')
+        df = pd.DataFrame(arrays)
+        if timeframe:
+            df['timeframe'] = timeframe
+        return df
 
 if __name__ == '__main__':
     # Prueba rápida de DBHandler
@@ -1,22 +1,34 @@
 #anima_ensemble.py
+import time
+from functools import lru_cache
+
 import numpy as np
 from anima_logger import setup_logger
+from observability import ensemble_latency
 
 logger = setup_logger("anima_ensemble")
-# Intentamos usar Numba; si no está disponible, caemos a versión Python pura
+
+# Por debajo de este número de votos el kernel paralelo cuesta más en arranque de hilos que en trabajo
+PARALLEL_THRESHOLD = 50_000
+
+# Intentamos usar Numba; si no está disponible, caemos a versión NumPy pura
 try:
     from numba import njit, prange
 except ImportError:
-    def _compute_net_gains(strategy_ids: np.ndarray, results: np.ndarray, payouts: np.ndarray, n_strategies: int) -> np.ndarray:
-        gains = np.zeros(n_strategies, dtype=np.float64)
-        for idx, r in zip(strategy_ids, results):
-            gains[idx] += payouts[idx] if r == 1 else -payouts[idx]
-        return gains
+    HAS_NUMBA = False
+
+    def _net_gains_serial(strategy_ids: np.ndarray, results: np.ndarray, payouts: np.ndarray, n_strategies: int) -> np.ndarray:
+        signed = np.where(results == 1, payouts[strategy_ids], -payouts[strategy_ids])
+        return np.bincount(strategy_ids, weights=signed, minlength=n_strategies).astype(np.float64)
+
+    _net_gains_parallel = _net_gains_serial
 else:
-    @njit(parallel=True)
-    def _compute_net_gains(strategy_ids: np.ndarray, results: np.ndarray, payouts: np.ndarray, n_strategies: int) -> np.ndarray:
+    HAS_NUMBA = True
+
+    @njit(cache=True)
+    def _net_gains_serial(strategy_ids: np.ndarray, results: np.ndarray, payouts: np.ndarray, n_strategies: int) -> np.ndarray:
         gains = np.zeros(n_strategies, dtype=np.float64)
-        for i in prange(results.shape[0]):
+        for i in range(results.shape[0]):
             idx = strategy_ids[i]
             if results[i] == 1:
                 gains[idx] += payouts[idx]
@@ -24,19 +36,147 @@ else:
                 gains[idx] -= payouts[idx]
         return gains
 
+    @njit(parallel=True, cache=True)
+    def _net_gains_parallel(strategy_ids: np.ndarray, results: np.ndarray, payouts: np.ndarray, n_strategies: int) -> np.ndarray:
+        # Contribuciones en paralelo; la acumulación por estrategia es serial para no competir por gains[idx]
+        signed = np.empty(results.shape[0], dtype=np.float64)
+        for i in prange(results.shape[0]):
+            p = payouts[strategy_ids[i]]
+            signed[i] = p if results[i] == 1 else -p
+        gains = np.zeros(n_strategies, dtype=np.float64)
+        for i in range(results.shape[0]):
+            gains[strategy_ids[i]] += signed[i]
+        return gains
+
+
+def _compute_net_gains(strategy_ids: np.ndarray, results: np.ndarray, payouts: np.ndarray, n_strategies: int) -> np.ndarray:
+    """Ganancia neta por estrategia; elige kernel serial o paralelo según el tamaño de la entrada."""
+    if results.shape[0] >= PARALLEL_THRESHOLD:
+        return _net_gains_parallel(strategy_ids, results, payouts, n_strategies)
+    return _net_gains_serial(strategy_ids, results, payouts, n_strategies)
+
+
+class EnsembleScorer:
+    """
+    Ensemble precompilado para un conjunto fijo de estrategias.
+
+    Guarda el índice estrategia→posición, los payouts y los pesos normalizados,
+    de modo que cada llamada en vivo sólo codifica los votos y hace una suma
+    ponderada. `score_arrays` acepta votos ya codificados como arrays.
+    """
+
+    def __init__(self, strategy_list: list, payout: float, weights=None, stats=None):
+        self.strategy_list = list(strategy_list)
+        self.index = {name: idx for idx, name in enumerate(self.strategy_list)}
+        self.n = len(self.strategy_list)
+        self.payouts = np.full(self.n, payout, dtype=np.float64)
+        self.weights = self._normalize(weights)
+        self.stats = stats
+        self._neutral = [1.0 / self.n] * self.n if self.n else []
+        if HAS_NUMBA:
+            # Compila los kernels ahora y no en la primera señal en vivo
+            _net_gains_serial(np.zeros(1, np.int64), np.zeros(1, np.int64), np.ones(1), 1)
+
+    def _normalize(self, weights):
+        if weights is None:
+            return None
+        w = np.array(weights, dtype=np.float64)
+        if w.size != self.n:
+            raise ValueError("Número de pesos distinto al de estrategias.")
+        return w / w.sum()
+
+    def encode(self, records) -> tuple:
+        """Codifica registros {strategy, direction, resultado} en (ids, resultados, votos)."""
+        ids, results, votes = [], [], []
+        index = self.index
+        for rec in records:
+            s = rec.get('strategy')
+            idx = index.get(s)
+            if idx is None:
+                logger.warning(f"Estrategia desconocida descartada: {s}")
+                continue
+            ids.append(idx)
+            results.append(1 if rec.get('resultado') == 'WIN' else 0)
+            votes.append(1.0 if rec.get('direction') == 'CALL' else -1.0)
+        return (np.array(ids, dtype=np.int64), np.array(results, dtype=np.int64),
+                np.array(votes, dtype=np.float64))
+
+    def score_arrays(self, strategy_ids: np.ndarray, results: np.ndarray, votes: np.ndarray, weights=None,
+                     stats=None, pair=None, hour=None) -> dict:
+        """
+        Voto ponderado sobre arrays ya codificados. Sin pesos fijos, las
+        ganancias netas salen de `stats` (StrategyStats, al nivel de `pair` y
+        `hour` si hay operaciones suficientes) cuando alguna de las estrategias
+        que votan tiene historial; las que aún no lo tienen entran con ganancia
+        neutra (0). Si ninguna lo tiene, se calculan sobre los propios votos.
+        """
+        inicio = time.perf_counter()
+        try:
+            if strategy_ids.size == 0:
+                logger.warning("No hay señales válidas; retornando ensemble neutro.")
+                return {'direction': None, 'weights': list(self._neutral)}
+            w = self._normalize(weights) if weights is not None else self.weights
+            stats = stats if stats is not None else self.stats
+            if w is None:
+                net_gains = None
+                if stats is not None:
+                    # Sólo importan las estrategias presentes en el lote, no todas las configuradas
+                    voters = [self.strategy_list[i] for i in np.unique(strategy_ids)]
+                    if any(stats.trades(s) for s in voters):
+                        net_gains = stats.contextual_gains(self.strategy_list, pair=pair, hour=hour, default=0.0)
+                if net_gains is None:
+                    net_gains = _compute_net_gains(strategy_ids, results, self.payouts, self.n)
+                exp_vals = np.exp(net_gains - np.max(net_gains))
+                w = exp_vals / exp_vals.sum()
+            vote = float(np.dot(votes, w[strategy_ids]))
+            return {'direction': 'CALL' if vote >= 0 else 'PUT', 'weights': w.tolist()}
+        finally:
+            ensemble_latency.observe(time.perf_counter() - inicio)
+
+    def score(self, records, weights=None, stats=None, pair=None, hour=None) -> dict:
+        """
+        Voto ponderado sobre una lista de registros (dict). Por defecto el
+        contexto de las estadísticas es el par de los registros y la hora UTC
+        actual (la de apertura de la operación resultante).
+        """
+        if pair is None and records:
+            pair = records[0].get('pair')
+        if hour is None:
+            hour = time.gmtime().tm_hour
+        return self.score_arrays(*self.encode(records), weights=weights, stats=stats, pair=pair, hour=hour)
+
+
+# Estadísticas en línea compartidas (ver `use_strategy_stats`)
+_strategy_stats = None
+
+
+def use_strategy_stats(stats):
+    """Fija el StrategyStats que consulta `generate_ensemble_signal` cuando no recibe pesos."""
+    global _strategy_stats
+    _strategy_stats = stats
+
+
+@lru_cache(maxsize=32)
+def _scorer(strategies: tuple, payout: float) -> EnsembleScorer:
+    return EnsembleScorer(list(strategies), payout)
+
+
 def generate_ensemble_signal(
     signals,
     strategy_list: list,
     payout: float,
-    weights=None
+    weights=None,
+    stats=None
 ) -> dict:
     """
     Genera una señal agregada. Admite dict, list de dict o DataFrame como entrada.
+    Reutiliza un EnsembleScorer cacheado por (estrategias, payout); sin `weights`
+    pondera con `stats` o, por defecto, con el StrategyStats registrado.
     """
     # Normalize input to list of dicts
     if isinstance(signals, dict):
         records = [signals]
-    elif isinstance(signals, list) and signals and isinstance(signals[0], dict):
+    elif isinstance(signals, list):
         records = signals
     else:
         try:
@@ -45,45 +185,5 @@ def generate_ensemble_signal(
             logger.error(f"Input no soportado para generate_ensemble_signal: {type(signals)}")
             records = []
 
-    # Map strat names to indices
-    strat_to_idx = {name: idx for idx, name in enumerate(strategy_list)}
-    n = len(strategy_list)
-    # Build arrays
-    strategy_ids = []
-    results = []
-    directions = []
-    for rec in records:
-        s = rec.get('strategy')
-        if s not in strat_to_idx:
-            logger.warning(f"Estrategia desconocida descartada: {s}")
-            continue
-        strategy_ids.append(strat_to_idx[s])
-        results.append(1 if rec.get('resultado')=='WIN' else 0)
-        directions.append(1 if rec.get('direction')=='CALL' else -1)
-    strategy_ids = np.array(strategy_ids, dtype=np.int64)
-    results      = np.array(results,      dtype=np.int64)
-    vote_vals    = np.array(directions,   dtype=np.float64)
-    payouts      = np.full(n, payout,     dtype=np.float64)
-    # Si no hay señales válidas, devolvemos ensemble neutro
-    if strategy_ids.size == 0:
-        default_w = np.full(n, 1.0/n, dtype=np.float64)
-        logger.warning("No hay señales válidas; retornando ensemble neutro.")
-        return {'direction': None, 'weights': default_w.tolist()}
-
-    # Calcular o validar pesos
-    if weights is None:
-        net_gains = _compute_net_gains(strategy_ids, results, payouts, n)
-        max_gain = np.max(net_gains)
-        exp_vals = np.exp(net_gains - max_gain)
-        weights = exp_vals / exp_vals.sum()
-    else:
-        w = np.array(weights, dtype=np.float64)
-        if w.size != n:
-            raise ValueError("Número de pesos distinto al de estrategias.")
-        weights = w / w.sum()
-
-    # Votación ponderada
-    vote = float((vote_vals * weights[strategy_ids]).sum())
-
-    direction = 'CALL' if vote >= 0 else 'PUT'
-    return {'direction': direction, 'weights': weights.tolist()}
+    scorer = _scorer(tuple(strategy_list), float(payout))
+    return scorer.score(records, weights=weights, stats=stats if stats is not None else _strategy_stats)
@@ -11,6 +11,7 @@ import traceback
 from typing import Optional, Tuple, Dict, Any
 import pickle
 import os
+import threading
 from typing import List
 
 class AnimaTradingEnv(gym.Env):
@@ -100,11 +101,338 @@ class AnimaTradingEnv(gym.Env):
         self.ens_dir = 1.0 if dir_up else -1.0 if dir_down else 0.0
         self.ga_wt = float(np.mean(weights)) if weights else 0.0
 
+# Sondeo de la tabla hash: hashing de Fibonacci sobre 64 bits
+_FIB_HASH = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class StateEncoder:
+    """
+    Discretiza observaciones en un código entero de base mixta.
+
+    Cada dimensión se recorta a [-1, 1] y se lleva a un índice en [0, bins];
+    el código es sum(índice_i * multiplicador_i) con multiplicador_i =
+    prod(bins_j + 1 para j < i). Los bins y multiplicadores se resuelven una
+    sola vez al construir el codificador.
+    """
+
+    def __init__(self, state_bins, n_dims: int):
+        bins = np.array([10] * n_dims if state_bins is None else state_bins, dtype=np.int64).reshape(-1)
+        if bins.size == 1 and n_dims > 1:
+            bins = np.repeat(bins, n_dims)
+        if bins.size != n_dims or (bins <= 0).any():
+            raise ValueError(f"rl.state_bins debe tener {n_dims} enteros positivos")
+        radix = bins + 1
+        self.bins = bins
+        self.n_dims = n_dims
+        self.size = int(np.prod(radix.astype(object)))
+        if self.size > 2 ** 53:
+            raise ValueError("Espacio de estados demasiado grande para códigos exactos; reduce rl.state_bins")
+        self._radix = radix
+        self._mult = np.concatenate([[1], np.cumprod(radix)[:-1]]).astype(np.float64)
+        # (bins/2, bins, multiplicador) por dimensión como escalares Python: con 9
+        # dimensiones un bucle plano es más rápido que cualquier operación NumPy
+        self._params = tuple((float(b) / 2.0, float(b), int(m)) for b, m in zip(bins, self._mult))
+
+    def encode(self, state) -> int:
+        """Código del estado (equivale a recortar a [-1, 1] y aplicar floor((x + 1) * bins / 2))."""
+        values = state.tolist() if hasattr(state, 'tolist') else state
+        if len(values) != self.n_dims:
+            raise ValueError(f"Observación de {len(values)} dimensiones; se esperaban {self.n_dims}")
+        code = 0
+        for x, (half, upper, mult) in zip(values, self._params):
+            i = (x + 1.0) * half
+            if i <= 0.0:
+                continue
+            code += (int(i) if i < upper else int(upper)) * mult
+        return code
+
+    def encode_key(self, key) -> int:
+        """Código de una clave de índices discretos (formato de tabla v1/v2)."""
+        idx = np.asarray(key, dtype=np.int64)
+        if idx.shape != (self.n_dims,) or (idx < 0).any() or (idx > self.bins).any():
+            raise ValueError(f"Clave de estado incompatible: {key!r}")
+        return int(idx.astype(np.float64) @ self._mult)
+
+    def decode(self, code: int) -> Tuple[int, ...]:
+        out = []
+        for r in self._radix:
+            code, rem = divmod(int(code), int(r))
+            out.append(rem)
+        return tuple(out)
+
+
+class QTable:
+    """
+    Tabla Q respaldada por arrays: `codes` (int64, -1 = libre) y `values`
+    (float64, capacidad × acciones), con direccionamiento abierto y sondeo
+    lineal sobre el código de estado. Crece duplicando la capacidad cuando la
+    ocupación supera `max_load`. Los arrays pueden guardarse con `save` y
+    abrirse mapeados en memoria con `load(..., mmap_mode='r+')`.
+    """
+    EMPTY = -1
+
+    def __init__(self, n_actions: int, capacity: int = 1024, max_load: float = 0.5):
+        bits = max(4, int(capacity - 1).bit_length())
+        self.n_actions = n_actions
+        self.max_load = max_load
+        self._bits = bits
+        self.codes = np.full(1 << bits, self.EMPTY, dtype=np.int64)
+        self.values = np.zeros((1 << bits, n_actions), dtype=np.float64)
+        self.count = 0
+
+    def _home(self, code: int) -> int:
+        return ((code * _FIB_HASH) & _MASK64) >> (64 - self._bits)
+
+    def find(self, code: int) -> int:
+        """Posición del estado en los arrays, o -1 si no está."""
+        codes = self.codes
+        mask = len(codes) - 1
+        i = self._home(code)
+        while True:
+            c = codes[i]
+            if c == code:
+                return i
+            if c == self.EMPTY:
+                return -1
+            i = (i + 1) & mask
+
+    def get(self, code: int) -> Optional[np.ndarray]:
+        i = self.find(code)
+        return None if i < 0 else self.values[i]
+
+    def row(self, code: int) -> np.ndarray:
+        """Fila (vista escribible) del estado; la crea a cero si no existe."""
+        i = self.find(code)
+        if i >= 0:
+            return self.values[i]
+        if (self.count + 1) > self.max_load * len(self.codes):
+            self._grow()
+        return self.values[self._insert(code)]
+
+    def _insert(self, code: int) -> int:
+        codes = self.codes
+        mask = len(codes) - 1
+        i = self._home(code)
+        while codes[i] != self.EMPTY:
+            i = (i + 1) & mask
+        codes[i] = code
+        self.count += 1
+        return i
+
+    def _grow(self):
+        old_codes, old_values = self.codes, self.values
+        self._bits += 1
+        self.codes = np.full(1 << self._bits, self.EMPTY, dtype=np.int64)
+        self.values = np.zeros((1 << self._bits, self.n_actions), dtype=np.float64)
+        self.count = 0
+        for i in np.flatnonzero(old_codes != self.EMPTY):
+            self.values[self._insert(int(old_codes[i]))] = old_values[i]
+
+    def __contains__(self, code) -> bool:
+        return isinstance(code, (int, np.integer)) and self.find(int(code)) >= 0
+
+    def __getitem__(self, code) -> np.ndarray:
+        row = self.get(int(code))
+        if row is None:
+            raise KeyError(code)
+        return row
+
+    def __len__(self) -> int:
+        return self.count
+
+    def items(self):
+        for i in np.flatnonzero(self.codes != self.EMPTY):
+            yield int(self.codes[i]), self.values[i]
+
+    def save(self, prefix: str):
+        """Escribe `<prefix>.codes.npy` y `<prefix>.values.npy` (formato mapeable)."""
+        for name, arr in (('codes', self.codes), ('values', self.values)):
+            tmp = f"{prefix}.{name}.tmp.npy"
+            np.save(tmp, arr)
+            os.replace(tmp, f"{prefix}.{name}.npy")
+
+    @classmethod
+    def load(cls, prefix: str, mmap_mode: Optional[str] = None) -> 'QTable':
+        codes = np.load(f"{prefix}.codes.npy", mmap_mode=mmap_mode)
+        values = np.load(f"{prefix}.values.npy", mmap_mode=mmap_mode)
+        bits = len(codes).bit_length() - 1
+        if len(codes) != 1 << bits or values.shape[0] != len(codes):
+            raise ValueError("Arrays de la tabla Q inconsistentes")
+        table = cls(values.shape[1], capacity=16)
+        table._bits = bits
+        table.codes, table.values = codes, values
+        table.count = int(np.count_nonzero(np.asarray(codes) != cls.EMPTY))
+        return table
+
+
+JOURNAL_EPSILON = -2   # código reservado: registro de epsilon en el journal
+
+
+def _write_atomic_pickle(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class QTableStore:
+    """
+    Persistencia incremental de la tabla Q: snapshot + journal.
+
+    - Journal: cada fin de episodio se añaden sólo las filas modificadas
+      (código + valores) y el epsilon vigente a `<base>.<gen>.journal`. Un
+      registro truncado por una caída se ignora al cargar.
+    - Snapshot: cada `compact_every` registros se vuelcan los arrays completos
+      a `<base>.<gen+1>.codes/values.npy` en un hilo de fondo (sobre una copia)
+      y después se reemplaza de forma atómica el fichero de metadatos, que
+      apunta a la generación vigente. Las generaciones anteriores se borran.
+    - Carga: snapshot de la generación apuntada más los journals de esa
+      generación y posteriores, en orden.
+    """
+    VERSION = 4
+
+    def __init__(self, meta_file: str = 'rl_state.pkl', base: str = 'rl_qtable',
+                 compact_every: int = 5000, fsync: bool = False):
+        self.meta_file = meta_file
+        self.base = base
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.generation = 0
+        self.pending = 0          # registros en journal desde el último snapshot
+        self._meta_written = os.path.exists(meta_file)
+        self._compactor: Optional[threading.Thread] = None
+
+    def _prefix(self, gen: int) -> str:
+        return f"{self.base}.{gen:06d}"
+
+    def _journal(self, gen: int) -> str:
+        return f"{self._prefix(gen)}.journal"
+
+    @staticmethod
+    def _record_dtype(n_actions: int) -> np.dtype:
+        return np.dtype([('code', '<i8'), ('values', '<f8', (n_actions,))])
+
+    def _generations(self, suffix: str) -> List[int]:
+        folder = os.path.dirname(self.base) or '.'
+        name = os.path.basename(self.base) + '.'
+        gens = []
+        for f in os.listdir(folder):
+            if f.startswith(name) and f.endswith(suffix):
+                middle = f[len(name):-len(suffix)]
+                if middle.isdigit():
+                    gens.append(int(middle))
+        return sorted(gens)
+
+    def _write_meta(self, gen: int, snapshot: Optional[str], epsilon: float, state_bins: list):
+        _write_atomic_pickle(self.meta_file, {'version': self.VERSION, 'generation': gen, 'snapshot': snapshot,
+                                              'epsilon': epsilon, 'state_bins': state_bins})
+        self._meta_written = True
+
+    # ------------------------------------------------------------------
+    def load(self, meta: dict, n_actions: int, mmap_mode: Optional[str] = None) -> Tuple['QTable', float]:
+        """Reconstruye la tabla desde snapshot + journals. Devuelve (tabla, epsilon)."""
+        gen = meta['generation']
+        table = QTable.load(meta['snapshot'], mmap_mode=mmap_mode) if meta.get('snapshot') else QTable(n_actions)
+        epsilon = meta.get('epsilon')
+        dtype = self._record_dtype(n_actions)
+        journals = [g for g in self._generations('.journal') if g >= gen]
+        for g in journals:
+            with open(self._journal(g), 'rb') as f:
+                raw = f.read()
+            records = np.frombuffer(raw[:len(raw) - len(raw) % dtype.itemsize], dtype=dtype)
+            if len(raw) % dtype.itemsize:
+                logger.warning(f"Journal RL {self._journal(g)} con registro incompleto al final; se ignora")
+            self.pending += len(records)
+            codes = records['code']
+            # Sólo cuenta la última escritura de cada código
+            _, first_rev = np.unique(codes[::-1], return_index=True)
+            for i in (len(codes) - 1 - first_rev):
+                code = int(codes[i])
+                if code == JOURNAL_EPSILON:
+                    epsilon = float(records['values'][i][0])
+                else:
+                    table.row(code)[:] = records['values'][i]
+        self.generation = max([gen] + journals)
+        return table, epsilon
+
+    def append(self, table: 'QTable', codes, epsilon: float, state_bins: list):
+        """Añade al journal las filas de `codes` y el epsilon actual."""
+        if not self._meta_written:
+            self._write_meta(self.generation, None, epsilon, state_bins)
+        codes = [c for c in codes if c in table]
+        records = np.zeros(len(codes) + 1, dtype=self._record_dtype(table.n_actions))
+        for k, code in enumerate(codes):
+            records[k] = (code, table[code])
+        records[-1]['code'] = JOURNAL_EPSILON
+        records[-1]['values'][0] = epsilon
+        with open(self._journal(self.generation), 'ab') as f:
+            f.write(records.tobytes())
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending += len(records)
+
+    def compact(self, table: 'QTable', epsilon: float, state_bins: list, background: bool = True) -> bool:
+        """
+        Escribe un snapshot nuevo y descarta los journals anteriores. Los
+        registros posteriores van ya al journal de la nueva generación.
+        Devuelve False si ya hay una compactación en curso.
+        """
+        if self._compactor is not None and self._compactor.is_alive():
+            return False
+        snapshot = QTable(table.n_actions, capacity=16)
+        snapshot._bits, snapshot.count = table._bits, table.count
+        snapshot.codes, snapshot.values = np.array(table.codes), np.array(table.values)
+        old_gen, self.generation = self.generation, self.generation + 1
+        self.pending = 0
+        new_gen = self.generation
+
+        def _run():
+            try:
+                prefix = self._prefix(new_gen)
+                snapshot.save(prefix)
+                self._write_meta(new_gen, prefix, epsilon, state_bins)
+                for g in self._generations('.journal') + self._generations('.codes.npy'):
+                    if g <= old_gen:
+                        for path in (self._journal(g), f"{self._prefix(g)}.codes.npy",
+                                     f"{self._prefix(g)}.values.npy"):
+                            if os.path.exists(path):
+                                os.remove(path)
+                logger.info(f"Snapshot RL generación {new_gen} ({snapshot.count} estados)")
+            except Exception:
+                logger.exception("Error compactando estado RL")
+
+        if background:
+            self._compactor = threading.Thread(target=_run, daemon=True, name="rl-compactor")
+            self._compactor.start()
+        else:
+            _run()
+        return True
+
+    def wait(self, timeout: Optional[float] = None):
+        if self._compactor is not None:
+            self._compactor.join(timeout)
+
+
 class AnimaRLLightAgent:
     """
     Agente RL ligero (Q-learning) con epsilon-greedy.
     epsilon: probabilidad de exploración inicial.
+
+    Los estados se codifican con `StateEncoder` y los valores Q viven en una
+    `QTable` de arrays. La persistencia es incremental (`QTableStore`):
+    `rl_state.pkl` (v4) guarda los metadatos y apunta al snapshot vigente, y
+    sólo se añaden al journal las filas modificadas, al cerrar un episodio o
+    al alcanzar `rl.flush_every` filas o `rl.flush_interval` segundos. Los formatos
+    anteriores (v1 q_table.pkl + epsilon.npy, v2 dict de tuplas, v3 arrays) se
+    migran al cargar.
     """
+    STATE_FILE = 'rl_state.pkl'
+    TABLE_PREFIX = 'rl_qtable'
+
     def __init__(self, env: AnimaTradingEnv, lr=0.1, gamma=0.99,
                  epsilon=1.0, eps_decay=0.995, eps_min=0.1, seed: Optional[int] = None):
         self.env = env
@@ -113,97 +441,170 @@ class AnimaRLLightAgent:
         self.epsilon = epsilon
         self.eps_decay = eps_decay
         self.eps_min = eps_min
-        # Cargar estado RL versionado (v2) o migrar desde v1 si existen archivos antiguos
-        state_file = 'rl_state.pkl'
+        rl_cfg = env.config.get('rl', {}) if env.config else {}
+        # Bins resueltos una sola vez
+        self.encoder = StateEncoder(rl_cfg.get('state_bins'), env.observation_space.shape[0])
+        self.n_actions = int(env.action_space.n)
+        self.mmap_mode = rl_cfg.get('qtable_mmap')
+        self.store = QTableStore(self.STATE_FILE, self.TABLE_PREFIX,
+                                 compact_every=rl_cfg.get('compact_every', 5000),
+                                 fsync=rl_cfg.get('journal_fsync', False))
+        self._dirty = set()   # códigos modificados desde la última escritura al journal
+        # Umbrales de volcado al journal: filas pendientes o segundos desde el último
+        self.flush_every = max(1, rl_cfg.get('flush_every', 1))
+        self.flush_interval = rl_cfg.get('flush_interval', 60.0)
+        self._last_flush = time.monotonic()
+        self.q_table = self._load_state()
+        # RNG para reproducibilidad en exploración
+        self.rng = np.random.default_rng(seed)
+        self.rewards_window = deque(maxlen=10)
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def _load_state(self) -> QTable:
+        """Carga el estado RL v4, o migra desde v3/v2 (rl_state.pkl) o v1 (q_table.pkl + epsilon.npy)."""
+        state_file = self.STATE_FILE
         if os.path.exists(state_file):
             try:
                 with open(state_file, 'rb') as f:
                     data = pickle.load(f)
-                if data.get('version') == 2:
-                    self.q_table = data.get('q_table', {})
-                    self.epsilon = data.get('epsilon', self.epsilon)
-                    logger.info(f"Estado RL cargado de {state_file}")
+                version = data.get('version')
+                if version in (3, 4) and list(data.get('state_bins', [])) != self.encoder.bins.tolist():
+                    raise ValueError("rl.state_bins cambió desde que se guardó la tabla Q")
+                if version == 4:
+                    table, epsilon = self.store.load(data, self.n_actions, mmap_mode=self.mmap_mode)
+                    self.epsilon = epsilon if epsilon is not None else self.epsilon
+                    logger.info(f"Estado RL cargado de {state_file} ({len(table)} estados)")
+                    return table
+                v3_prefix = None
+                if version == 3:
+                    v3_prefix = data.get('table', self.TABLE_PREFIX)
+                    table = QTable.load(v3_prefix)
+                    migrated_from = 'v3'
+                elif version == 2:
+                    table = self._from_dict(data.get('q_table', {}))
+                    migrated_from = 'v2'
                 else:
                     raise ValueError("Versión RL no soportada")
+                self.epsilon = data.get('epsilon', self.epsilon)
+                self.save(table)
+                if v3_prefix is not None:
+                    # Con el snapshot v4 escrito, los arrays v3 quedan como copia de seguridad
+                    for name in ('codes', 'values'):
+                        path = f"{v3_prefix}.{name}.npy"
+                        if os.path.exists(path):
+                            os.replace(path, f"{path}.bak")
+                logger.info(f"Migración RL {migrated_from}->v4 completada, estado en {state_file}")
+                return table
             except Exception:
                 logger.exception(f"Error cargando estado RL desde {state_file}, reiniciando nuevo estado")
-                self.q_table = {}
-        else:
-            # migrar archivos v1: q_table.pkl y epsilon.npy
-            old_q_file = 'q_table.pkl'
-            old_eps_file = 'epsilon.npy'
-            if os.path.exists(old_q_file) or os.path.exists(old_eps_file):
-                # cargar viejo formato
-                try:
-                    q_old = {}
-                    if os.path.exists(old_q_file):
-                        with open(old_q_file, 'rb') as f:
-                            q_old = pickle.load(f)
-                    eps_old = self.epsilon
-                    if os.path.exists(old_eps_file):
-                        eps_old = float(np.load(old_eps_file))
-                    # escribir nuevo rl_state.pkl
-                    data = {'version': 2, 'q_table': q_old, 'epsilon': eps_old}
-                    with open(state_file, 'wb') as f:
-                        pickle.dump(data, f)
-                    # eliminar antiguos
-                    for p in (old_q_file, old_eps_file):
-                        if os.path.exists(p): os.remove(p)
-                    self.q_table = q_old
-                    self.epsilon = eps_old
-                    logger.info(f"Migración RL v1->v2 completada, estado en {state_file}")
-                except Exception:
-                    logger.exception("Error migrando estado RL de v1 a v2")
-                    self.q_table = {}
-            else:
-                self.q_table = {}
-        # RNG para reproducibilidad en exploración
-        self.rng = np.random.default_rng(seed)
-        self.rewards_window = deque(maxlen=10)
+                # Se empieza una generación nueva: los journals ilegibles quedan en disco pero no se reproducen
+                self.store.generation = max(self.store._generations('.journal') + [0]) + 1
+                self.store._meta_written = False
+                return QTable(self.n_actions)
+        # migrar archivos v1: q_table.pkl y epsilon.npy
+        old_q_file = 'q_table.pkl'
+        old_eps_file = 'epsilon.npy'
+        if not (os.path.exists(old_q_file) or os.path.exists(old_eps_file)):
+            return QTable(self.n_actions)
+        try:
+            q_old = {}
+            if os.path.exists(old_q_file):
+                with open(old_q_file, 'rb') as f:
+                    q_old = pickle.load(f)
+            if os.path.exists(old_eps_file):
+                self.epsilon = float(np.load(old_eps_file))
+            table = self._from_dict(q_old)
+            self.save(table)
+            # eliminar antiguos
+            for p in (old_q_file, old_eps_file):
+                if os.path.exists(p): os.remove(p)
+            logger.info(f"Migración RL v1->v4 completada, estado en {state_file}")
+            return table
+        except Exception:
+            logger.exception("Error migrando estado RL de v1")
+            return QTable(self.n_actions)
+
+    def _from_dict(self, q_dict: dict) -> QTable:
+        """Convierte una tabla Q v1/v2 (tupla de índices → array) a QTable; descarta claves incompatibles."""
+        table = QTable(self.n_actions, capacity=max(1024, 2 * len(q_dict)))
+        descartadas = 0
+        for key, values in q_dict.items():
+            values = np.asarray(values, dtype=np.float64).reshape(-1)
+            try:
+                code = self.encoder.encode_key(key)
+            except (ValueError, TypeError):
+                descartadas += 1
+                continue
+            if values.size != self.n_actions:
+                descartadas += 1
+                continue
+            table.row(code)[:] = values
+        if descartadas:
+            logger.warning(f"{descartadas} estados de la tabla Q antigua no encajan con la codificación actual")
+        return table
+
+    def save(self, table: QTable = None):
+        """Snapshot completo síncrono (migraciones y cierre)."""
+        table = table if table is not None else self.q_table
+        self.store.wait()
+        self.store.compact(table, self.epsilon, self.encoder.bins.tolist(), background=False)
+        self._dirty.clear()
+
+    def flush(self):
+        """Escribe en el journal las filas pendientes; compacta en segundo plano si toca."""
+        self._last_flush = time.monotonic()
+        if not self._dirty:
+            return
+        bins = self.encoder.bins.tolist()
+        self.store.append(self.q_table, self._dirty, self.epsilon, bins)
+        self._dirty.clear()
+        if self.store.pending >= self.store.compact_every:
+            self.store.compact(self.q_table, self.epsilon, bins)
+
+    def close(self):
+        """Vuelca lo pendiente y espera a la compactación en curso."""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error guardando estado RL al cerrar")
+        self.store.wait()
 
-    def _state_to_key(self, state: np.ndarray) -> Tuple[int, ...]:
-        # Discretizar cada dimensión del estado en bins configurables para reducir colisiones
-        # Leer número de bins desde config o usar 10 por dimensión
-        default_bins = [10] * len(state)
-        bins = np.array(self.env.config.get('rl', {}).get('state_bins', default_bins))
-        # Clip al rango [-1,1] para evitar outliers
-        clipped = np.clip(state, -1.0, 1.0)
-        # Transformar a [0, bins] índice entero
-        discretized = np.floor((clipped + 1.0) * bins / 2.0).astype(int)
-        # Asegurar rango válido [0, bins]
-        discretized = np.minimum(discretized, bins)
-        discretized = np.maximum(discretized, 0)
-        return tuple(discretized.tolist())
+    # ------------------------------------------------------------------
+    # Q-learning
+    # ------------------------------------------------------------------
+    def _state_to_key(self, state: np.ndarray) -> int:
+        """Código entero del estado discretizado (ver StateEncoder)."""
+        return self.encoder.encode(state)
 
     def select_action(self, state):
-        key = self._state_to_key(state)
-        if self.rng.random() < self.epsilon or key not in self.q_table:
+        row = self.q_table.get(self.encoder.encode(state))
+        if self.rng.random() < self.epsilon or row is None:
             # exploración aleatoria reproducible
             return self.env.action_space.sample()  # type: ignore[attr-defined]
-        return int(np.argmax(self.q_table[key]))
+        return int(np.argmax(row))
 
     def learn(self, state, action, reward, next_state, done):
-        key = self._state_to_key(state)
-        next_key = self._state_to_key(next_state)
-        self.q_table.setdefault(key, np.zeros(self.env.action_space.n))
-        self.q_table.setdefault(next_key, np.zeros(self.env.action_space.n))
-        q_current = self.q_table[key][action]
-        q_next = 0 if done else np.max(self.q_table[next_key])
+        code = self.encoder.encode(state)
+        next_max = self.q_table.row(self.encoder.encode(next_state)).max()
+        q_next = 0 if done else next_max
+        # La fila se pide después: insertar un estado puede hacer crecer (y reubicar) los arrays
+        row = self.q_table.row(code)
         target = reward + self.gamma * q_next
-        self.q_table[key][action] += self.lr * (target - q_current)
+        row[action] += self.lr * (target - row[action])
+        self._dirty.add(code)
         self.rewards_window.append(reward)
         if done:
             # actualizar epsilon
             self.epsilon = max(self.eps_min, self.epsilon * self.eps_decay)
-            # persistir estado RL v2
+        # persistir sólo las filas modificadas: al cerrar episodio o al superar un umbral
+        if (done or len(self._dirty) >= self.flush_every
+                or (self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval)):
             try:
-                state_file = 'rl_state.pkl'
-                data = {'version': 2, 'q_table': self.q_table, 'epsilon': self.epsilon}
-                with open(state_file, 'wb') as f:
-                    pickle.dump(data, f)
-                logger.info(f"Estado RL guardado en {state_file}")
+                self.flush()
             except Exception:
-                logger.exception("Error guardando estado RL v2")
+                logger.exception("Error guardando estado RL")
 
     @property
     def recent_reward_avg(self):
@@ -0,0 +1,267 @@
+# anima_strategies/batch.py
+"""
+Evaluación vectorizada de varias estrategias sobre una misma serie de velas.
+
+Las primitivas compartidas (color, cuerpo, mechas, rango y conteos acumulados)
+se calculan una sola vez como arrays NumPy y cada estrategia se expresa como un
+kernel que decide la dirección para un conjunto de índices de "última vela"
+(`ends`). Con `ends=[n-1]` se obtiene la señal en vivo; con `ends=arange(n)`
+la columna completa de señales históricas.
+
+Los resultados son idénticos a los de `generate_signal` de cada módulo; las
+estrategias sin kernel (p. ej. `tres_vizinhos`, que consulta otros pares)
+se evalúan con su módulo original.
+"""
+import importlib
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from signal_model import Signal
+
+logger = logging.getLogger(__name__)
+
+CALL, PUT, NONE = 1, -1, 0
+_DIRECTIONS = {CALL: 'CALL', PUT: 'PUT'}
+
+
+class CandlePrimitives:
+    """Primitivas de vela calculadas una vez y compartidas por todos los kernels."""
+
+    def __init__(self, open_, high, low, close):
+        self.open = np.asarray(open_, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.n = self.close.shape[0]
+        self.bull = self.close > self.open
+        self.bear = self.close < self.open
+        self.body = np.abs(self.close - self.open)
+        self.range = self.high - self.low
+        self.lower_wick = np.minimum(self.open, self.close) - self.low
+        self.upper_wick = self.high - np.maximum(self.open, self.close)
+        # Conteos acumulados con un cero inicial: cum[e+1] - cum[e+1-w] = velas en (e-w, e]
+        self.bull_cum = np.concatenate(([0], np.cumsum(self.bull, dtype=np.int64)))
+        self.bear_cum = np.concatenate(([0], np.cumsum(self.bear, dtype=np.int64)))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'CandlePrimitives':
+        return cls(df['open'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy())
+
+    def counts(self, ends: np.ndarray, window: int):
+        """Velas alcistas/bajistas en la ventana que termina en cada `end` (requiere end+1 >= window)."""
+        hi = ends + 1
+        lo = np.maximum(hi - window, 0)
+        return self.bull_cum[hi] - self.bull_cum[lo], self.bear_cum[hi] - self.bear_cum[lo]
+
+
+def _select(n: int, *rules) -> np.ndarray:
+    """Aplica reglas (máscara, dirección) en orden de prioridad, como una cadena if/elif."""
+    out = np.zeros(n, dtype=np.int8)
+    pending = np.ones(n, dtype=bool)
+    for mask, direction in rules:
+        hit = pending & mask
+        out[hit] = direction
+        pending &= ~mask
+    return out
+
+
+# ----------------------------------------------------------------------
+# Kernels: (primitivas, ends, params) -> array int8 de direcciones
+# ----------------------------------------------------------------------
+def _majority(default_window: int, contrarian: bool):
+    def kernel(p: CandlePrimitives, ends: np.ndarray, params: dict) -> np.ndarray:
+        window = int(params.get('window', default_window))
+        bulls, bears = p.counts(ends, window)
+        valid = ends + 1 >= window
+        up, down = (PUT, CALL) if contrarian else (CALL, PUT)
+        return _select(len(ends), (valid & (bulls > bears), up), (valid & (bears > bulls), down))
+    return kernel
+
+
+def _threshold(default_window: int, contrarian: bool):
+    def kernel(p: CandlePrimitives, ends: np.ndarray, params: dict) -> np.ndarray:
+        window = int(params.get('window', default_window))
+        threshold = int(params.get('threshold', window // 2 + 1))
+        bulls, bears = p.counts(ends, window)
+        valid = ends + 1 >= window
+        up, down = (PUT, CALL) if contrarian else (CALL, PUT)
+        return _select(len(ends), (valid & (bulls >= threshold), up), (valid & (bears >= threshold), down))
+    return kernel
+
+
+def _flip(default_window: int):
+    def kernel(p: CandlePrimitives, ends: np.ndarray, params: dict) -> np.ndarray:
+        window = int(params.get('window', default_window))
+        bulls, bears = p.counts(ends, window)
+        valid = ends + 1 >= window
+        return _select(len(ends), (valid & (bulls == window), PUT), (valid & (bears == window), CALL))
+    return kernel
+
+
+def _padrao_impar(p, ends, params):
+    window = int(params.get('window', 5))
+    bulls, bears = p.counts(ends, window)
+    valid = ends + 1 >= window
+    return _select(len(ends), (valid & (bulls % 2 != 0), PUT), (valid & (bears % 2 != 0), CALL))
+
+
+def _padrao_23(p, ends, params):
+    window = int(params.get('window', 5))
+    out = np.zeros(len(ends), dtype=np.int8)
+    if window != 5 or p.n < window:
+        return out  # el patrón fijo sólo puede coincidir con ventanas de 5 velas
+    valid = ends + 1 >= window
+    e = np.where(valid, ends, window - 1)
+    b = [p.bull[e - k] for k in (4, 3, 2, 1, 0)]
+    put = b[0] & b[1] & ~b[2] & ~b[3] & ~b[4]
+    call = ~b[0] & ~b[1] & b[2] & b[3] & b[4]
+    return _select(len(ends), (valid & put, PUT), (valid & call, CALL))
+
+
+def _turno_over(p, ends, params):
+    if p.n < 2:
+        return np.zeros(len(ends), dtype=np.int8)
+    valid = ends >= 1
+    e = np.where(valid, ends, 1)
+    prev_bull, curr_bull = p.bull[e - 1], p.bull[e]
+    return _select(len(ends), (valid & curr_bull & ~prev_bull, CALL), (valid & ~curr_bull & prev_bull, PUT))
+
+
+def _torres_gemeas(p, ends, params):
+    if p.n < 3:
+        return np.zeros(len(ends), dtype=np.int8)
+    valid = ends >= 2
+    e = np.where(valid, ends, 2)
+    twins = valid & (p.open[e - 2] == p.open[e - 1]) & (p.close[e - 2] == p.close[e - 1])
+    return _select(len(ends), (twins & p.bull[e - 1], CALL), (twins & p.bear[e - 1], PUT))
+
+
+def _tres_mosqueteiros(p, ends, params):
+    if p.n < 3:
+        return np.zeros(len(ends), dtype=np.int8)
+    valid = ends >= 2
+    c = np.where(valid, ends, 2)
+    b, a = c - 1, c - 2
+    o, cl = p.open, p.close
+    soldiers = (p.bull[a] & p.bull[b] & p.bull[c]
+                & (o[b] > o[a]) & (o[c] > o[b]) & (cl[b] > cl[a]) & (cl[c] > cl[b]))
+    crows = (p.bear[a] & p.bear[b] & p.bear[c]
+             & (o[b] < o[a]) & (o[c] < o[b]) & (cl[b] < cl[a]) & (cl[c] < cl[b]))
+    return _select(len(ends), (valid & soldiers, CALL), (valid & crows, PUT))
+
+
+def _gaba(p, ends, params):
+    body_th = params.get('body_threshold', 0.1)
+    wick_mul = params.get('wick_multiplier', 2)
+    body, rng = p.body[ends], p.range[ends]
+    nonzero = rng != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        is_doji = nonzero & (np.divide(body, rng, out=np.zeros_like(body), where=nonzero) <= body_th)
+    is_hammer = nonzero & (p.lower_wick[ends] >= wick_mul * body)
+    is_inverted = nonzero & (p.upper_wick[ends] >= wick_mul * body)
+    has_prev = ends >= 1
+    prev_bull = p.bull[np.where(has_prev, ends - 1, 0)]
+    return _select(
+        len(ends),
+        (is_doji & has_prev & prev_bull, PUT),
+        (is_doji & has_prev & ~prev_bull, CALL),
+        (is_doji, NONE),  # doji sin vela previa: sin señal
+        (is_hammer, CALL),
+        (is_inverted, PUT),
+    )
+
+
+def _reversao(p, ends, params):
+    if p.n < 2:
+        return np.zeros(len(ends), dtype=np.int8)
+    gap_th = params.get('gap_threshold', 0.001)
+    body_th = params.get('body_threshold', 0.8)
+    valid = ends >= 1
+    e = np.where(valid, ends, 1)
+    prev = e - 1
+    prev_close, curr_open = p.close[prev], p.open[e]
+    gap_up = curr_open > prev_close * (1 + gap_th)
+    gap_down = curr_open < prev_close * (1 - gap_th)
+    range_prev = p.range[prev]
+    strong = (range_prev > 0) & (p.body[prev] >= body_th * range_prev)
+    return _select(
+        len(ends),
+        (valid & gap_up, PUT),
+        (valid & gap_down, CALL),
+        (valid & strong & p.bull[prev], PUT),
+        (valid & strong, CALL),
+    )
+
+
+KERNELS: Dict[str, Callable[[CandlePrimitives, np.ndarray, dict], np.ndarray]] = {
+    'mhi1_maioria': _majority(3, contrarian=False),
+    'mhi1_minoria': _majority(3, contrarian=True),
+    'melhor_de_3': _majority(3, contrarian=False),
+    'mhi2_maioria': _threshold(5, contrarian=False),
+    'mhi2_minoria': _threshold(5, contrarian=True),
+    'mhi3_maioria': _threshold(8, contrarian=False),
+    'mhi3_minoria': _threshold(8, contrarian=True),
+    'milhao_maioria': _threshold(10, contrarian=False),
+    'milhao_minoria': _threshold(10, contrarian=True),
+    'five_flip': _flip(5),
+    'seven_flip': _flip(7),
+    'padrao_impar': _padrao_impar,
+    'padrao_23': _padrao_23,
+    'turno_over': _turno_over,
+    'torres_gemeas': _torres_gemeas,
+    'tres_mosqueteiros': _tres_mosqueteiros,
+    'gaba': _gaba,
+    'reversao': _reversao,
+}
+
+
+class BatchEvaluator:
+    """
+    Evalúa en una sola pasada todas las estrategias configuradas para un par.
+
+    Args:
+        estrategias: lista de dicts de config.yml con 'nombre' y 'params'.
+    """
+
+    def __init__(self, estrategias: List[dict]):
+        self.estrategias = [(e['nombre'], dict(e.get('params', {}))) for e in estrategias]
+        self.fallbacks: Dict[str, Callable] = {}
+        for nombre, _ in self.estrategias:
+            if nombre not in KERNELS:
+                modulo = importlib.import_module(f"anima_strategies.{nombre}")
+                self.fallbacks[nombre] = modulo.generate_signal
+
+    def directions(self, primitives: CandlePrimitives, ends: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """Direcciones (+1 CALL, -1 PUT, 0 sin señal) por estrategia con kernel, para cada `end`."""
+        if ends is None:
+            ends = np.array([primitives.n - 1], dtype=np.int64)
+        return {nombre: KERNELS[nombre](primitives, ends, params)
+                for nombre, params in self.estrategias if nombre in KERNELS}
+
+    def evaluate(self, df: pd.DataFrame, pair: Optional[str] = None) -> List[Signal]:
+        """Devuelve todas las señales de la última vela de `df`, con `strategy` = nombre configurado."""
+        if df is None or df.empty:
+            return []
+        primitives = CandlePrimitives.from_frame(df)
+        dirs = self.directions(primitives)
+        signals = []
+        for nombre, params in self.estrategias:
+            if nombre in dirs:
+                d = int(dirs[nombre][0])
+                if d != NONE:
+                    signals.append(Signal(pair=pair if pair is not None else params.get('pair', ''),
+                                          direction=_DIRECTIONS[d], strategy=nombre))
+                continue
+            try:
+                senal = self.fallbacks[nombre](df, params)
+            except ConnectionError:
+                raise
+            except Exception as e:
+                logger.error(f"[Batch] Error evaluando {nombre}: {e}")
+                continue
+            if senal is not None:
+                senal.strategy = nombre
+                signals.append(senal)
+        return signals
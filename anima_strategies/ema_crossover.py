@@ -30,7 +30,7 @@ def generate_signal(df: pd.DataFrame, params: dict) -> Signal | None:
     # Detectar cruce alcista en la última barra
     if ema_fast.iloc[-2] <= ema_slow.iloc[-2] and ema_fast.iloc[-1] > ema_slow.iloc[-1]:
         return Signal(
-            pair=params.get('pair', df.name),
+            pair=params.get('pair') or getattr(df, 'name', ''),
             direction='CALL',
             strategy='ema_crossover'
         )
@@ -38,7 +38,7 @@ def generate_signal(df: pd.DataFrame, params: dict) -> Signal | None:
     # Detectar cruce bajista en la última barra
     if ema_fast.iloc[-2] >= ema_slow.iloc[-2] and ema_fast.iloc[-1] < ema_slow.iloc[-1]:
         return Signal(
-            pair=params.get('pair', df.name),
+            pair=params.get('pair') or getattr(df, 'name', ''),
             direction='PUT',
             strategy='ema_crossover'
         )
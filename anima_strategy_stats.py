@@ -0,0 +1,252 @@
+# anima_strategy_stats.py
+"""
+Estadísticas de rendimiento por estrategia actualizadas en línea.
+
+Cada operación liquidada actualiza en O(1) los contadores de tres niveles:
+estrategia, (estrategia, par) y (estrategia, par, hora del día). Por nivel se
+mantienen totales, una ventana móvil de los últimos `window` resultados y una
+media exponencial con vida media `half_life` operaciones. El ensemble y el GA
+leen de aquí las ganancias netas sin reescanear el histórico, y el estado se
+persiste en snapshots JSON para sobrevivir a reinicios.
+
+El ensemble consulta el nivel más específico del contexto de la señal
+(par y hora) que acumule al menos `min_trades` operaciones, y si no, el
+inmediatamente más general (`contextual_gains`).
+"""
+import json
+import math
+import os
+import threading
+import logging
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 50
+DEFAULT_HALF_LIFE = 30.0
+DEFAULT_MIN_TRADES = 10
+DEFAULT_SNAPSHOT_PATH = 'data/strategy_stats.json'
+SNAPSHOT_VERSION = 1
+
+Key = Tuple[str, Optional[str], Optional[int]]
+
+
+class _Tally:
+    """Contadores de un nivel: totales, ventana móvil y media exponencial."""
+    __slots__ = ('wins', 'losses', 'net', 'ewm', 'recent', 'recent_net', 'recent_wins')
+
+    def __init__(self, window: int):
+        self.wins = 0
+        self.losses = 0
+        self.net = 0.0
+        self.ewm = 0.0
+        self.recent = deque(maxlen=window)   # (win, ganancia)
+        self.recent_net = 0.0
+        self.recent_wins = 0
+
+    def add(self, win: bool, gain: float, alpha: float):
+        if len(self.recent) == self.recent.maxlen:
+            old_win, old_gain = self.recent[0]
+            self.recent_net -= old_gain
+            self.recent_wins -= old_win
+        self.recent.append((int(win), gain))
+        self.recent_net += gain
+        self.recent_wins += int(win)
+        if win:
+            self.wins += 1
+        else:
+            self.losses += 1
+        self.net += gain
+        self.ewm += alpha * (gain - self.ewm)
+
+    @property
+    def trades(self) -> int:
+        return self.wins + self.losses
+
+    def to_dict(self) -> dict:
+        return {'wins': self.wins, 'losses': self.losses, 'net': self.net, 'ewm': self.ewm,
+                'recent': [list(r) for r in self.recent]}
+
+    @classmethod
+    def from_dict(cls, data: dict, window: int) -> '_Tally':
+        t = cls(window)
+        t.wins, t.losses = data['wins'], data['losses']
+        t.net, t.ewm = data['net'], data['ewm']
+        for win, gain in data.get('recent', [])[-window:]:
+            t.recent.append((int(win), float(gain)))
+            t.recent_net += gain
+            t.recent_wins += int(win)
+        return t
+
+
+class StrategyStats:
+    """
+    Almacén en memoria de estadísticas por estrategia/par/hora.
+
+    Args:
+        payout: ganancia relativa de una operación ganadora (pérdida = -payout,
+            igual que `_compute_net_gains` del ensemble).
+        window: tamaño de la ventana móvil.
+        half_life: vida media (en operaciones) de la media exponencial.
+        snapshot_path: fichero JSON de persistencia.
+        snapshot_every: actualizaciones entre snapshots automáticos (0 = sólo manual).
+        min_trades: operaciones mínimas para usar un nivel (par, hora) en lugar del general.
+    """
+
+    def __init__(self, payout: float = 0.8, window: int = DEFAULT_WINDOW, half_life: float = DEFAULT_HALF_LIFE,
+                 snapshot_path: str = DEFAULT_SNAPSHOT_PATH, snapshot_every: int = 20,
+                 min_trades: int = DEFAULT_MIN_TRADES):
+        self.payout = payout
+        self.min_trades = min_trades
+        self.window = window
+        self.half_life = half_life
+        self.alpha = 1.0 - math.exp(-math.log(2) / half_life)
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._tallies: Dict[Key, _Tally] = {}
+        self._updates = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Actualización
+    # ------------------------------------------------------------------
+    def update(self, strategy: str, result: str, pair: Optional[str] = None, hour: Optional[int] = None,
+               gain: Optional[float] = None):
+        """Registra el resultado ('WIN'/'LOSS') de una operación liquidada."""
+        win = result == 'WIN'
+        if gain is None:
+            gain = self.payout if win else -self.payout
+        keys = [(strategy, None, None)]
+        if pair is not None:
+            keys.append((strategy, pair, None))
+            if hour is not None:
+                keys.append((strategy, pair, int(hour)))
+        with self._lock:
+            for key in keys:
+                tally = self._tallies.get(key)
+                if tally is None:
+                    tally = self._tallies[key] = _Tally(self.window)
+                tally.add(win, gain, self.alpha)
+            self._updates += 1
+            snapshot_due = self.snapshot_every and self._updates % self.snapshot_every == 0
+        if snapshot_due:
+            self.save()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def net_gains(self, strategies: Iterable[str], pair: Optional[str] = None, hour: Optional[int] = None,
+                  kind: str = 'ewm') -> np.ndarray:
+        """
+        Ganancia neta por estrategia en el orden de `strategies`.
+        `kind`: 'total' (histórico), 'rolling' (ventana móvil) o 'ewm' (media exponencial).
+        """
+        with self._lock:
+            out = [self._gain(self._tallies.get((s, pair, hour)), kind) for s in strategies]
+        return np.array(out, dtype=np.float64)
+
+    def contextual_gains(self, strategies: Iterable[str], pair: Optional[str] = None,
+                         hour: Optional[int] = None, kind: str = 'ewm',
+                         default: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Como `net_gains`, pero cada estrategia toma el nivel más específico de
+        (par, hora) → par → global con al menos `min_trades` operaciones.
+        Una estrategia sin historial recibe `default` (ganancia a priori); con
+        `default=None` la llamada devuelve None en ese caso.
+        """
+        levels = [(None, None)]
+        if pair is not None:
+            levels.insert(0, (pair, None))
+            if hour is not None:
+                levels.insert(0, (pair, int(hour)))
+        out = []
+        with self._lock:
+            for s in strategies:
+                tally = None
+                for p, h in levels:
+                    tally = self._tallies.get((s, p, h))
+                    if tally is not None and (tally.trades >= self.min_trades or p is None):
+                        break
+                if tally is None:
+                    if default is None:
+                        return None
+                    out.append(float(default))
+                    continue
+                out.append(self._gain(tally, kind))
+        return np.array(out, dtype=np.float64)
+
+    @staticmethod
+    def _gain(tally: Optional[_Tally], kind: str) -> float:
+        if tally is None:
+            return 0.0
+        if kind == 'total':
+            return tally.net
+        if kind == 'rolling':
+            return tally.recent_net
+        return tally.ewm
+
+    def win_rate(self, strategy: str, pair: Optional[str] = None, hour: Optional[int] = None,
+                 rolling: bool = False) -> Optional[float]:
+        with self._lock:
+            tally = self._tallies.get((strategy, pair, hour))
+            if tally is None or tally.trades == 0:
+                return None
+            if rolling:
+                return tally.recent_wins / len(tally.recent)
+            return tally.wins / tally.trades
+
+    def trades(self, strategy: str, pair: Optional[str] = None, hour: Optional[int] = None) -> int:
+        with self._lock:
+            tally = self._tallies.get((strategy, pair, hour))
+            return tally.trades if tally else 0
+
+    def covers(self, strategies: Iterable[str]) -> bool:
+        """True si todas las `strategies` tienen operaciones registradas."""
+        with self._lock:
+            return all((s, None, None) in self._tallies for s in strategies)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for (s, p, h) in self._tallies if p is None)
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def save(self, path: Optional[str] = None):
+        """Escribe un snapshot atómico (fichero temporal + rename)."""
+        path = path or self.snapshot_path
+        with self._lock:
+            data = {
+                'version': SNAPSHOT_VERSION,
+                'payout': self.payout,
+                'half_life': self.half_life,
+                'tallies': [[s, p, h, t.to_dict()] for (s, p, h), t in self._tallies.items()],
+            }
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"[StrategyStats] Error guardando snapshot en {path}: {e}")
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_SNAPSHOT_PATH, **kwargs) -> 'StrategyStats':
+        """Carga un snapshot si existe; si no, devuelve un almacén vacío."""
+        stats = cls(snapshot_path=path, **kwargs)
+        if not os.path.exists(path):
+            return stats
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            for s, p, h, tally in data.get('tallies', []):
+                stats._tallies[(s, p, h)] = _Tally.from_dict(tally, stats.window)
+            logger.info(f"[StrategyStats] Snapshot cargado desde {path} ({len(stats)} estrategias)")
+        except Exception:
+            logger.exception(f"[StrategyStats] Snapshot inválido en {path}; se empieza vacío")
+            stats._tallies.clear()
+        return stats
@@ -1,10 +1,9 @@
 # File: anima_supervisor.py
 import logging
-import sqlite3
 from collections import deque
 from typing import Deque
 
-from anima_db import DBHandler
+from anima_db import DBHandler, get_connection
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +24,12 @@ class SupervisorMetaCognitivo:
         # Estado en memoria
         self.trades: Deque[str] = deque(maxlen=self.window_size)
         self.current_level_idx = 0
+        self.db_path = DBHandler().db_path
         # Carga estado persistido (si existe)
         self._load_state()
 
     def _db(self):
-        return sqlite3.connect(DBHandler().db_path)
+        return get_connection(self.db_path)
 
     def _init_table(self):
         with self._db() as conn:
@@ -2,13 +2,51 @@
 import time
 import logging
 import threading
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
 from libs.iqoptionapi_stable import IQ_Option
 
 from anima_utils import parse_timeframe
+from core.rate_limiter import RateGovernor, get_rate_governor
 
 logger = logging.getLogger(__name__)
 
+CANDLES_PAGE_SIZE = 1000   # velas máximas por llamada a get_candles
+MAX_PAGE_WORKERS = 4       # páginas descargadas en paralelo por rango
+PAGE_RETRIES = 3
+PAGE_RETRY_BACKOFF = 2     # segundos (multiplicado por el intento)
+
+
+class OHLCVPageError(Exception):
+    """Fallo definitivo de una página; `resume_since` es el primer timestamp no entregado."""
+
+    def __init__(self, symbol: str, resume_since: int, cause: Exception):
+        super().__init__(f"Descarga de {symbol} interrumpida en {resume_since}: {cause}")
+        self.symbol = symbol
+        self.resume_since = resume_since
+
+
+def _split_pages(since: int, end_ts: int, tf_seconds: int, page_size: int):
+    """
+    Divide [since, end_ts] en páginas contiguas (inicio, fin_exclusivo, velas)
+    de como mucho `page_size` velas cada una.
+    """
+    pages = []
+    page_span = tf_seconds * page_size
+    lo = since
+    while lo <= end_ts:
+        hi = min(lo + page_span, end_ts + 1)
+        pages.append((lo, hi, (hi - 1 - lo) // tf_seconds + 1))
+        lo = hi
+    return pages
+
+
+def _is_rate_limited(error) -> bool:
+    payload = error.args[0] if isinstance(error, Exception) and error.args else error
+    return isinstance(payload, dict) and payload.get("code") == "TooManyRequests" \
+        or "TooManyRequests" in str(error)
+
 # Decorador para asegurar conexión antes de ejecutar métodos sensibles
 def ensure_connection(method):
     def wrapper(self, *args, **kwargs):
@@ -36,16 +74,19 @@ class AnimaBroker:
                 time.sleep(0.2)
         raise ConnectionError("IQ Option no respondió dentro del tiempo límite.")
 
-    def __init__(self, iq: IQ_Option, demo: bool = True, stop_event: Optional[threading.Event] = None):
+    def __init__(self, iq: IQ_Option, demo: bool = True, stop_event: Optional[threading.Event] = None,
+                 governor: Optional[RateGovernor] = None):
         """
         Args:
             iq: Instancia autenticada de IQ_Option.
             demo: `True` para cuenta práctica, `False` para real.
             stop_event: Evento para detener operaciones largas (opcional).
+            governor: Gobernador de cuota (por defecto el compartido por el proceso).
         """
         self.Iq = iq
         self.demo = demo
         self.stop_event = stop_event or threading.Event()
+        self.governor = governor or get_rate_governor()
         # Lock para proteger reconexiones y evitar serializar todas las llamadas
         self._lock = threading.Lock()
 
@@ -60,12 +101,38 @@ class AnimaBroker:
         # Log de diagnóstico de cuenta
         logger.info(f"[DEBUG] Tipo de cuenta: {self.Iq.get_balance_mode()} | Balance actual: {self.Iq.get_balance()}")
 
+    def _call(self, endpoint: str, fn, *args):
+        """Ejecuta una llamada al API dentro de la cuota de `endpoint`.
+
+        Ante `TooManyRequests` no duerme ni se llama recursivamente: notifica al
+        gobernador (que pausa el bucket con back-off y jitter) y vuelve a la cola,
+        como mucho `governor.retries[endpoint]` veces; agotados los reintentos
+        relanza el error.
+        """
+        attempt = 0
+        while True:
+            self.governor.acquire(endpoint, stop_event=self.stop_event)
+            try:
+                result = fn(*args)
+            except Exception as e:
+                if _is_rate_limited(e):
+                    self.governor.rate_limited(endpoint)
+                    if attempt < self.governor.retries.get(endpoint, 0):
+                        attempt += 1
+                        continue
+                    logger.error(f"[Broker] TooManyRequests persistente en '{endpoint}' "
+                                 f"tras {attempt} reintentos; se abandona la llamada")
+                raise
+            self.governor.success(endpoint)
+            return result
+
     # ---------- Datos de mercado -------------------------------------------------
 
-    @ensure_connection
     def fetch_ohlcv(self, symbol: str, timeframe: str, since: int, until: Optional[int] = None) -> List[list]:
         """Obtiene datos OHLCV para un `symbol` y `timeframe` dentro del rango [`since`, `until`].
 
+        Descarga paginada (ver `iter_ohlcv`); el resultado se materializa en una lista.
+
         Args:
             symbol: Par de divisas, p. ej. "EURUSD".
             timeframe: Timeframe textual ("1m", "5m", etc.).
@@ -76,6 +143,23 @@ class AnimaBroker:
             Lista de velas en formato `[timestamp, open, high, low, close, volume]`.
             Devuelve lista vacía si no se reciben datos.
         """
+        velas = [vela for pagina in self.iter_ohlcv(symbol, timeframe, since, until) for vela in pagina]
+        if not velas:
+            logger.warning("Sin datos OHLCV para %s", symbol)
+        return velas
+
+    def iter_ohlcv(self, symbol: str, timeframe: str, since: int, until: Optional[int] = None,
+                   page_size: int = CANDLES_PAGE_SIZE, max_workers: int = MAX_PAGE_WORKERS) -> Iterator[List[list]]:
+        """Descarga [`since`, `until`] en páginas de `page_size` velas y las entrega en orden cronológico.
+
+        Hasta `max_workers` páginas se piden en paralelo; cada página se reintenta
+        por separado con back-off. Si una página agota sus reintentos se lanza
+        `OHLCVPageError` con `resume_since` apuntando a la primera vela no
+        entregada, de modo que el llamador puede reanudar sin repetir lo ya recibido.
+
+        Yields:
+            Listas de velas `[timestamp, open, high, low, close, volume]` por página.
+        """
         try:
             tf_seconds = parse_timeframe(timeframe)
         except Exception as e:
@@ -86,29 +170,51 @@ class AnimaBroker:
         if end_ts <= since:
             raise ValueError(f"'until' ({end_ts}) debe ser mayor que 'since' ({since})")
 
-        count = (end_ts - since) // tf_seconds + 1
-        if count <= 0:
+        pages = _split_pages(since, end_ts, tf_seconds, page_size)
+        if not pages:
             raise ValueError(
                 f"El rango de tiempo es demasiado corto para el timeframe '{timeframe}'")
 
-        try:
-            start_time = time.time()
-            candles = self.Iq.get_candles(symbol, tf_seconds, count, end_ts)
-            latency = time.time() - start_time
-            logger.info(f"Latencia de get_candles: {latency:.2f} segundos")
-        except Exception as e:
-            if isinstance(e, dict) and e.get("code") == "TooManyRequests":
-                logger.warning("Demasiadas solicitudes. Aplicando back-off de 2 minutos.")
-                time.sleep(120)
-                return self.fetch_ohlcv(symbol, timeframe, since, until)
-            logger.error(f"Error al obtener velas: {e}")
-            raise
+        inicio = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pages)))) as executor:
+            # Ventana deslizante: como mucho `max_workers` páginas en vuelo
+            pendientes = deque()
+            siguiente = 0
+            while siguiente < len(pages) or pendientes:
+                while siguiente < len(pages) and len(pendientes) < max_workers:
+                    page_since, page_hi, count = pages[siguiente]
+                    future = executor.submit(self._fetch_page, symbol, tf_seconds, count, page_hi - 1)
+                    pendientes.append((page_since, page_hi, future))
+                    siguiente += 1
+                page_since, page_hi, future = pendientes.popleft()
+                try:
+                    candles = future.result()
+                except Exception as e:
+                    for *_, f in pendientes:
+                        f.cancel()
+                    raise OHLCVPageError(symbol, page_since, e) from e
+                yield [[c['from'], c['open'], c['max'], c['min'], c['close'], c['volume']]
+                       for c in candles if page_since <= c['from'] < page_hi]
+        logger.info(f"Descarga de {symbol} {timeframe}: {len(pages)} páginas en {time.time() - inicio:.2f}s")
 
-        if not candles:
-            logger.warning("Sin datos OHLCV para %s", symbol)
-            return []
-
-        return [[c['from'], c['open'], c['max'], c['min'], c['close'], c['volume']] for c in candles]
+    @ensure_connection
+    def _fetch_page(self, symbol: str, tf_seconds: int, count: int, end_ts: int) -> list:
+        """Una llamada a `get_candles` con reintentos propios de la página (la cuota la gestiona `_call`)."""
+        for attempt in range(1, PAGE_RETRIES + 1):
+            try:
+                start_time = time.time()
+                candles = self._call('candles', self.Iq.get_candles, symbol, tf_seconds, count, end_ts)
+                logger.debug(f"Latencia de get_candles ({count} velas): {time.time() - start_time:.2f} segundos")
+                return candles or []
+            except InterruptedError:
+                raise
+            except Exception as e:
+                if attempt == PAGE_RETRIES:
+                    logger.error(f"Error al obtener velas: {e}")
+                    raise
+                logger.warning(f"Error en página de velas (intento {attempt}/{PAGE_RETRIES}): {e}")
+                if self.stop_event.wait(PAGE_RETRY_BACKOFF * attempt):
+                    raise
 
     @ensure_connection
     def comprar(self, par: str, direccion: str, monto: float, tiempo: int) -> tuple[bool, Optional[int]]:
@@ -135,7 +241,7 @@ class AnimaBroker:
         logger.debug(f"[DEBUG] Enviando a buy_digital_spot => par={par}, monto={monto}, direccion={direccion}, tiempo={tiempo}")
         logger.info(f"Enviando operación: {direccion.upper()} {par} | ${monto} | {tiempo}m")
         try:
-            result = self.Iq.buy_digital_spot(par, monto, direccion, tiempo)
+            result = self._call('orders', self.Iq.buy_digital_spot, par, monto, direccion, tiempo)
 
             if not isinstance(result, tuple):
                 last_error = getattr(self.Iq, 'get_digital_spot_error', lambda: 'Desconocido')()
@@ -160,7 +266,7 @@ class AnimaBroker:
         logger.info("Esperando resultado para ID: %s", ticket_id)
         start = time.time()
         while not self.stop_event.is_set():
-            res = self.Iq.check_win_digital_v2(ticket_id)
+            res = self._call('results', self.Iq.check_win_digital_v2, ticket_id)
 
             # 1️⃣  Aún sin respuesta
             if res is None:
@@ -193,6 +299,32 @@ class AnimaBroker:
         logger.warning("check_win detenido por evento de parada.")
         return None
 
+    def poll_results(self, ticket_ids) -> dict:
+        """Consulta una vez el estado de varios tickets sin esperar a su cierre.
+
+        La API digital no ofrece consulta por lotes ni suscripción a resultados,
+        así que el barrido hace una llamada por ticket dentro de la cuota de
+        'results'; un ticket con error se considera todavía abierto.
+
+        Returns:
+            {ticket_id: (cerrado, ganancia)}; ganancia es None mientras siga abierto.
+        """
+        resultados = {}
+        for ticket_id in ticket_ids:
+            try:
+                res = self._call('results', self.Iq.check_win_digital_v2, ticket_id)
+            except InterruptedError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error consultando resultado de {ticket_id}: {e}")
+                res = None
+            if res is None:
+                resultados[ticket_id] = (False, None)
+                continue
+            check, win = res
+            resultados[ticket_id] = (True, win) if check else (False, None)
+        return resultados
+
     # ---------- Gestión de conexión ---------------------------------------------
     def desconectar(self):
         try:
@@ -202,7 +334,7 @@ class AnimaBroker:
             logger.info("Conexión cerrada con IQ Option.")
 
     def get_balance(self) -> float:
-        return self.Iq.get_balance()
+        return self._call('balance', self.Iq.get_balance)
 
     def ping(self):
         _ = self.get_balance(); return True
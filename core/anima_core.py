@@ -2,22 +2,25 @@
 import threading
 import time
 import os
-import pandas as pd
 import numpy as np
 import logging
 from anima_config import cargar_config
 from anima_logger import setup_logger
 from engine.signal_bus import SignalBus
-from engine.worker_pool import StrategyWorker
+from engine.worker_pool import StrategyWorker, PairBatchWorker, CandleCloseDispatcher
+from engine.settlement import SettlementTracker, PendingTrade, classify_result
 from core.anima_broker import AnimaBroker, conectar_broker
+from core.weights_registry import WeightsRegistry, WeightsWatcher
 from anima_db import DBHandler
 from watchdog import BrokerWatchdog
 from anima_autoconsciencia import AutoconscienciaFinanciera
-from anima_ensemble import generate_ensemble_signal
+from anima_ensemble import generate_ensemble_signal, use_strategy_stats
+from anima_strategy_stats import StrategyStats
 from anima_rl_agent import AnimaTradingEnv, AnimaRLLightAgent
 from anima_supervisor import SupervisorMetaCognitivo
-from observability import signal_processing_time, error_counter, thread_heartbeat
+from observability import signal_processing_time, signal_batch_size, error_counter, thread_heartbeat
 import copy
+from datetime import datetime, timezone
 import queue
 
 logger = setup_logger("anima_core")
@@ -35,12 +38,25 @@ class AnimaCore:
         # Conexión al broker y keep-alive
         self.broker = conectar_broker(self.config["credenciales"], stop_event)
 
-        # Bus de señales y workers
-        self.bus = SignalBus()
+        # Bus de señales y workers (la prioridad por estrategia se fija al cargar los pesos)
+        bus_cfg = self.config.get("signal_bus", {})
+        self.bus = SignalBus(
+            maxsize=bus_cfg.get("maxsize", 1000),
+            default_ttl=bus_cfg.get("default_ttl", 60.0)
+        )
         self.workers = []
 
-        # Base de datos y autoconsciencia
+        # Base de datos (escritura diferida fuera del camino crítico) y autoconsciencia
         self.db = DBHandler()
+        db_writer_cfg = self.config.get("db_writer", {})
+        if db_writer_cfg.get("enabled", True):
+            self.db.enable_write_behind(
+                batch_size=db_writer_cfg.get("batch_size", 200),
+                flush_interval=db_writer_cfg.get("flush_interval", 0.5),
+                max_queue=db_writer_cfg.get("max_queue", 10000),
+                retries=db_writer_cfg.get("retries", 3),
+                retry_backoff=db_writer_cfg.get("retry_backoff", 0.1)
+            )
         self.autoconsciencia = AutoconscienciaFinanciera(self.config)
 
         # Watchdog externo con reconexión que actualiza la instancia de broker
@@ -59,27 +75,81 @@ class AnimaCore:
         self.keep_thread     = threading.Thread(target=self._keepalive_loop, daemon=True)
         self.keep_thread.start()
 
-        # Pesos optimizados
+        # Pesos optimizados: registro versionado (con recarga en caliente) o best_weights.npy heredado
+        self.best_weights = None
+        self.weights_version = None
+        weights_cfg = self.config.get("weights_registry", {})
+        self.weights_registry = WeightsRegistry(weights_cfg.get("path", "ga_results/registry"))
+        nombres = [e['nombre'] for e in self.estrategias]
+        try:
+            if self.weights_registry.latest() is not None:
+                self._aplicar_pesos(*self.weights_registry.load_compatible(nombres))
+        except (ValueError, OSError, KeyError) as e:
+            logger.warning(f"Pesos del registro no aplicables: {e}")
         path_pesos = "ga_results/best_weights.npy"
-        if os.path.exists(path_pesos):
+        if self.best_weights is None and os.path.exists(path_pesos):
             try:
-                self.best_weights = np.load(path_pesos)
+                self._aplicar_pesos(np.load(path_pesos), None)
                 logger.info("Pesos óptimos cargados desde best_weights.npy")
             except Exception:
                 self.best_weights = None
                 logger.warning("Error cargando pesos óptimos; usando lógica estándar.")
-        else:
-            self.best_weights = None
+        elif self.best_weights is None:
             logger.warning("No se encontraron pesos optimizados; usando lógica estándar.")
+        self.weights_watcher = WeightsWatcher(
+            self.weights_registry, nombres, self._aplicar_pesos, self.stop_event,
+            interval=weights_cfg.get("poll_interval", 30), current=self.weights_version
+        )
+        self.weights_watcher.start()
+
+        # Estadísticas en línea por estrategia: alimentadas por cada liquidación, leídas por el ensemble
+        stats_cfg = self.config.get("strategy_stats", {})
+        self.strategy_stats = StrategyStats.load(
+            stats_cfg.get("snapshot_path", "data/strategy_stats.json"),
+            payout=self.config.get("payout", 0.8),
+            window=stats_cfg.get("window", 50),
+            half_life=stats_cfg.get("half_life", 30),
+            snapshot_every=stats_cfg.get("snapshot_every", 20),
+            min_trades=stats_cfg.get("min_trades", 10)
+        )
+        use_strategy_stats(self.strategy_stats)
 
         # RL Setup
         initial_balance = self.broker.get_balance()
+        # Saldo cacheado: se refresca en el keep-alive, no en cada señal
+        self.balance = initial_balance
         self.rl_env = AnimaTradingEnv(self.config, initial_balance=initial_balance)
         self.rl_agent = AnimaRLLightAgent(self.rl_env)
         self.rl_threshold = self.config.get("rl", {}).get("performance_threshold", -0.2)
 
+        # Liquidación asíncrona: el hilo de decisión no espera al vencimiento de la opción
+        self._feedback_lock = threading.Lock()
+        settlement_cfg = self.config.get("settlement", {})
+        self.settlement = SettlementTracker(
+            broker_getter=lambda: self.broker,
+            on_settled=self._on_trade_settled,
+            stop_event=self.stop_event,
+            poll_interval=settlement_cfg.get("poll_interval", 1.0),
+            settle_grace=settlement_cfg.get("settle_grace", 0.5),
+            timeout=self.config.get("timeout", None)
+        )
+        self.settlement.start()
+
         # Watchdog adicional eliminado: se usa solo la instancia con reassign callback
 
+    def _aplicar_pesos(self, weights, manifest):
+        """
+        Sustituye los pesos activos. Cada asignación reemplaza la referencia
+        completa, así que el lote en curso termina con los pesos anteriores y el
+        siguiente usa los nuevos, sin pausar el procesamiento de señales.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        self.bus.priorities = {e['nombre']: float(w) for e, w in zip(self.estrategias, weights)}
+        self.best_weights = weights
+        self.weights_version = manifest['version'] if manifest else None
+        if manifest:
+            logger.info(f"Pesos activos: versión {manifest['version']} (fitness={manifest.get('fitness')})")
+
     def _keepalive_loop(self):
         interval = self.config.get("ping_interval", 10)
         while not self.stop_event.is_set():
@@ -87,6 +157,7 @@ class AnimaCore:
             thread_heartbeat.labels(thread='keepalive').set(time.time())
             try:
                 self.broker.ping()
+                self.balance = self.broker.get_balance()
             except Exception as e:
                 logger.warning(f"Ping fallido: {e}; reconectando broker...")
                 try:
@@ -97,17 +168,90 @@ class AnimaCore:
             time.sleep(interval)
 
     def start_workers(self):
+        # Reloj de cierre de velas: despierta a cada worker cuando cierra su timeframe
+        engine_cfg = self.config.get("engine", {})
+        self.dispatcher = None
+        if engine_cfg.get("event_driven", True):
+            self.dispatcher = CandleCloseDispatcher(
+                self.stop_event,
+                grace=engine_cfg.get("candle_close_grace", 1.0)
+            )
+        batch_eval = engine_cfg.get("batch_eval", False)
         for pair in self.pares:
+            cfgs = []
             for estrategia in self.estrategias:
                 cfg = copy.deepcopy(estrategia)
                 # Protege la inyección de 'pair'
                 params = cfg.get('params', {})
                 params['pair'] = pair
                 cfg['params'] = params
+                cfgs.append(cfg)
+            if batch_eval:
+                # Un worker por (par, timeframe) evalúa todas sus estrategias en una pasada
+                por_tf = {}
+                for cfg in cfgs:
+                    por_tf.setdefault(cfg.get('timeframe', '1m'), []).append(cfg)
+                for tf, grupo in por_tf.items():
+                    worker = PairBatchWorker(pair=pair, estrategias=grupo, bus=self.bus,
+                                             stop_event=self.stop_event, timeframe=tf)
+                    self._launch_worker(worker)
+                    logger.info(f"Worker batch lanzado: {len(grupo)} estrategias sobre {pair} {tf}")
+                continue
+            for cfg in cfgs:
                 worker = StrategyWorker(pair=pair, estrategia_cfg=cfg, bus=self.bus, stop_event=self.stop_event)
-                worker.start()
-                self.workers.append(worker)
+                self._launch_worker(worker)
                 logger.info(f"Worker lanzado: {cfg['nombre']} sobre {pair}")
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+
+    def _launch_worker(self, worker: StrategyWorker):
+        if self.dispatcher is not None:
+            self.dispatcher.register(worker)
+        worker.start()
+        self.workers.append(worker)
+
+    @staticmethod
+    def _normalizar_senal(senal) -> dict:
+        """Convierte una señal (Signal, namedtuple o dict) al registro que consume el ensemble."""
+        if isinstance(senal, dict):
+            sig = senal.copy()
+        elif hasattr(senal, "_asdict"):
+            sig = senal._asdict()
+        else:
+            sig = {k: getattr(senal, k) for k in ["timestamp","pair","strategy","direction","resultado","candle_ts"]
+                   if hasattr(senal, k)}
+
+        # Renombra campos si vienen en otro idioma
+        if "nombre" in sig and "strategy" not in sig:
+            sig["strategy"] = sig.pop("nombre")
+        if "estrategia" in sig and "strategy" not in sig:
+            sig["strategy"] = sig.pop("estrategia")
+
+        # Asegurar columna ‘resultado’
+        sig.setdefault("resultado", "WIN")
+        return sig
+
+    def _drenar_lote(self, primera) -> list:
+        """
+        Agrupa la señal recibida con las que lleguen durante la ventana de
+        coalescencia, por (par, vela). Devuelve los grupos en orden de llegada.
+        """
+        ventana = self.config.get("engine", {}).get("coalesce_window", 0.2)
+        grupos = {}
+        limite = time.monotonic() + ventana
+        senal = primera
+        while True:
+            sig = self._normalizar_senal(senal)
+            clave = (sig.get("pair"), sig.get("candle_ts", sig.get("timestamp")))
+            grupos.setdefault(clave, []).append(sig)
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                senal = self.bus.get(timeout=restante)
+            except queue.Empty:
+                break
+        return list(grupos.values())
 
     def ejecutar_nucleo_tiempo_real(self):
         step = 0
@@ -117,35 +261,27 @@ class AnimaCore:
             except queue.Empty:
                 continue
 
-            try:
-                # Medir tiempo de procesamiento de señal
-                with signal_processing_time.time():
-                    # — Normalizar señal a diccionario —
-                    if isinstance(senal, dict):
-                        sig = senal.copy()
-                    elif hasattr(senal, "_asdict"):
-                        sig = senal._asdict()
-                    else:
-                        sig = {k: getattr(senal, k) for k in ["timestamp","pair","strategy","direction","resultado"]
-                               if hasattr(senal, k)}
-
-                    # Renombra campos si vienen en otro idioma
-                    if "nombre" in sig and "strategy" not in sig:
-                        sig["strategy"] = sig.pop("nombre")
-                    if "estrategia" in sig and "strategy" not in sig:
-                        sig["strategy"] = sig.pop("estrategia")
-
-                    # Asegurar columna ‘resultado’
-                    sig.setdefault("resultado", "WIN")
-
-                    # Crear DataFrame con campos estandarizados
-                    df_s = pd.DataFrame([sig])
-                    ensemble_out = generate_ensemble_signal(
-                        df_s,
-                        strategy_list=[e['nombre'] for e in self.estrategias],
-                        payout=self.config.get('payout', 0.8),
-                        weights=self.best_weights
-                    )
+            for lote in self._drenar_lote(senal):
+                self._procesar_lote(lote, step)
+                step += 1
+
+    def _procesar_lote(self, lote: list, step: int):
+        """Evalúa el ensemble una sola vez con todos los votos de un (par, vela) y decide."""
+        try:
+            # Medir tiempo de procesamiento del lote de señales
+            with signal_processing_time.time():
+                signal_batch_size.observe(len(lote))
+                ensemble_out = generate_ensemble_signal(
+                    lote,
+                    strategy_list=[e['nombre'] for e in self.estrategias],
+                    payout=self.config.get('payout', 0.8),
+                    weights=self.best_weights
+                )
+                if ensemble_out['direction'] is None:
+                    # Sin dirección no se consulta al agente, pero el lote queda en la telemetría RL
+                    self._registrar_rl_metric(step, None, ensemble_out)
+                    return
+                with self._feedback_lock:
                     # Inyectar señal de ensemble en el entorno RL
                     self.rl_env.set_ensemble(
                         ensemble_out['direction'],
@@ -153,52 +289,104 @@ class AnimaCore:
                     )
                     state = self.rl_env.get_observation()
                     action = self.rl_agent.select_action(state)
-                    if self.rl_agent.recent_reward_avg < self.rl_threshold or action == 1:
-                        decision = {'direction': ensemble_out['direction'], 'strategy': ensemble_out['weights']}
-                    else:
-                        decision = {'direction': None, 'strategy': None}
-                    try:
-                        self.db.registrar_rl_metric(
-                            step=step,
-                            action=action,
-                            reward=0.0,
-                            balance=self.broker.get_balance(),
-                            ensemble_signal=ensemble_out['direction'],
-                            weights=ensemble_out['weights'],
-                            epsilon=self.rl_agent.epsilon
-                        )
-                    except Exception as e:
-                        error_counter.labels(component='db').inc()
-                        logger.error(f"Error registro RL métrica: {e}")
-                    if decision['direction']:
-                        datos = {
-                            'timestamp': sig.get('timestamp'),
-                            'pair':      sig.get('pair'),
-                            'direction': decision['direction'],
-                            'strategy':  sig.get('strategy')
-                        }
-                        self.ejecutar_operacion(datos)
-            except Exception:
-                # Contar cualquier error en procesamiento de señal
-                error_counter.labels(component='core').inc()
-                logger.exception("Error en ejecutar_nucleo_tiempo_real")
-            finally:
-                step += 1
+                if self.rl_agent.recent_reward_avg < self.rl_threshold or action == 1:
+                    decision = {'direction': ensemble_out['direction'], 'strategy': ensemble_out['weights']}
+                else:
+                    decision = {'direction': None, 'strategy': None}
+                self._registrar_rl_metric(step, action, ensemble_out)
+                if decision['direction'] and self.autoconsciencia.esta_suspendido():
+                    logger.warning("Autoconsciencia suspendida; señal descartada.")
+                elif decision['direction']:
+                    # Estrategias que votaron en la dirección elegida
+                    a_favor = [sig.get('strategy') for sig in lote if sig.get('direction') == decision['direction']]
+                    datos = {
+                        'timestamp':  lote[0].get('timestamp'),
+                        'pair':       lote[0].get('pair'),
+                        'direction':  decision['direction'],
+                        'strategy':   '+'.join(dict.fromkeys(a_favor)) or lote[0].get('strategy'),
+                        'strategies': a_favor,
+                        # Todos los votos del lote: cada estrategia se evalúa con su propia dirección
+                        'votes':      {sig.get('strategy'): sig.get('direction') for sig in lote},
+                        'rl_state':   state,
+                        'rl_action':  action
+                    }
+                    self.ejecutar_operacion(datos)
+        except Exception:
+            # Contar cualquier error en procesamiento de señal
+            error_counter.labels(component='core').inc()
+            logger.exception("Error en ejecutar_nucleo_tiempo_real")
+
+    def _registrar_rl_metric(self, step: int, action, ensemble_out: dict):
+        """Una métrica RL por lote evaluado (action=None si el ensemble no dio dirección)."""
+        try:
+            self.db.registrar_rl_metric(
+                step=step,
+                action=action,
+                reward=0.0,
+                balance=self.balance,
+                ensemble_signal=ensemble_out['direction'],
+                weights=ensemble_out['weights'],
+                epsilon=self.rl_agent.epsilon
+            )
+        except Exception as e:
+            error_counter.labels(component='db').inc()
+            logger.error(f"Error registro RL métrica: {e}")
 
     def ejecutar_operacion(self, datos: dict):
-        """Ejecuta una operación usando el broker y obtiene el resultado."""
+        """
+        Coloca una operación en el broker y delega su liquidación al
+        SettlementTracker. Devuelve el ticket sin esperar al resultado.
+        """
         par = datos.get('pair')
         direc = datos.get('direction')
         # Obtener monto de apuesta según nivel de martingala
-        monto = datos.get('monto', self.supervisor.get_current_monto())
+        with self._feedback_lock:
+            monto = datos.get('monto', self.supervisor.get_current_monto())
+            nivel = self.supervisor.current_level_idx
         tiempo = datos.get('duracion', self.config.get('duracion', self.duracion))
         ok, ticket = self.broker.comprar(par, direc, monto, tiempo)
         if not ok:
             logger.error(f"Fallo en broker.comprar para {par} {direc}")
             return None
-        resultado = self.broker.check_win(ticket, timeout=self.config.get('timeout', None))
-        logger.info(f"Resultado operación {par} {direc}: {resultado}")
-        return resultado
+        self.settlement.submit(PendingTrade(
+            ticket=ticket, pair=par, direction=direc, strategy=datos.get('strategy'),
+            monto=monto, duracion=tiempo, opened_at=time.time(),
+            context={'nivel': nivel, 'balance_before': self.balance, 'votes': datos.get('votes'),
+                     'rl_state': datos.get('rl_state'), 'rl_action': datos.get('rl_action')}
+        ))
+        logger.info(f"Operación {par} {direc} abierta (ticket={ticket}); liquidación en curso")
+        return ticket
+
+    def _on_trade_settled(self, trade: PendingTrade, profit):
+        """Realimenta supervisor, autoconsciencia, agente RL y BD con el resultado de una operación."""
+        resultado = classify_result(profit)
+        logger.info(f"Resultado operación {trade.pair} {trade.direction}: {resultado} ({profit})")
+        if resultado is None:
+            return
+        ctx = trade.context
+        with self._feedback_lock:
+            if isinstance(profit, (int, float)):
+                self.balance += profit
+            self.supervisor.register_trade(resultado)
+            self.autoconsciencia.evaluar_estado(resultado, self.balance)
+            self.rl_env.result_history.append(1 if resultado == "WIN" else 0)
+            hora = datetime.fromtimestamp(trade.opened_at, tz=timezone.utc).hour
+            # Dirección realizada: la operada si ganó, la contraria si perdió
+            realizada = trade.direction.upper()
+            if resultado != "WIN":
+                realizada = "PUT" if realizada == "CALL" else "CALL"
+            votos = ctx.get('votes') or {trade.strategy: trade.direction}
+            for estrategia, voto in votos.items():
+                acierto = "WIN" if str(voto).upper() == realizada else "LOSS"
+                self.strategy_stats.update(estrategia, acierto, pair=trade.pair, hour=hora)
+            if ctx.get('rl_state') is not None and ctx.get('rl_action') is not None:
+                reward = 1.0 if resultado == "WIN" else -1.0
+                self.rl_agent.learn(ctx['rl_state'], ctx['rl_action'], reward,
+                                    self.rl_env.get_observation(), False)
+        self.db.registrar_operacion(
+            pair=trade.pair, strategy=trade.strategy, result=resultado, monto=trade.monto,
+            nivel=ctx.get('nivel'), balance_before=ctx.get('balance_before'), balance_after=self.balance
+        )
 
     def run(self):
         """Inicia workers, hilo de señales y espera hasta shutdown."""
@@ -219,4 +407,10 @@ class AnimaCore:
             self.broker.desconectar()
         except:
             pass
+        self.settlement.close()
+        self.strategy_stats.save()
+        with self._feedback_lock:
+            self.rl_agent.close()
+        # Vaciar la telemetría pendiente antes de salir
+        self.db.close()
         logging.getLogger().info("AnimaCore detenido correctamente.")
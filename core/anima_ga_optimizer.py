@@ -1,91 +1,487 @@
 # anima_ga_optimizer.py
 """
 Optimización de pesos de ensemble mediante Algoritmo Genético.
+
+El histórico de operaciones se carga y codifica una sola vez por optimización
+en una matriz de ganancias (bucket temporal × estrategia); cada generación se
+evalúa completa con un único producto matricial población × matriz.
+
+Con `ga.islands > 1` varias poblaciones evolucionan en paralelo en procesos
+separados y cada `migration_interval` generaciones sus mejores individuos
+migran a la isla vecina (topología en anillo).
+
+Con `ga.walk_forward.folds > 0` el histórico se parte en segmentos temporales
+consecutivos y cada fold entrena sobre `train_segments` segmentos y se evalúa
+sobre el siguiente. El GA evoluciona sólo con las ventanas de entrenamiento;
+los segmentos de prueba no intervienen en el fitness y únicamente eligen entre
+los `finalists` mejores individuos al terminar y dan la métrica fuera de
+muestra. Las ganancias de cada fold se cachean como tensores
+(fold × bucket × estrategia) y toda la población se evalúa sobre todos los
+folds en una sola contracción.
+
+Cada ejecución persiste su estado en `ga_results/ga_state.npz` (poblaciones,
+historial de fitness y matriz de ganancias acumulada hasta la última
+operación): la siguiente arranca desde esa población y sólo codifica las
+operaciones nuevas, y se detiene antes si el mejor fitness deja de mejorar.
 """
+import json
+import logging
 import os
-import random
+import time
 import numpy as np
-from datetime import datetime
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
 from anima_config import cargar_config
 from anima_db import DBHandler
-from anima_ensemble import _compute_net_gains
+from anima_strategy_stats import StrategyStats
+from observability import ga_best_fitness, ga_run_seconds
+from core.weights_registry import WeightsRegistry
+
+# Número de buckets por granularidad temporal
+TIME_BUCKETS = {'none': 1, 'hour': 24, 'weekday': 7}
+
+RESULTS_DIR = 'ga_results'
+STATE_FILE = 'ga_state.npz'
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------
+# Núcleo evolutivo (funciones puras: se ejecutan también en los procesos de cada isla)
+# ----------------------------------------------------------------------
+def evaluate_population(population: np.ndarray, gains, risk_aversion: float = 0.0) -> np.ndarray:
+    """
+    Fitness de toda la población.
+
+    - gains (buckets × estrategias): ganancia por bucket = población @ gains.T;
+      fitness = suma de buckets - risk_aversion * desviación entre buckets.
+    - gains (folds × buckets × estrategias): ganancia por fold (entrenamiento
+      durante la evolución, prueba al elegir finalistas);
+      fitness = media de folds - risk_aversion * desviación entre folds.
+    """
+    if gains is None:
+        return np.full(len(population), -np.inf)
+    if gains.ndim == 3:
+        per_fold = np.einsum('ps,fbs->pf', population, gains)
+        fitness = per_fold.mean(axis=1)
+        if risk_aversion and per_fold.shape[1] > 1:
+            fitness -= risk_aversion * per_fold.std(axis=1)
+        return fitness
+    per_bucket = population @ gains.T
+    fitness = per_bucket.sum(axis=1)
+    if risk_aversion and per_bucket.shape[1] > 1:
+        fitness -= risk_aversion * per_bucket.std(axis=1)
+    return fitness
+
+
+def _mutate(population: np.ndarray, mutation_rate: float, rng) -> np.ndarray:
+    """Aplica mutaciones gaussianas a pesos y renormaliza."""
+    mask = rng.random(population.shape) < mutation_rate
+    population = np.abs(population + mask * rng.normal(0, 0.05, population.shape))
+    return population / population.sum(axis=1, keepdims=True)
+
+
+def _crossover(parents1: np.ndarray, parents2: np.ndarray, rng) -> np.ndarray:
+    """Combina pares de vectores de pesos en un punto de cruce aleatorio por hijo."""
+    n = parents1.shape[1]
+    points = rng.integers(1, n, size=(len(parents1), 1)) if n > 1 else np.ones((len(parents1), 1))
+    children = np.where(np.arange(n) < points, parents1, parents2)
+    return children / children.sum(axis=1, keepdims=True)
+
+
+def _breed(survivors: np.ndarray, size: int, mutation_rate: float, rng) -> np.ndarray:
+    """Produce `size` hijos a partir de pares distintos de supervivientes."""
+    i = rng.integers(0, len(survivors), size=size)
+    j = (i + rng.integers(1, len(survivors), size=size)) % len(survivors)
+    return _mutate(_crossover(survivors[i], survivors[j], rng), mutation_rate, rng)
+
+
+def converged(history: list, patience: int, tolerance: float = 0.0) -> bool:
+    """True si el mejor fitness no mejoró más de `tolerance` en las últimas `patience` generaciones."""
+    if not patience or len(history) <= patience:
+        return False
+    return history[-1] - history[-patience - 1] <= tolerance
+
+
+def evolve(population: np.ndarray, gains, generations: int, mutation_rate: float,
+           risk_aversion: float = 0.0, seed=None, patience: int = 0, tolerance: float = 0.0):
+    """
+    Evoluciona `population` durante `generations` generaciones como máximo
+    (antes si converge según `patience`/`tolerance`).
+
+    Devuelve (población ordenada de mejor a peor, mejor fitness por generación).
+    """
+    rng = np.random.default_rng(seed)
+    size = len(population)
+    n_survivors = max(2, size // 2)
+    history = []
+    for _ in range(generations):
+        fitnesses = evaluate_population(population, gains, risk_aversion)
+        # Selección de mejores individuos
+        idx_sorted = np.argsort(fitnesses)[::-1]
+        history.append(float(fitnesses[idx_sorted[0]]))
+        survivors = population[idx_sorted[:n_survivors]]
+        # Reproducción
+        population = np.vstack([survivors, _breed(survivors, size - n_survivors, mutation_rate, rng)])
+        if converged(history, patience, tolerance):
+            break
+    fitnesses = evaluate_population(population, gains, risk_aversion)
+    return population[np.argsort(fitnesses)[::-1]], history
+
+
+def migrate(islands: list, migration_size: int) -> list:
+    """
+    Migración en anillo: los `migration_size` mejores de la isla i sustituyen a
+    los peores de la isla i+1. Cada isla debe venir ordenada de mejor a peor.
+    """
+    if migration_size <= 0 or len(islands) < 2:
+        return islands
+    migrants = [isl[:migration_size].copy() for isl in islands]
+    out = []
+    for i, isl in enumerate(islands):
+        isl = isl.copy()
+        isl[-migration_size:] = migrants[i - 1]
+        out.append(isl)
+    return out
+
 
 class GAOptimizer:
-    def __init__(self, population_size=20, generations=10, mutation_rate=0.1):
-        self.config = cargar_config()
-        self.population_size = population_size
-        self.generations = generations
-        self.mutation_rate = mutation_rate
-    def __init__(self):
+    def __init__(self, population_size=None, generations=None, mutation_rate=None,
+                 stats: StrategyStats = None, db: DBHandler = None, executor: Executor = None):
         self.config = cargar_config()
         ga_cfg = self.config.get('ga', {})
         # Leer parámetros GA desde config.yml (o usar valores por defecto)
-        self.population_size = ga_cfg.get('population_size', 20)
-        self.generations     = ga_cfg.get('generations', 10)
-        self.mutation_rate   = ga_cfg.get('mutation_rate', 0.1)
+        self.population_size = population_size or ga_cfg.get('population_size', 20)
+        self.generations     = generations or ga_cfg.get('generations', 10)
+        self.mutation_rate   = mutation_rate if mutation_rate is not None else ga_cfg.get('mutation_rate', 0.1)
+        self.time_bucket     = ga_cfg.get('time_bucket', 'none')
+        self.risk_aversion   = ga_cfg.get('risk_aversion', 0.0)
+        # Modelo de islas
+        self.islands            = max(1, ga_cfg.get('islands', 1))
+        self.migration_interval = max(1, ga_cfg.get('migration_interval', 5))
+        self.migration_size     = ga_cfg.get('migration_size', 2)
+        self.workers            = ga_cfg.get('workers') or os.cpu_count()
+        # Walk-forward (0 folds = fitness sobre todo el histórico)
+        wf_cfg = ga_cfg.get('walk_forward', {}) or {}
+        self.folds          = wf_cfg.get('folds', 0)
+        self.train_segments = max(1, wf_cfg.get('train_segments', 3))
+        self.finalists      = max(1, wf_cfg.get('finalists', 3))
+        # Arranque en caliente y parada temprana (patience 0 = desactivada)
+        self.warm_start = ga_cfg.get('warm_start', True)
+        es_cfg = ga_cfg.get('early_stopping', {}) or {}
+        self.patience  = es_cfg.get('patience', 0)
+        self.tolerance = es_cfg.get('tolerance', 1e-6)
+        self.results_dir = RESULTS_DIR
+        self.registry = WeightsRegistry(self.config.get('weights_registry', {}).get('path', 'ga_results/registry'))
+        if self.time_bucket not in TIME_BUCKETS:
+            raise ValueError(f"ga.time_bucket desconocido: {self.time_bucket}")
         self.strategies = [e['nombre'] for e in self.config.get('estrategias', [])]
         self.payout = self.config.get('payout', 0.8)
-        self.db = DBHandler()
-
-    def _generate_individual(self):
-        """Genera un vector de pesos normalizado."""
-        weights = np.random.dirichlet(np.ones(len(self.strategies)))
-        return weights
-
-    def _mutate(self, individual):
-        """Aplica mutaciones gaussianas a pesos y renormaliza."""
-        for i in range(len(individual)):
-            if random.random() < self.mutation_rate:
-                individual[i] += np.random.normal(0, 0.05)
-        individual = np.abs(individual)
-        return individual / individual.sum()
-
-    def _crossover(self, parent1, parent2):
-        """Combina dos vectores de pesos en un punto de cruce."""
-        point = random.randint(1, len(parent1)-1)
-        child = np.concatenate([parent1[:point], parent2[point:]])
-        return child / child.sum()
+        self.db = db or DBHandler()
+        # Estadísticas en línea del núcleo: respaldo cuando aún no hay operaciones en la BD
+        if stats is None:
+            stats_path = self.config.get('strategy_stats', {}).get('snapshot_path', 'data/strategy_stats.json')
+            stats = StrategyStats.load(stats_path, payout=self.payout)
+        self.stats = stats
+        # Ejecutor externo opcional (p. ej. `client.get_executor()` del cluster Dask)
+        self.executor = executor
+        self.rng = np.random.default_rng()
+        self.gains = None   # ganancias de la optimización en curso (ver evaluate_population)
+        self.history = []   # mejor fitness por generación de la última optimización
+        self.fold_data = None   # tensores y límites de los folds walk-forward en curso
 
-    def _evaluate(self, weights):
+    # ------------------------------------------------------------------
+    # Histórico
+    # ------------------------------------------------------------------
+    def _bucket_of(self, timestamps) -> np.ndarray:
+        if self.time_bucket == 'hour':
+            return timestamps.dt.hour.to_numpy(dtype=np.int64)
+        if self.time_bucket == 'weekday':
+            return timestamps.dt.weekday.to_numpy(dtype=np.int64)
+        return np.zeros(len(timestamps), dtype=np.int64)
+
+    def load_history(self, after_id: int = None):
         """
-        Evalúa la rentabilidad esperada de un vector de pesos sobre señales históricas.
-        Fitness = dot(weights, net_gains) donde net_gains se calcula de signals.
+        Carga y codifica el histórico de operaciones en arrays: id de estrategia,
+        ganancia con signo, bucket temporal, timestamp Unix (s) y el id de la
+        última operación leída. Con `after_id` sólo las posteriores. None si está vacío.
+
+        Fuente: tabla operations (la de signals no guarda el resultado). Una
+        operación de consenso ('A+B') acredita su resultado a cada estrategia.
         """
-        df = self.db.load_signals()
+        df = self.db.load_operations(after_id=after_id)
+        last_id = int(df['id'].max()) if not df.empty else None
+        df = df[df['result'].isin(['WIN', 'LOSS'])] if not df.empty else df
         if df.empty:
-            return -np.inf
-        # Mapear estrategias a índices para Numba
-        strat_to_idx = {s: i for i, s in enumerate(self.strategies)}
-        ids = np.array([strat_to_idx[s] for s in df['strategy']], dtype=np.int64)
-        results = np.array([1 if r == 'WIN' else 0 for r in df['resultado']], dtype=np.int64)
-        payouts = np.full(len(self.strategies), self.payout, dtype=np.float64)
-        net_gains = _compute_net_gains(ids, results, payouts, len(self.strategies))
-        fitness = np.dot(weights, net_gains)
-        return fitness
+            return None
+        df = df.assign(strategy=df['strategy'].str.split('+')).explode('strategy')
+        ids = df['strategy'].map({s: i for i, s in enumerate(self.strategies)})
+        known = ids.notna().to_numpy()
+        if not known.any():
+            return None
+        return {
+            'ids': ids.to_numpy()[known].astype(np.int64),
+            'signed': np.where(df['result'].to_numpy()[known] == 'WIN', self.payout, -self.payout),
+            'buckets': self._bucket_of(df['timestamp'])[known],
+            'ts': df['timestamp'].to_numpy(dtype='datetime64[s]')[known].astype(np.int64),
+            'last_id': last_id,
+        }
+
+    def load_gains(self, history=None):
+        """
+        Matriz de ganancias netas (buckets × estrategias) sobre todo el
+        histórico, o None si no hay historial. Sin operaciones se usa el total
+        de StrategyStats como bucket único.
+        """
+        history = history if history is not None else self.load_history()
+        if history is not None:
+            return self._encode_gains(history)
+        if self.stats is not None and len(self.stats):
+            return self.stats.net_gains(self.strategies, kind='total')[np.newaxis, :]
+        return None
+
+    def _encode_gains(self, history) -> np.ndarray:
+        n, n_buckets = len(self.strategies), TIME_BUCKETS[self.time_bucket]
+        flat = np.bincount(history['buckets'] * n + history['ids'], weights=history['signed'],
+                           minlength=n_buckets * n)
+        return flat.reshape(n_buckets, n)
+
+    def build_folds(self, history):
+        """
+        Parte el histórico en `folds + train_segments` segmentos de igual
+        duración y codifica una sola vez las ganancias por segmento. El fold k
+        entrena sobre los segmentos [k, k + train_segments) y prueba sobre el
+        siguiente. Devuelve un dict con los tensores 'train' y 'test'
+        (folds × buckets × estrategias), el número de operaciones y los
+        límites temporales de cada fold; None si no hay historial.
+        """
+        if history is None or self.folds <= 0:
+            return None
+        n, n_buckets = len(self.strategies), TIME_BUCKETS[self.time_bucket]
+        n_seg = self.folds + self.train_segments
+        t0, t1 = int(history['ts'].min()), int(history['ts'].max()) + 1
+        edges = np.linspace(t0, t1, n_seg + 1)
+        seg = np.clip(np.searchsorted(edges, history['ts'], side='right') - 1, 0, n_seg - 1)
+        flat = np.bincount((seg * n_buckets + history['buckets']) * n + history['ids'],
+                           weights=history['signed'], minlength=n_seg * n_buckets * n)
+        per_seg = flat.reshape(n_seg, n_buckets, n)
+        trades = np.bincount(seg, minlength=n_seg)
+        # Sumas acumuladas: la ventana de entrenamiento de cada fold en O(1)
+        cum = np.concatenate([np.zeros((1, n_buckets, n)), per_seg.cumsum(axis=0)])
+        cum_trades = np.concatenate([[0], trades.cumsum()])
+        k = np.arange(self.folds)
+        T = self.train_segments
+        return {
+            'train': cum[k + T] - cum[k],
+            'test': per_seg[k + T],
+            'train_trades': (cum_trades[k + T] - cum_trades[k]).tolist(),
+            'test_trades': trades[k + T].tolist(),
+            'bounds': [(edges[i], edges[i + T], edges[i + T + 1]) for i in k],
+        }
+
+    def fold_metrics(self, weights) -> dict:
+        """Métricas por fold (dentro y fuera de muestra) de un vector de pesos."""
+        folds = self.fold_data
+        w = np.asarray(weights, dtype=np.float64)
+        train = np.einsum('s,fbs->f', w, folds['train'])
+        test = np.einsum('s,fbs->f', w, folds['test'])
+        iso = lambda t: datetime.fromtimestamp(float(t), tz=timezone.utc).isoformat()
+        return {
+            'folds': [
+                {'fold': i, 'train_start': iso(a), 'train_end': iso(b), 'test_start': iso(b), 'test_end': iso(c),
+                 'train_trades': folds['train_trades'][i], 'test_trades': folds['test_trades'][i],
+                 'train_gain': float(train[i]), 'test_gain': float(test[i])}
+                for i, (a, b, c) in enumerate(folds['bounds'])
+            ],
+            'oos_mean': float(test.mean()),
+            'oos_std': float(test.std()),
+            'is_mean': float(train.mean()),
+            'weights': w.tolist(),
+        }
+
+    # ------------------------------------------------------------------
+    # Evaluación
+    # ------------------------------------------------------------------
+    def _init_population(self, size: int) -> np.ndarray:
+        """Genera `size` vectores de pesos normalizados (filas)."""
+        return self.rng.dirichlet(np.ones(len(self.strategies)), size=size)
+
+    def _evaluate_population(self, population: np.ndarray) -> np.ndarray:
+        return evaluate_population(population, self.gains, self.risk_aversion)
+
+    def _evaluate(self, weights):
+        """Evalúa la rentabilidad esperada de un vector de pesos sobre el historial."""
+        return float(self._evaluate_population(np.asarray(weights, dtype=np.float64)[np.newaxis, :])[0])
+
+    # ------------------------------------------------------------------
+    # Estado persistente (arranque en caliente)
+    # ------------------------------------------------------------------
+    def _signature(self) -> str:
+        return json.dumps({'strategies': self.strategies, 'time_bucket': self.time_bucket, 'payout': self.payout})
+
+    def load_state(self):
+        """Estado de la ejecución anterior, o None si no existe o no es compatible."""
+        path = os.path.join(self.results_dir, STATE_FILE)
+        if not self.warm_start or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                state = {k: data[k] for k in data.files}
+        except Exception as e:
+            logger.warning(f"[GA] Estado previo ilegible ({e}); se arranca en frío")
+            return None
+        if str(state.get('signature')) != self._signature():
+            logger.warning("[GA] Estrategias o configuración cambiaron; se arranca en frío")
+            return None
+        return state
+
+    def save_state(self, populations: list, gains_total, last_id):
+        """Persiste poblaciones, historial de fitness y la matriz de ganancias acumulada."""
+        state = {'signature': np.array(self._signature()), 'populations': np.stack(populations),
+                 'history': np.array(self.history, dtype=np.float64)}
+        if gains_total is not None and last_id is not None:
+            state['gains'] = gains_total
+            state['last_id'] = np.array(last_id)
+        path = os.path.join(self.results_dir, STATE_FILE)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **state)
+        os.replace(tmp, path)
+
+    def _prepare_gains(self, state):
+        """
+        Matriz de ganancias para esta ejecución. Sin walk-forward reutiliza la
+        matriz acumulada del estado previo y sólo codifica las operaciones con
+        id posterior; con walk-forward los segmentos dependen de todo el rango
+        y se recalculan. Devuelve (gains, matriz acumulada, último id).
+        """
+        if self.folds <= 0 and state is not None and 'gains' in state:
+            last_id = int(state['last_id'])
+            total = state['gains']
+            nuevas = self.load_history(after_id=last_id)
+            if nuevas is not None:
+                total = total + self._encode_gains(nuevas)
+                last_id = nuevas['last_id']
+            logger.info(f"[GA] Histórico incremental: {0 if nuevas is None else len(nuevas['ids'])} votos nuevos")
+            self.fold_data = None
+            return total, total, last_id
+        history = self.load_history()
+        self.fold_data = self.build_folds(history)
+        if self.fold_data:
+            # Walk-forward: se ajusta sólo con las ventanas de entrenamiento;
+            # los folds de prueba se reservan para elegir finalistas
+            return self.fold_data['train'], None, None
+        if history is None:
+            return self.load_gains(None), None, None
+        total = self._encode_gains(history)
+        return total, total, history['last_id']
+
+    def _seed_population(self, size: int, prior=None, best=None) -> np.ndarray:
+        """Población inicial: individuos previos (y el mejor vigente) completados con muestras Dirichlet."""
+        rows = []
+        if best is not None:
+            rows.append(best[np.newaxis, :])
+        if prior is not None and len(prior):
+            rows.append(prior)
+        if not rows:
+            return self._init_population(size)
+        seeded = np.vstack(rows)[:size]
+        if len(seeded) < size:
+            seeded = np.vstack([seeded, self._init_population(size - len(seeded))])
+        return seeded
+
+    def _initial_populations(self, state) -> list:
+        n = len(self.strategies)
+        prior = state['populations'] if state is not None else None
+        if prior is not None and prior.shape[0] != self.islands:
+            # Distinto número de islas: se reparte la población previa
+            prior = np.array_split(prior.reshape(-1, n), self.islands)
+        best = None
+        best_path = os.path.join(self.results_dir, 'best_weights.npy')
+        if self.warm_start and os.path.exists(best_path):
+            best = np.load(best_path)
+            if best.shape != (n,):
+                best = None
+        return [self._seed_population(self.population_size,
+                                      prior[i] if prior is not None else None,
+                                      best if i == 0 else None)
+                for i in range(self.islands)]
+
+    # ------------------------------------------------------------------
+    # Optimización
+    # ------------------------------------------------------------------
+    def _run_single(self, population):
+        population, history = evolve(population, self.gains, self.generations, self.mutation_rate,
+                                     self.risk_aversion, seed=self.rng.integers(2**63),
+                                     patience=self.patience, tolerance=self.tolerance)
+        return [population], history
+
+    def _run_islands(self, executor: Executor, islands: list):
+        """Épocas de `migration_interval` generaciones en paralelo, con migración entre épocas."""
+        seeds = np.random.SeedSequence(int(self.rng.integers(2**63)))
+        history = []
+        done = 0
+        while done < self.generations:
+            epoch = min(self.migration_interval, self.generations - done)
+            futures = [executor.submit(evolve, isl, self.gains, epoch, self.mutation_rate,
+                                       self.risk_aversion, child)
+                       for isl, child in zip(islands, seeds.spawn(self.islands))]
+            results = [f.result() for f in futures]
+            islands = [pop for pop, _ in results]
+            # Mejor fitness por generación entre todas las islas
+            history.extend(np.max([h for _, h in results], axis=0).tolist())
+            done += epoch
+            if converged(history, self.patience, self.tolerance):
+                break
+            if done < self.generations:
+                islands = migrate(islands, self.migration_size)
+        return islands, history
+
+    def _select_best(self, populations: list) -> np.ndarray:
+        """
+        Mejor individuo final. Sin walk-forward, el de mayor fitness; con
+        walk-forward, los `finalists` mejores de cada isla (ajustados en
+        entrenamiento) se comparan por su fitness en los folds de prueba.
+        """
+        if not self.fold_data:
+            return max((pop[0] for pop in populations), key=self._evaluate)
+        finalists = np.vstack([pop[:self.finalists] for pop in populations])
+        oos = evaluate_population(finalists, self.fold_data['test'], self.risk_aversion)
+        return finalists[int(np.argmax(oos))]
 
     def optimize(self):
         """
         Ejecuta el Algoritmo Genético y retorna el mejor vector de pesos.
         """
-        population = [self._generate_individual() for _ in range(self.population_size)]
-        for gen in range(self.generations):
-            fitnesses = [self._evaluate(ind) for ind in population]
-            # Selección de mejore individuos
-            idx_sorted = np.argsort(fitnesses)[::-1]
-            survivors = [population[i] for i in idx_sorted[:self.population_size//2]]
-            # Reproducción
-            children = []
-            while len(children) < self.population_size//2:
-                p1, p2 = random.sample(survivors, 2)
-                child = self._crossover(p1, p2)
-                child = self._mutate(child)
-                children.append(child)
-            population = survivors + children
-            print(f"[GA] Generación {gen+1}/{self.generations}, mejor fitness = {fitnesses[idx_sorted[0]]:.2f}")
-        best_weights = population[0]
-        os.makedirs('ga_results', exist_ok=True)
-        np.save('ga_results/best_weights.npy', best_weights)
-        print(f"[GA] Optimización finalizada. Best fitness = {self._evaluate(best_weights):.2f}")
+        inicio = time.perf_counter()
+        state = self.load_state()
+        self.gains, gains_total, last_id = self._prepare_gains(state)
+        populations = self._initial_populations(state)
+        if self.islands > 1:
+            if self.executor is not None:
+                populations, self.history = self._run_islands(self.executor, populations)
+            else:
+                with ProcessPoolExecutor(max_workers=min(self.islands, self.workers)) as executor:
+                    populations, self.history = self._run_islands(executor, populations)
+        else:
+            populations, self.history = self._run_single(populations[0])
+        for gen, fit in enumerate(self.history):
+            logger.info(f"[GA] Generación {gen+1}/{self.generations}, mejor fitness = {fit:.2f}")
+        best_weights = self._select_best(populations)
+        elapsed = time.perf_counter() - inicio
+        best_fitness = self._evaluate(best_weights)
+        ga_run_seconds.set(elapsed)
+        ga_best_fitness.set(best_fitness)
+        os.makedirs(self.results_dir, exist_ok=True)
+        np.save(os.path.join(self.results_dir, 'best_weights.npy'), best_weights)
+        if self.fold_data:
+            with open(os.path.join(self.results_dir, 'fold_metrics.json'), 'w') as f:
+                json.dump(self.fold_metrics(best_weights), f, indent=2)
+        self.save_state(populations, gains_total, last_id)
+        # El núcleo en ejecución recoge la versión nueva desde el registro
+        metadata = {'generations': len(self.history), 'islands': self.islands}
+        if self.fold_data:
+            metadata['oos_mean'] = self.fold_metrics(best_weights)['oos_mean']
+        self.registry.publish(best_weights, self.strategies, fitness=best_fitness, **metadata)
+        logger.info(f"[GA] Optimización finalizada en {elapsed:.2f}s ({self.islands} isla(s), "
+                    f"{len(self.history)} generaciones). Best fitness = {best_fitness:.2f}")
         return best_weights
-
-
@@ -8,12 +8,13 @@ from datetime import datetime
 from core.anima_ga_optimizer import GAOptimizer
 from anima_config import cargar_config
 
-def schedule_daily_optimization(hour: int = 2, minute: int = 0) -> BackgroundScheduler:
+def schedule_daily_optimization(hour: int = 2, minute: int = 0, client=None) -> BackgroundScheduler:
     """
     Programa la optimización genética para que se ejecute cada día a la hora especificada.
 
     :param hour: hora local (0-23) para ejecutar el job
     :param minute: minuto (0-59) para ejecutar el job
+    :param client: cliente Dask opcional; las islas del GA se reparten en sus workers
     :return: instancia de BackgroundScheduler iniciada
     """
     # Cargar horario GA desde config.yml si existe
@@ -24,7 +25,7 @@ def schedule_daily_optimization(hour: int = 2, minute: int = 0) -> BackgroundSch
 
     scheduler = BackgroundScheduler(timezone='America/Monterrey')
     scheduler.add_job(
-        func=GAOptimizer().optimize,
+        func=GAOptimizer(executor=client.get_executor() if client is not None else None).optimize,
         trigger='cron',
         hour=hour,
         minute=minute,
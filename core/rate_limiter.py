@@ -0,0 +1,158 @@
+# core/rate_limiter.py
+"""
+Gobernador de cuota compartido para todas las llamadas de `AnimaBroker`.
+
+Cada tipo de endpoint (velas, órdenes, resultados, saldo) tiene su propio
+token bucket. Los llamadores sin cuota esperan en cola FIFO sobre una
+condición en lugar de dormir un tiempo fijo, y un `TooManyRequests` pausa el
+bucket con back-off exponencial y jitter, de modo que el hilo de ingesta y
+los workers de estrategias comparten el mismo presupuesto.
+"""
+import random
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+from observability import broker_throttled_seconds, broker_rate_limited
+
+logger = logging.getLogger(__name__)
+
+# Peticiones por segundo (rate), ráfaga máxima (burst) y reintentos ante
+# TooManyRequests (retries) por endpoint. Las órdenes apenas se reintentan:
+# una orden que se ejecuta tarde ya no corresponde a la señal que la generó.
+DEFAULT_LIMITS = {
+    'candles': {'rate': 5.0, 'burst': 10, 'retries': 5},
+    'orders': {'rate': 2.0, 'burst': 5, 'retries': 1},
+    'results': {'rate': 5.0, 'burst': 10, 'retries': 5},
+    'balance': {'rate': 2.0, 'burst': 4, 'retries': 3},
+}
+DEFAULT_RETRIES = 3   # endpoints sin 'retries' configurado
+BACKOFF_BASE = 1.0    # segundos tras el primer TooManyRequests
+BACKOFF_MAX = 120.0   # techo del back-off exponencial
+WAIT_SLICE = 0.5      # cada cuánto revisa la cola el evento de parada
+
+
+class TokenBucket:
+    """Token bucket con cola FIFO de espera y pausa explícita (back-off)."""
+
+    def __init__(self, rate: float, burst: int, clock=time.monotonic):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate y burst deben ser positivos")
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.clock = clock
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self._updated = clock()
+        self._cond = threading.Condition()
+        self._waiters = deque()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None,
+                stop_event: Optional[threading.Event] = None) -> float:
+        """
+        Bloquea hasta disponer de `tokens`, respetando el orden de llegada.
+        Devuelve los segundos esperados. Lanza TimeoutError si vence `timeout`
+        e InterruptedError si se activa `stop_event` mientras espera.
+        """
+        ticket = object()
+        with self._cond:
+            start = self.clock()
+            deadline = None if timeout is None else start + timeout
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    now = self.clock()
+                    self._refill(now)
+                    first = self._waiters[0] is ticket
+                    if first and now >= self.paused_until and self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return now - start
+                    if stop_event is not None and stop_event.is_set():
+                        raise InterruptedError("Espera de cuota cancelada por evento de parada")
+                    if deadline is not None and now >= deadline:
+                        raise TimeoutError("Sin cuota del broker dentro del tiempo límite")
+                    wait = WAIT_SLICE
+                    if first:
+                        needed = max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+                        wait = min(wait, max(needed, 0.0))
+                    if deadline is not None:
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Suspende la emisión de tokens durante `seconds` (back-off tras un rechazo)."""
+        with self._cond:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.tokens = 0.0
+            self._cond.notify_all()
+
+
+class RateGovernor:
+    """
+    Buckets por endpoint y back-off adaptativo compartidos por todo el proceso.
+
+    Args:
+        limits: {endpoint: {'rate': float, 'burst': int, 'retries': int}}; se
+            combinan con DEFAULT_LIMITS.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, dict]] = None,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX):
+        merged = {k: dict(v) for k, v in DEFAULT_LIMITS.items()}
+        for endpoint, cfg in (limits or {}).items():
+            merged.setdefault(endpoint, {}).update(cfg)
+        self.buckets = {ep: TokenBucket(cfg['rate'], cfg['burst']) for ep, cfg in merged.items()}
+        self.retries = {ep: int(cfg.get('retries', DEFAULT_RETRIES)) for ep, cfg in merged.items()}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._strikes: Dict[str, int] = {ep: 0 for ep in self.buckets}
+        self._lock = threading.Lock()
+
+    def acquire(self, endpoint: str, stop_event: Optional[threading.Event] = None,
+                timeout: Optional[float] = None) -> float:
+        """Espera turno y cuota para `endpoint`; registra el tiempo estrangulado."""
+        waited = self.buckets[endpoint].acquire(timeout=timeout, stop_event=stop_event)
+        if waited > 0:
+            broker_throttled_seconds.labels(endpoint=endpoint).inc(waited)
+        return waited
+
+    def rate_limited(self, endpoint: str) -> float:
+        """Notifica un rechazo por cuota: pausa el bucket con back-off exponencial y jitter."""
+        with self._lock:
+            self._strikes[endpoint] += 1
+            strikes = self._strikes[endpoint]
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (strikes - 1))
+        delay = random.uniform(delay / 2, delay)  # jitter: evita que todos los hilos reintenten a la vez
+        self.buckets[endpoint].pause(delay)
+        broker_rate_limited.labels(endpoint=endpoint).inc()
+        logger.warning(f"[RateGovernor] TooManyRequests en '{endpoint}'; pausa de {delay:.1f}s (racha {strikes})")
+        return delay
+
+    def success(self, endpoint: str):
+        """Una respuesta válida reinicia la racha de back-off del endpoint."""
+        if self._strikes[endpoint]:
+            with self._lock:
+                self._strikes[endpoint] = 0
+
+
+_governor: Optional[RateGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_rate_governor() -> RateGovernor:
+    """Gobernador compartido, configurado con `broker_limits` de config.yml."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            from anima_config import cargar_config
+            _governor = RateGovernor(cargar_config().get("broker_limits", {}))
+        return _governor
@@ -0,0 +1,149 @@
+# core/weights_registry.py
+"""
+Registro versionado de pesos del ensemble y recarga en caliente.
+
+Cada optimización publica una versión inmutable (`<versión>.npz` con pesos y
+estrategias, y `<versión>.json` con el manifiesto: fecha, fitness y hash de la
+lista de estrategias). El puntero `latest.json` se reemplaza de forma atómica
+después de escribir la versión, así que un lector nunca ve una versión a medias.
+`WeightsWatcher` vigila el puntero desde el núcleo y entrega los pesos nuevos
+sólo si su lista de estrategias coincide con la de config.yml.
+"""
+import hashlib
+import json
+import os
+import threading
+import logging
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from observability import weights_reloads
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_PATH = 'ga_results/registry'
+DEFAULT_POLL_INTERVAL = 30.0
+LATEST = 'latest.json'
+
+
+def strategies_hash(strategies: List[str]) -> str:
+    """Huella estable de la lista ordenada de estrategias."""
+    return hashlib.sha256(json.dumps(list(strategies)).encode()).hexdigest()[:16]
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class WeightsRegistry:
+    """Directorio de versiones de pesos con puntero a la última publicada."""
+
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH):
+        self.path = path
+
+    def publish(self, weights, strategies: List[str], fitness: float = None, **metadata) -> dict:
+        """Publica una versión nueva y la marca como la más reciente. Devuelve su manifiesto."""
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != (len(strategies),):
+            raise ValueError("Número de pesos distinto al de estrategias.")
+        os.makedirs(self.path, exist_ok=True)
+        now = datetime.utcnow()
+        version = now.strftime('%Y%m%dT%H%M%S%f')
+        np.savez(os.path.join(self.path, f"{version}.npz"), weights=weights, strategies=np.array(strategies))
+        manifest = {
+            'version': version,
+            'created_at': now.isoformat(),
+            'fitness': None if fitness is None else float(fitness),
+            'strategies_hash': strategies_hash(strategies),
+            'strategies': list(strategies),
+            'file': f"{version}.npz",
+            **metadata,
+        }
+        text = json.dumps(manifest, indent=2)
+        _write_atomic(os.path.join(self.path, f"{version}.json"), text)
+        _write_atomic(os.path.join(self.path, LATEST), text)
+        logger.info(f"[Weights] Publicada versión {version} (fitness={manifest['fitness']})")
+        return manifest
+
+    def latest(self) -> Optional[dict]:
+        """Manifiesto de la versión más reciente, o None si el registro está vacío."""
+        try:
+            with open(os.path.join(self.path, LATEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.path) if f.endswith('.json') and f != LATEST)
+
+    def load(self, version: str = None) -> Tuple[np.ndarray, dict]:
+        """Pesos y manifiesto de `version` (por defecto, la más reciente)."""
+        if version is None:
+            manifest = self.latest()
+            if manifest is None:
+                raise FileNotFoundError(f"Registro de pesos vacío: {self.path}")
+        else:
+            with open(os.path.join(self.path, f"{version}.json")) as f:
+                manifest = json.load(f)
+        with np.load(os.path.join(self.path, manifest['file']), allow_pickle=False) as data:
+            weights = data['weights']
+        return weights, manifest
+
+    def load_compatible(self, strategies: List[str], version: str = None) -> Tuple[np.ndarray, dict]:
+        """Como `load`, pero lanza ValueError si la versión se generó con otras estrategias."""
+        weights, manifest = self.load(version)
+        expected = strategies_hash(strategies)
+        if manifest.get('strategies_hash') != expected or weights.shape != (len(strategies),):
+            raise ValueError(f"Versión {manifest['version']} generada para otras estrategias "
+                             f"({manifest.get('strategies_hash')} != {expected})")
+        return weights, manifest
+
+
+class WeightsWatcher(threading.Thread):
+    """
+    Vigila `latest.json` y llama a `on_swap(weights, manifest)` con cada
+    versión nueva compatible. Las incompatibles se rechazan una sola vez.
+    """
+
+    def __init__(self, registry: WeightsRegistry, strategies: List[str],
+                 on_swap: Callable[[np.ndarray, dict], None], stop_event: threading.Event,
+                 interval: float = DEFAULT_POLL_INTERVAL, current: Optional[str] = None):
+        super().__init__(daemon=True, name="weights-watcher")
+        self.registry = registry
+        self.strategies = list(strategies)
+        self.on_swap = on_swap
+        self.stop_event = stop_event
+        self.interval = interval
+        self.current = current   # versión activa (o la última rechazada)
+
+    def check(self) -> bool:
+        """Comprueba el puntero una vez. Devuelve True si se aplicó una versión nueva."""
+        manifest = self.registry.latest()
+        if manifest is None or manifest.get('version') == self.current:
+            return False
+        version = manifest['version']
+        self.current = version
+        try:
+            weights, manifest = self.registry.load_compatible(self.strategies, version)
+        except (ValueError, OSError, KeyError) as e:
+            weights_reloads.labels(result='rejected').inc()
+            logger.error(f"[Weights] Versión {version} rechazada: {e}")
+            return False
+        self.on_swap(weights, manifest)
+        weights_reloads.labels(result='applied').inc()
+        logger.info(f"[Weights] Pesos recargados en caliente: versión {version}")
+        return True
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("[Weights] Error vigilando el registro de pesos")
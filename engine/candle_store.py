@@ -0,0 +1,220 @@
+# engine/candle_store.py
+# Almacén compartido de velas en memoria para los workers de estrategias
+
+import functools
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engine.pair_locks import RWLock, pair_locks
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+DEFAULT_CAPACITY = 2000
+DEFAULT_MIN_REFRESH = 1.0  # segundos entre consultas incrementales a la BD
+
+
+_db_handler = None
+
+
+def _default_loader(pair: str, timeframe: str, since: Optional[int], limit: Optional[int] = None) -> pd.DataFrame:
+    # Import diferido: evita cargar la capa de BD al importar el engine
+    global _db_handler
+    if _db_handler is None:
+        from anima_db import DBHandler
+        _db_handler = DBHandler()
+    # La carga inicial sólo necesita las últimas `limit` velas; las incrementales, todo lo nuevo
+    return _db_handler.load_ohlcv(pair, timeframe, since=since, limit=limit if since is None else None)
+
+
+def _to_epoch_seconds(values) -> np.ndarray:
+    """Normaliza timestamps (datetime64 o enteros Unix) a int64 en segundos."""
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype('datetime64[s]').astype(np.int64)
+    return arr.astype(np.int64)
+
+
+class CandleStore:
+    """
+    Buffer circular espejado con las últimas `capacity` velas de un (par, timeframe).
+
+    Cada vela se escribe dos veces (posición `i` e `i + capacity`), de modo que
+    las últimas N velas siempre ocupan un tramo contiguo y `view(n)` devuelve
+    vistas NumPy sin copia. Una vista permanece válida mientras no se añadan
+    más de `capacity - n` velas nuevas; para garantizarlo, los lectores deben
+    mantener `store.read()` mientras usan la vista. Las escrituras toman el
+    lock del par en modo exclusivo.
+    """
+
+    def __init__(self, pair: str, timeframe: str, capacity: int = DEFAULT_CAPACITY,
+                 loader: Optional[Callable[[str, str, Optional[int]], pd.DataFrame]] = None,
+                 min_refresh_interval: float = DEFAULT_MIN_REFRESH, lock: Optional[RWLock] = None):
+        if capacity <= 0:
+            raise ValueError("capacity debe ser positivo")
+        self.pair = pair
+        self.timeframe = timeframe
+        self.capacity = capacity
+        self.loader = loader or functools.partial(_default_loader, limit=capacity)
+        self.min_refresh_interval = min_refresh_interval
+        self._buffers = {
+            col: np.zeros(2 * capacity, dtype=np.int64 if col == 'timestamp' else np.float64)
+            for col in COLUMNS
+        }
+        self._count = 0          # velas escritas desde el inicio
+        self._loaded = False
+        self._last_refresh = 0.0
+        # Lock lectura/escritura compartido con el resto de timeframes del par
+        self.lock = lock if lock is not None else RWLock(pair)
+        # Serializa las consultas a BD: un solo worker refresca, el resto reutiliza
+        self._refresh_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        """Timestamp Unix (s) de la última vela almacenada, o None si está vacío."""
+        if self._count == 0:
+            return None
+        idx = (self._count - 1) % self.capacity
+        return int(self._buffers['timestamp'][idx])
+
+    def append(self, timestamps, open_, high, low, close, volume) -> int:
+        """
+        Añade velas en orden cronológico. Una vela con el mismo timestamp que la
+        última almacenada la sustituye (la ingesta vuelve a descargar la última
+        vela, que pudo guardarse incompleta); las anteriores se descartan.
+        Devuelve cuántas velas nuevas se añadieron.
+        """
+        ts = _to_epoch_seconds(timestamps)
+        cols = (ts, np.asarray(open_, dtype=np.float64), np.asarray(high, dtype=np.float64),
+                np.asarray(low, dtype=np.float64), np.asarray(close, dtype=np.float64),
+                np.asarray(volume, dtype=np.float64))
+        with self.lock.write():
+            last = self.last_timestamp
+            if last is not None:
+                same = np.flatnonzero(ts == last)
+                if same.size:
+                    # Sustituye la vela de cola en ambas copias del buffer espejado
+                    tail = (self._count - 1) % self.capacity
+                    for col, values in zip(COLUMNS, cols):
+                        buf = self._buffers[col]
+                        buf[tail] = buf[tail + self.capacity] = values[same[-1]]
+                mask = ts > last
+                if not mask.all():
+                    cols = tuple(c[mask] for c in cols)
+            n = cols[0].shape[0]
+            if n == 0:
+                return 0
+            # Sólo las últimas `capacity` velas sobreviven al buffer
+            if n > self.capacity:
+                self._count += n - self.capacity
+                cols = tuple(c[-self.capacity:] for c in cols)
+                n = self.capacity
+            slots = (self._count + np.arange(n)) % self.capacity
+            for col, values in zip(COLUMNS, cols):
+                buf = self._buffers[col]
+                buf[slots] = values
+                buf[slots + self.capacity] = values
+            self._count += n
+            return n
+
+    def append_frame(self, df: pd.DataFrame) -> int:
+        """Añade un DataFrame con columnas OHLCV (ordenado o no por timestamp)."""
+        if df is None or df.empty:
+            return 0
+        df = df.sort_values('timestamp')
+        return self.append(df['timestamp'].to_numpy(), df['open'].to_numpy(), df['high'].to_numpy(),
+                           df['low'].to_numpy(), df['close'].to_numpy(), df['volume'].to_numpy())
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Sincroniza con la BD: la primera vez carga el histórico completo (recortado
+        a `capacity`); después pide la última vela conocida (puede haberse
+        corregido) y las posteriores. Las llamadas más frecuentes que
+        `min_refresh_interval` no consultan la BD.
+        """
+        with self._refresh_lock:
+            now = time.monotonic()
+            if not force and self._loaded and now - self._last_refresh < self.min_refresh_interval:
+                return 0
+            last = self.last_timestamp
+            # `since` es exclusivo: last - 1 vuelve a traer la última vela
+            since = (last - 1 if last is not None else None) if self._loaded else None
+            # La consulta a BD no bloquea a los lectores; sólo el append es exclusivo
+            df = self.loader(self.pair, self.timeframe, since)
+            self._last_refresh = now
+            self._loaded = True
+            added = self.append_frame(df)
+        if added:
+            logger.debug(f"[CandleStore] {self.pair} {self.timeframe}: +{added} velas (total={len(self)})")
+        return added
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def read(self):
+        """Contexto de lectura compartida sobre el par (ver `RWLock.read`)."""
+        return self.lock.read()
+
+    def view(self, n: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Devuelve vistas (sin copia) de las últimas `n` velas por columna.
+        No toma el lock: el llamador debe estar dentro de `store.read()`.
+        """
+        count = self._count
+        size = min(count, self.capacity)
+        n = size if n is None else max(0, min(int(n), size))
+        if n == 0:
+            return {col: self._buffers[col][:0] for col in COLUMNS}
+        end = (count - 1) % self.capacity + self.capacity + 1
+        return {col: self._buffers[col][end - n:end] for col in COLUMNS}
+
+    def frame(self, n: Optional[int] = None) -> pd.DataFrame:
+        """Devuelve las últimas `n` velas como DataFrame (columnas OHLCV + timestamp)."""
+        v = self.view(n)
+        data = {col: v[col] for col in COLUMNS[1:]}
+        return pd.DataFrame(
+            {'timestamp': pd.to_datetime(v['timestamp'], unit='s'), **data},
+            copy=False
+        )
+
+
+class CandleStoreRegistry:
+    """Registro de `CandleStore` compartidos por (par, timeframe)."""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, loader=None,
+                 min_refresh_interval: float = DEFAULT_MIN_REFRESH):
+        self.capacity = capacity
+        self.loader = loader
+        self.min_refresh_interval = min_refresh_interval
+        self._stores: Dict[Tuple[str, str], CandleStore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, pair: str, timeframe: str) -> CandleStore:
+        key = (pair, timeframe)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = CandleStore(pair, timeframe, capacity=self.capacity, loader=self.loader,
+                                    min_refresh_interval=self.min_refresh_interval,
+                                    lock=pair_locks.get(pair))
+                self._stores[key] = store
+            return store
+
+
+# Registro por defecto compartido por todos los workers del proceso
+candle_stores = CandleStoreRegistry()
+
+
+def get_candle_store(pair: str, timeframe: str) -> CandleStore:
+    return candle_stores.get(pair, timeframe)
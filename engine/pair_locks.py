@@ -0,0 +1,94 @@
+# engine/pair_locks.py
+# Locks lectura/escritura por par para el acceso a datos de mercado
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from observability import market_lock_wait
+
+
+class RWLock:
+    """
+    Lock lectura/escritura con preferencia de escritores.
+
+    Varios lectores pueden mantenerlo a la vez; un escritor obtiene acceso
+    exclusivo. Cuando hay un escritor esperando, los lectores nuevos esperan,
+    de modo que la ingesta no queda bloqueada indefinidamente por los workers.
+    No es reentrante: un hilo con lectura no debe volver a pedir lectura ni escritura.
+    """
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        start = time.perf_counter()
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        market_lock_wait.labels(pair=self.name, mode='read').observe(time.perf_counter() - start)
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        start = time.perf_counter()
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        market_lock_wait.labels(pair=self.name, mode='write').observe(time.perf_counter() - start)
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class PairLockRegistry:
+    """Un `RWLock` por par: pares distintos nunca compiten entre sí."""
+
+    def __init__(self):
+        self._locks: Dict[str, RWLock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, pair: str) -> RWLock:
+        with self._lock:
+            lock = self._locks.get(pair)
+            if lock is None:
+                lock = RWLock(pair)
+                self._locks[pair] = lock
+            return lock
+
+
+# Registro por defecto compartido por el proceso
+pair_locks = PairLockRegistry()
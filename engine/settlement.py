@@ -0,0 +1,172 @@
+# engine/settlement.py
+# Seguimiento asíncrono del resultado de las operaciones abiertas
+
+import heapq
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from observability import error_counter, settlement_latency, open_positions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 1.0   # segundos entre barridos de tickets ya vencidos sin resultado
+DEFAULT_SETTLE_GRACE = 0.5    # margen tras el vencimiento antes de la primera consulta
+
+
+@dataclass
+class PendingTrade:
+    """Operación colocada en el broker a la espera de liquidación."""
+    ticket: Any
+    pair: str
+    direction: str
+    strategy: Optional[str] = None
+    monto: float = 0.0
+    duracion: int = 1
+    opened_at: float = field(default_factory=time.time)
+    context: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def expires_at(self) -> float:
+        """
+        Vencimiento de la opción digital: el siguiente límite de `duracion`
+        minutos posterior a la apertura (el broker cierra en múltiplos exactos
+        del periodo, no `duracion` minutos después de la compra).
+        """
+        period = self.duracion * 60
+        if period <= 0:
+            return self.opened_at
+        return (self.opened_at // period + 1) * period
+
+
+def classify_result(profit) -> Optional[str]:
+    """Normaliza la respuesta de `check_win` a 'WIN'/'LOSS' (None si no hubo resultado)."""
+    if profit is None:
+        return None
+    if isinstance(profit, str):
+        return profit.upper() if profit.upper() in ("WIN", "LOSS") else None
+    return "WIN" if profit > 0 else "LOSS"
+
+
+class SettlementTracker(threading.Thread):
+    """
+    Liquida todas las operaciones abiertas desde un único hilo de barrido.
+
+    Cada ticket se agenda para su vencimiento (`PendingTrade.expires_at`) más
+    `settle_grace`; en cada tick se consultan juntos todos los tickets vencidos
+    con `broker.poll_results` y los que aún no tienen resultado se reagendan
+    `poll_interval` segundos después. Al liquidarse se invoca
+    `on_settled(trade, profit)` y se registra la latencia desde el vencimiento.
+    Pasado `timeout` segundos del vencimiento sin resultado, se entrega `None`.
+    """
+
+    def __init__(self, broker_getter: Callable[[], Any],
+                 on_settled: Callable[[PendingTrade, Any], None],
+                 stop_event: threading.Event,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 settle_grace: float = DEFAULT_SETTLE_GRACE,
+                 timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        super().__init__(daemon=True, name="settlement")
+        self.broker_getter = broker_getter
+        self.on_settled = on_settled
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self.settle_grace = settle_grace
+        self.timeout = timeout
+        self.clock = clock
+        self._pending: Dict[Any, PendingTrade] = {}
+        self._schedule: List[Tuple[float, int, Any]] = []  # (próxima consulta, secuencia, ticket)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def submit(self, trade: PendingTrade) -> bool:
+        """
+        Registra una operación abierta y agenda su primera consulta al
+        vencimiento. Devuelve False (sin sustituir a la anterior) si el ticket
+        ya está pendiente.
+        """
+        with self._cond:
+            if trade.ticket in self._pending:
+                error_counter.labels(component='settlement').inc()
+                logger.error(f"[Settlement] Ticket duplicado {trade.ticket} ({trade.pair} {trade.direction}); "
+                             f"la operación no se seguirá")
+                return False
+            self._pending[trade.ticket] = trade
+            self._push(trade.expires_at + self.settle_grace, trade.ticket)
+            open_positions.set(len(self._pending))
+            self._cond.notify()
+        return True
+
+    def _push(self, when: float, ticket):
+        self._seq += 1
+        heapq.heappush(self._schedule, (when, self._seq, ticket))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self._cond:
+                if self._closed:
+                    return
+                due = self._due_tickets()
+                if not due:
+                    wait = self._schedule[0][0] - self.clock() if self._schedule else self.poll_interval
+                    self._cond.wait(min(max(wait, 0.0), self.poll_interval))
+                    continue
+            self.sweep(due)
+
+    def _due_tickets(self) -> List[Any]:
+        now = self.clock()
+        due = []
+        while self._schedule and self._schedule[0][0] <= now:
+            _, _, ticket = heapq.heappop(self._schedule)
+            if ticket in self._pending:
+                due.append(ticket)
+        return due
+
+    def sweep(self, tickets: List[Any]):
+        """Consulta en un solo barrido los `tickets` vencidos y liquida los cerrados."""
+        try:
+            results = self.broker_getter().poll_results(tickets)
+        except Exception as e:
+            error_counter.labels(component='settlement').inc()
+            logger.error(f"[Settlement] Error consultando {len(tickets)} tickets: {e}")
+            results = {}
+        now = self.clock()
+        settled = []
+        with self._cond:
+            for ticket in tickets:
+                trade = self._pending.get(ticket)
+                if trade is None:
+                    continue
+                closed, profit = results.get(ticket, (False, None))
+                expired = self.timeout is not None and now - trade.expires_at > self.timeout
+                if closed or expired:
+                    del self._pending[ticket]
+                    settled.append((trade, profit if closed else None))
+                else:
+                    self._push(now + self.poll_interval, ticket)
+            open_positions.set(len(self._pending))
+        for trade, profit in settled:
+            if profit is None:
+                logger.warning(f"[Settlement] Timeout esperando resultado del ticket {trade.ticket}")
+            else:
+                settlement_latency.observe(max(0.0, now - trade.expires_at))
+            try:
+                self.on_settled(trade, profit)
+            except Exception:
+                error_counter.labels(component='settlement').inc()
+                logger.exception(f"[Settlement] Error procesando resultado del ticket {trade.ticket}")
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def close(self):
+        """Detiene el barrido; las operaciones pendientes se abandonan."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
@@ -1,29 +1,146 @@
 # engine/signal_bus.py
 # Módulo de cola para señales generadas por los workers
 
+import heapq
 import queue
+import threading
+import time
 import logging
+from typing import Callable, Dict, Optional
+
+from anima_utils import parse_timeframe
+from observability import signal_bus_depth, signal_bus_dropped, signal_age
 from signal_model import Signal
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAXSIZE = 1000
+DEFAULT_TTL = 60.0  # segundos de vigencia para señales sin timeframe
+
+
 class SignalBus:
     """
     Cola de mensajes para transmitir señales entre workers y filtros.
+
+    - Capacidad acotada (`maxsize`): con la cola llena, una señal nueva sólo
+      entra si tiene más prioridad que la peor encolada, que se descarta.
+    - Vigencia: cada señal caduca tras la duración de su timeframe (o
+      `default_ttl`); las caducadas se descartan al desencolar.
+    - Prioridad: `priorities[strategy]` (p. ej. el peso de la estrategia);
+      a igual prioridad se respeta el orden de llegada.
+    - Deduplicación: una señal con el mismo (par, estrategia, vela) que otra
+      aún vigente se ignora.
     """
-    def __init__(self):
-        self._queue = queue.Queue()
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, default_ttl: float = DEFAULT_TTL,
+                 priorities: Optional[Dict[str, float]] = None, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.priorities = dict(priorities or {})
+        self.clock = clock
+        self._heap = []    # (-prioridad, secuencia, encolada, caduca, clave, señal)
+        self._seen = {}    # clave → instante de caducidad (deduplicación)
+        self._seq = 0
+        self._cond = threading.Condition()
 
-    def get(self, timeout=None):
-        """Devuelve la siguiente señal, bloqueante o con timeout opcional."""
-        if timeout is None:
-            return self._queue.get()
-        return self._queue.get(timeout=timeout)
+    # ------------------------------------------------------------------
+    # Publicación
+    # ------------------------------------------------------------------
+    def _ttl(self, signal) -> float:
+        tf = getattr(signal, 'timeframe', None)
+        if tf:
+            try:
+                return float(parse_timeframe(tf))
+            except ValueError:
+                pass
+        return self.default_ttl
+
+    @staticmethod
+    def _key(signal):
+        if isinstance(signal, dict):
+            return (signal.get('pair'), signal.get('strategy'), signal.get('candle_ts', signal.get('timestamp')))
+        candle = getattr(signal, 'candle_ts', None)
+        return (getattr(signal, 'pair', None), getattr(signal, 'strategy', None),
+                candle if candle is not None else getattr(signal, 'timestamp', None))
 
-    def publish(self, signal: Signal):
-        """Publica una señal en la cola."""
+    def _drop(self, reason: str, signal):
+        signal_bus_dropped.labels(reason=reason).inc()
+        logger.debug(f"[Bus] Señal descartada ({reason}) → {signal}")
+
+    def publish(self, signal: Signal, priority: Optional[float] = None) -> bool:
+        """Publica una señal en la cola. Devuelve False si se descartó."""
+        strategy = signal.get('strategy') if isinstance(signal, dict) else getattr(signal, 'strategy', None)
+        if priority is None:
+            priority = self.priorities.get(strategy, 0.0)
+        with self._cond:
+            now = self.clock()
+            self._purge_seen(now)
+            key = self._key(signal)
+            if self._seen.get(key, now) > now:
+                self._drop('duplicate', signal)
+                return False
+            if len(self._heap) >= self.maxsize:
+                self._purge_expired(now)
+            if len(self._heap) >= self.maxsize:
+                worst = max(range(len(self._heap)), key=lambda i: (self._heap[i][0], self._heap[i][1]))
+                if -self._heap[worst][0] >= priority:
+                    self._drop('full', signal)
+                    return False
+                evicted = self._heap[worst]
+                self._heap[worst] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                self._drop('evicted', evicted[5])
+            expires = now + self._ttl(signal)
+            self._seq += 1
+            heapq.heappush(self._heap, (-priority, self._seq, now, expires, key, signal))
+            self._seen[key] = expires
+            signal_bus_depth.set(len(self._heap))
+            self._cond.notify()
         logger.debug(f"[Bus] Publicando señal → {signal}")
-        self._queue.put(signal)
+        return True
+
+    # ------------------------------------------------------------------
+    # Consumo
+    # ------------------------------------------------------------------
+    def get(self, timeout=None):
+        """Devuelve la siguiente señal vigente de mayor prioridad, bloqueante o con timeout opcional."""
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._cond:
+            while True:
+                now = self.clock()
+                while self._heap:
+                    _, _, enqueued, expires, _, signal = heapq.heappop(self._heap)
+                    signal_bus_depth.set(len(self._heap))
+                    if expires <= now:
+                        self._drop('expired', signal)
+                        continue
+                    signal_age.observe(now - enqueued)
+                    return signal
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self._cond.wait(remaining)
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def _purge_expired(self, now: float):
+        vigentes = [item for item in self._heap if item[3] > now]
+        for item in self._heap:
+            if item[3] <= now:
+                self._drop('expired', item[5])
+        if len(vigentes) != len(self._heap):
+            self._heap = vigentes
+            heapq.heapify(self._heap)
+
+    def _purge_seen(self, now: float):
+        # Limpieza amortizada: las claves caducadas se ignoran hasta reconstruir el mapa
+        if len(self._seen) > 2 * self.maxsize:
+            self._seen = {k: exp for k, exp in self._seen.items() if exp > now}
 
     def subscribe(self):
         """
@@ -35,6 +152,6 @@ class SignalBus:
         """
         while True:
             logger.debug("[Bus] Esperando señal…")
-            signal = self._queue.get()
+            signal = self.get()
             logger.debug(f"[Bus] Señal entregada → {signal}")
             yield signal
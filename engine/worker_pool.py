@@ -2,10 +2,14 @@
 import threading
 import time
 import logging
+from typing import Callable, Dict, List, Tuple
 from anima_config import cargar_config
-from anima_db import DBHandler
+from anima_utils import parse_timeframe
 from anima_strategies.factory import estrategia_factory
 from engine.signal_bus import SignalBus
+from engine.candle_store import CandleStore, get_candle_store
+from anima_strategies.batch import BatchEvaluator
+from signal_model import Signal
 
 logger = logging.getLogger(__name__)
 
@@ -16,71 +20,201 @@ _tf_seconds = {
     '15m': 900,
 }
 
-market_lock = threading.Lock()
+class CandleCloseDispatcher(threading.Thread):
+    """
+    Reloj de cierre de velas: duerme hasta el próximo cierre de cualquiera de los
+    timeframes registrados y despierta sólo a los workers cuyo timeframe acaba de cerrar.
+    `grace` deja margen para que la vela cerrada llegue a la BD antes de evaluar.
+    """
+    def __init__(self, stop_event: threading.Event, grace: float = 1.0, clock: Callable[[], float] = time.time):
+        super().__init__(daemon=True)
+        self.stop_event = stop_event
+        self.grace = grace
+        self.clock = clock
+        self._workers: Dict[str, List['StrategyWorker']] = {}
+        self._lock = threading.Lock()
+
+    def register(self, worker: 'StrategyWorker'):
+        """Pasa el worker a modo por eventos y lo asocia a su timeframe."""
+        _timeframe_seconds(worker.timeframe)  # valida el timeframe
+        worker.event_driven = True
+        with self._lock:
+            self._workers.setdefault(worker.timeframe, []).append(worker)
+
+    def next_close(self, now: float) -> Tuple[int, List[str]]:
+        """Devuelve el próximo instante de cierre y los timeframes que cierran en él."""
+        with self._lock:
+            timeframes = list(self._workers)
+        closes = {}
+        for tf in timeframes:
+            secs = _timeframe_seconds(tf)
+            closes[tf] = (int(now) // secs + 1) * secs
+        close_ts = min(closes.values())
+        return close_ts, [tf for tf, c in closes.items() if c == close_ts]
+
+    def dispatch(self, close_ts: int, timeframes: List[str]) -> int:
+        """Notifica a los workers de los timeframes cerrados. Devuelve cuántos se despertaron."""
+        woken = 0
+        with self._lock:
+            targets = [w for tf in timeframes for w in self._workers.get(tf, [])]
+        for worker in targets:
+            worker.notify(close_ts)
+            woken += 1
+        logger.debug(f"[Clock] Cierre {close_ts} ({', '.join(timeframes)}): {woken} workers despertados")
+        return woken
+
+    def run(self):
+        if not self._workers:
+            logger.warning("[Clock] Sin workers registrados; dispatcher inactivo.")
+            return
+        while not self.stop_event.is_set():
+            close_ts, timeframes = self.next_close(self.clock())
+            delay = close_ts + self.grace - self.clock()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            self.dispatch(close_ts, timeframes)
+
+
+def _timeframe_seconds(timeframe: str) -> int:
+    secs = _tf_seconds.get(timeframe)
+    return secs if secs is not None else parse_timeframe(timeframe)
+
 
 class StrategyWorker(threading.Thread):
-    def __init__(self, pair: str, estrategia_cfg: dict, bus: SignalBus, stop_event: threading.Event):
+    def __init__(self, pair: str, estrategia_cfg: dict, bus: SignalBus, stop_event: threading.Event,
+                 store: CandleStore = None):
         super().__init__(daemon=True)
         self.pair = pair
         self.estrategia_cfg = estrategia_cfg
         self.bus = bus
         self.stop_event = stop_event
+        self.timeframe = estrategia_cfg.get('timeframe', '1m')
         self.interval = estrategia_cfg.get('interval', 60)
         self.error_threshold = estrategia_cfg.get('error_threshold', 5)
         self.pause_duration = estrategia_cfg.get('pause_duration', 300)
-        self.strategy_fn = estrategia_factory(estrategia_cfg)
+        self.strategy_fn = self._build_strategy_fn()
         self.error_count = 0
+        self.window = estrategia_cfg['params'].get('window', estrategia_cfg.get('limit', 100))
+        # Velas compartidas por todos los workers del mismo (par, timeframe)
+        self.store = store if store is not None else get_candle_store(pair, self.timeframe)
+        # Modo por eventos: lo activa CandleCloseDispatcher.register; si no, polling cada `interval`
+        self.event_driven = False
+        self._wake = threading.Event()
+        # Última vela evaluada, para no repetir evaluación sin barra nueva
+        self._last_bar_ts = None
+
+    def _build_strategy_fn(self):
+        return estrategia_factory(self.estrategia_cfg)
+
+    def notify(self, close_ts: int = None):
+        """Despierta al worker tras el cierre de una vela de su timeframe."""
+        self._wake.set()
+
+    def _wait_next_tick(self) -> bool:
+        """Espera al próximo cierre (o `interval` en polling). Devuelve False si hay que parar."""
+        if not self.event_driven:
+            return not self.stop_event.wait(self.interval)
+        while not self.stop_event.is_set():
+            if self._wake.wait(timeout=1.0):
+                self._wake.clear()
+                return True
+        return False
 
     def run(self):
         nombre = self.estrategia_cfg['nombre']
-        logger.info(f"[{nombre}] Iniciando análisis en {self.pair}, cada {self.interval}s")
+        modo = f"al cierre de cada vela {self.timeframe}" if self.event_driven else f"cada {self.interval}s"
+        logger.info(f"[{nombre}] Iniciando análisis en {self.pair}, {modo}")
         while not self.stop_event.is_set():
+            self._tick()
+            if not self._wait_next_tick():
+                break
+
+    def _evaluate(self, df) -> List[Signal]:
+        """Evalúa la estrategia sobre la ventana y devuelve las señales a publicar."""
+        senal = self.strategy_fn(df)
+        if senal is None:
+            return []
+        senal.strategy = self.estrategia_cfg['nombre']
+        return [senal]
+
+    def _tick(self):
+        """Una evaluación de la estrategia sobre la última ventana, si hay vela nueva."""
+        nombre = self.estrategia_cfg['nombre']
+        try:
+            # Sincroniza incrementalmente el store compartido (sólo velas nuevas);
+            # el append toma el lock del par en exclusiva sólo si hay velas nuevas
+            self.store.refresh()
+            # Lectura compartida: otros workers del mismo par leen a la vez
+            with self.store.read():
+                last_bar = self.store.last_timestamp
+                if last_bar is not None and last_bar == self._last_bar_ts:
+                    logger.debug(f"[{nombre}] Sin vela nueva en {self.pair}; se omite la evaluación")
+                    return
+                # Copia de la ventana antes de soltar el lock: las vistas del buffer
+                # sólo son válidas dentro de `store.read()` y un append puede rotarlo
+                df = self.store.frame(self.window).copy()
+            if df is None or df.empty:
+                self.error_count = 0
+                return
+
             try:
-                with market_lock:
-                    # Carga histórico desde BD en lugar de usar 'since' o 'limit'
-                    df_full = DBHandler().load_ohlcv(
-                        self.pair,
-                        self.estrategia_cfg.get('timeframe', '1m')
-                    )
-                    # Aplicar ventana de datos
-                    window = self.estrategia_cfg['params'].get('window', self.estrategia_cfg.get('limit', 100))
-                    df = df_full.iloc[-window:]
-                if df is None or df.empty:
+                senales = self._evaluate(df)
+            except ConnectionError as e:
+                logger.warning(f"[{nombre}] Conexión perdida: {e}. Reintentando...")
+                self.error_count += 1
+                if self.error_count >= self.error_threshold:
+                    logger.warning(f"[{nombre}] {self.error_count} errores consecutivos, pausando {self.pause_duration}s")
+                    time.sleep(self.pause_duration)
                     self.error_count = 0
-                    time.sleep(self.interval)
-                    continue
-                else:
-                    try:
-                        senal = self.strategy_fn(df)
-                    except ConnectionError as e:
-                        logger.warning(f"[{nombre}] Conexión perdida: {e}. Reintentando...")
-                        self.error_count += 1
-                        if self.error_count >= self.error_threshold:
-                            logger.warning(f"[{nombre}] {self.error_count} errores consecutivos, pausando {self.pause_duration}s")
-                            time.sleep(self.pause_duration)
-                            self.error_count = 0
-                        continue
-                    except Exception as e:
-                        logger.error(f"[{nombre}] Error al generar señal: {e}")
-                        continue
-
-                    if senal is None:
-                        continue
-
-                    try:
-                        senal.strategy = nombre
-                        self.bus.publish(senal)
-                        self.error_count = 0
-                    except Exception as e:
-                        logger.error(f"[{nombre}] Error al publicar señal: {e}")
-
+                return
             except Exception as e:
-                msg = str(e).lower()
-                logger.error(f"[{nombre}] Error en bucle de worker: {e}")
-                if any(x in msg for x in ('socket', 'websocket', 'connection')):
-                    self.error_count += 1
-                    if self.error_count >= self.error_threshold:
-                        logger.warning(f"[{nombre}] {self.error_count} errores consecutivos en bucle, pausando {self.pause_duration}s")
-                        time.sleep(self.pause_duration)
-                        self.error_count = 0
-            time.sleep(self.interval)
\ No newline at end of file
+                logger.error(f"[{nombre}] Error al generar señal: {e}")
+                return
+            self._last_bar_ts = last_bar
+
+            for senal in senales:
+                try:
+                    # Contexto de vela para el TTL y la deduplicación del bus
+                    senal.timeframe = self.timeframe
+                    senal.candle_ts = last_bar
+                    self.bus.publish(senal)
+                    self.error_count = 0
+                except Exception as e:
+                    logger.error(f"[{nombre}] Error al publicar señal: {e}")
+
+        except Exception as e:
+            msg = str(e).lower()
+            logger.error(f"[{nombre}] Error en bucle de worker: {e}")
+            if any(x in msg for x in ('socket', 'websocket', 'connection')):
+                self.error_count += 1
+                if self.error_count >= self.error_threshold:
+                    logger.warning(f"[{nombre}] {self.error_count} errores consecutivos en bucle, pausando {self.pause_duration}s")
+                    time.sleep(self.pause_duration)
+                    self.error_count = 0
+
+
+class PairBatchWorker(StrategyWorker):
+    """
+    Worker único por (par, timeframe) que evalúa todas las estrategias configuradas
+    en una sola pasada con `BatchEvaluator`, compartiendo las primitivas de vela.
+    """
+    def __init__(self, pair: str, estrategias: List[dict], bus: SignalBus, stop_event: threading.Event,
+                 timeframe: str = '1m', store: CandleStore = None):
+        windows = [e.get('params', {}).get('window', e.get('limit', 100)) for e in estrategias]
+        batch_cfg = {
+            'nombre': f"batch[{len(estrategias)}]",
+            'timeframe': timeframe,
+            'params': {'window': max(windows, default=100)},
+        }
+        for key in ('interval', 'error_threshold', 'pause_duration'):
+            if estrategias and key in estrategias[0]:
+                batch_cfg[key] = estrategias[0][key]
+        self.estrategias = estrategias
+        self.evaluator = BatchEvaluator(estrategias)
+        super().__init__(pair, batch_cfg, bus, stop_event, store=store)
+
+    def _build_strategy_fn(self):
+        return None
+
+    def _evaluate(self, df) -> List[Signal]:
+        return self.evaluator.evaluate(df, pair=self.pair)
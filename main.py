@@ -35,10 +35,11 @@ def main():
     signal.signal(signal.SIGINT, on_sigint)
 
     scheduler = None
+    client = None
     # Fases de arranque con manejo de errores
     try:
         logger.info("Configurando entorno...")
-        setup_environment()
+        client = setup_environment()
     except Exception as e:
         logger.exception("Error en setup_environment: %s", e)
         sys.exit(1)
@@ -55,7 +56,7 @@ def main():
     # Scheduler diario
     try:
         logger.info("Iniciando scheduler diario...")
-        scheduler = schedule_daily_optimization()
+        scheduler = schedule_daily_optimization(client=client)
         # Fallback si schedule_daily_optimization no devolvió scheduler
         if scheduler is None:
             from apscheduler.schedulers.background import BackgroundScheduler
@@ -9,9 +9,12 @@ except ImportError:
         print(f"[Observability] Iniciando modo dummy; servidor de métricas omitido.")
     class Gauge:
         def __init__(self, *args, **kwargs): pass
+        def labels(self, *args, **kwargs): return self
         def set(self, *args, **kwargs): pass
     class Histogram:
         def __init__(self, *args, **kwargs): pass
+        def labels(self, *args, **kwargs): return self
+        def observe(self, *args, **kwargs): pass
         def time(self):
             class DummyContext:
                 def __enter__(self): pass
@@ -19,6 +22,7 @@ except ImportError:
             return DummyContext()
     class Counter:
         def __init__(self, *args, **kwargs): pass
+        def labels(self, *args, **kwargs): return self
         def inc(self, *args, **kwargs): pass
 
 # Métricas de Prometheus
@@ -26,10 +30,29 @@ ohlcv_ingestion_latency = Histogram(
     'ohlcv_ingestion_latency_seconds',
     'Tiempo de latencia de ingesta OHLCV en segundos'
 )
+ohlcv_insert_latency = Histogram(
+    'ohlcv_insert_latency_seconds',
+    'Duración de la inserción masiva de velas en SQLite'
+)
+ohlcv_ingestion_throughput = Gauge(
+    'ohlcv_ingestion_rows_per_second',
+    'Filas por segundo de la última inserción masiva de velas por símbolo',
+    ['symbol']
+)
 signal_processing_time = Histogram(
     'signal_processing_time_seconds',
     'Tiempo de procesamiento por señal en core'
 )
+ensemble_latency = Histogram(
+    'ensemble_latency_seconds',
+    'Duración de cada voto del ensemble',
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+signal_batch_size = Histogram(
+    'signal_batch_size',
+    'Señales agrupadas por (par, vela) en cada evaluación del ensemble',
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34)
+)
 error_counter = Counter(
     'error_count_total',
     'Número de errores por componente',
@@ -40,6 +63,72 @@ thread_heartbeat = Gauge(
     'Timestamp del último latido de hilo',
     ['thread']
 )
+market_lock_wait = Histogram(
+    'market_lock_wait_seconds',
+    'Tiempo de espera para adquirir el lock de datos de mercado por par',
+    ['pair', 'mode'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+db_write_queue_depth = Gauge(
+    'db_write_queue_depth',
+    'Filas pendientes en la cola de escritura diferida de la base de datos'
+)
+db_flush_latency = Histogram(
+    'db_flush_latency_seconds',
+    'Duración de cada volcado por lotes de la cola de escritura diferida',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+ohlcv_query_latency = Histogram(
+    'ohlcv_query_latency_seconds',
+    'Duración de cada consulta de velas OHLCV a SQLite',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+)
+broker_throttled_seconds = Counter(
+    'broker_throttled_seconds_total',
+    'Segundos que las llamadas al broker esperaron por cuota, por endpoint',
+    ['endpoint']
+)
+broker_rate_limited = Counter(
+    'broker_rate_limited_total',
+    'Respuestas TooManyRequests recibidas del broker, por endpoint',
+    ['endpoint']
+)
+settlement_latency = Histogram(
+    'settlement_latency_seconds',
+    'Tiempo desde el vencimiento de una operación hasta conocer su resultado',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+)
+open_positions = Gauge(
+    'open_positions',
+    'Operaciones abiertas pendientes de liquidación'
+)
+signal_bus_depth = Gauge(
+    'signal_bus_depth',
+    'Señales pendientes en el SignalBus'
+)
+signal_age = Histogram(
+    'signal_age_seconds',
+    'Antigüedad de la señal al desencolarla del SignalBus',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0)
+)
+signal_bus_dropped = Counter(
+    'signal_bus_dropped_total',
+    'Señales descartadas por el SignalBus, por motivo',
+    ['reason']
+)
+ga_run_seconds = Gauge(
+    'ga_run_seconds',
+    'Duración (wall-clock) de la última optimización genética'
+)
+ga_best_fitness = Gauge(
+    'ga_best_fitness',
+    'Mejor fitness de la última optimización genética'
+)
+weights_reloads = Counter(
+    'weights_reloads_total',
+    'Versiones de pesos detectadas por el núcleo, por resultado (applied/rejected)',
+    ['result']
+)
 
 def start_metrics_server(port: int = 8000):
     """
@@ -1,27 +1,47 @@
 # anima_signal_history.py
 # Motor de análisis histórico de estrategias sobre múltiples pares
 
+import time
+import numpy as np
 import pandas as pd
 import logging
 from anima_config import cargar_config
 from anima_market import get_historical_ohlcv
-from anima_strategies.factory import estrategia_factory
+from anima_strategies.batch import BatchEvaluator, CandlePrimitives
 from signal_model import Signal
 
 logger = logging.getLogger(__name__)
 
+# Velas máximas que ven las estrategias sin kernel vectorizado en cada paso del replay
+DEFAULT_HISTORY_LOOKBACK = 100
+
+
+def _to_unix(fecha) -> int | None:
+    if fecha is None:
+        return None
+    return int(pd.Timestamp(fecha).timestamp())
+
+
 class SignalHistory:
     """
     Aplica todas las estrategias configuradas sobre todos los pares definidos,
     y genera un DataFrame de resultados para análisis o entrenamiento.
+
+    El replay es lineal: las estrategias con kernel en `anima_strategies.batch`
+    producen su columna completa de señales en una sola pasada vectorizada; el
+    resto se evalúa con una ventana deslizante de `history_lookback` velas.
+    Para estas últimas el resultado es una aproximación: una estrategia con
+    memoria larga (p. ej. las EMA de `ema_crossover`) puede diferir de su
+    evaluación sobre el prefijo completo si la ventana es corta.
     """
-    def __init__(self):
+    def __init__(self, history_lookback: int = None):
         self.config = cargar_config()
         self.pairs = self.config.get("pairs", [])
         self.estrategias = self.config.get("estrategias", [])
         self.timeframe = self.config.get("timeframe", "1m")
         self.start_date = self.config.get("start_date")
         self.end_date = self.config.get("end_date")
+        self.history_lookback = history_lookback or self.config.get("history_lookback", DEFAULT_HISTORY_LOOKBACK)
         self.signals = []
 
     def run(self) -> pd.DataFrame:
@@ -31,33 +51,78 @@ class SignalHistory:
         """
         for pair in self.pairs:
             logger.info(f"📊 Analizando histórico para {pair}")
-            df = get_historical_ohlcv(pair, timeframe=self.timeframe, start_date=self.start_date, end_date=self.end_date)
+            df = get_historical_ohlcv(pair, timeframe=self.timeframe,
+                                      start=_to_unix(self.start_date), end=_to_unix(self.end_date))
 
             if df.empty or len(df) < 10:
                 logger.warning(f"⚠️ Insuficientes datos para {pair}")
                 continue
 
-            for estrategia_cfg in self.estrategias:
-                nombre = estrategia_cfg.get("nombre")
-                params = estrategia_cfg.get("params", {})
-                params["pair"] = pair  # Inyectamos el par en los parámetros
-                logger.info(f"⚙️ Aplicando estrategia: {nombre} en {pair}")
-
-                estrategia_fn = estrategia_factory(estrategia_cfg)
-
-                for i in range(len(df)):
-                    sub_df = df.iloc[:i+1].copy()
-                    try:
-                        signal = estrategia_fn(sub_df, params)
-                        if signal:
-                            self.signals.append({
-                                "timestamp": sub_df.index[-1],
-                                "pair": signal.pair,
-                                "direction": signal.direction,
-                                "strategy": signal.strategy
-                            })
-                    except Exception as e:
-                        logger.error(f"❌ Error al aplicar {nombre} en {pair} (i={i}): {e}")
-
-        return pd.DataFrame(self.signals)
+            inicio = time.time()
+            self.signals.extend(self.replay(df, pair))
+            logger.info(f"⚙️ Replay de {len(self.estrategias)} estrategias en {pair} "
+                        f"({len(df)} velas) en {time.time() - inicio:.2f}s")
+
+        if not self.signals:
+            return pd.DataFrame(columns=["timestamp", "pair", "direction", "strategy"])
+        return pd.concat(self.signals, ignore_index=True).sort_values("timestamp", kind="stable", ignore_index=True)
 
+    def replay(self, df: pd.DataFrame, pair: str) -> list[pd.DataFrame]:
+        """
+        Devuelve, por estrategia, un DataFrame con las señales de cada vela de `df`.
+        Las estrategias con kernel equivalen a evaluar `generate_signal` sobre
+        cada prefijo del histórico; las demás lo evalúan sólo sobre las últimas
+        `history_lookback` velas de cada prefijo (exacto si la ventana cubre
+        todo el histórico).
+        """
+        df = df.reset_index(drop=True)
+        if "timestamp" in df.columns:
+            timestamps = pd.to_datetime(df["timestamp"], unit="s") if np.issubdtype(df["timestamp"].dtype, np.number) \
+                else pd.to_datetime(df["timestamp"])
+        else:
+            timestamps = pd.Series(df.index)
+        timestamps = timestamps.to_numpy()
+
+        estrategias = []
+        for estrategia_cfg in self.estrategias:
+            cfg = dict(estrategia_cfg)
+            cfg["params"] = {**estrategia_cfg.get("params", {}), "pair": pair}  # Inyectamos el par
+            estrategias.append(cfg)
+        evaluator = BatchEvaluator(estrategias)
+
+        # Estrategias vectorizadas: una columna de direcciones por estrategia
+        ends = np.arange(len(df), dtype=np.int64)
+        dirs = evaluator.directions(CandlePrimitives.from_frame(df), ends)
+        chunks = []
+        for nombre, d in dirs.items():
+            idx = np.flatnonzero(d)
+            chunks.append(pd.DataFrame({
+                "timestamp": timestamps[idx],
+                "pair": pair,
+                "direction": np.where(d[idx] > 0, "CALL", "PUT"),
+                "strategy": nombre,
+            }))
+
+        # Resto: ventana deslizante acotada en lugar de copias crecientes del histórico
+        for nombre, params in evaluator.estrategias:
+            if nombre in dirs:
+                continue
+            logger.info(f"⚙️ Aplicando estrategia sin kernel: {nombre} en {pair}")
+            estrategia_fn = evaluator.fallbacks[nombre]
+            rows = []
+            for i in range(len(df)):
+                sub_df = df.iloc[max(0, i + 1 - self.history_lookback):i + 1]
+                try:
+                    signal: Signal | None = estrategia_fn(sub_df, params)
+                    if signal:
+                        rows.append({
+                            "timestamp": timestamps[i],
+                            "pair": signal.pair,
+                            "direction": signal.direction,
+                            "strategy": nombre
+                        })
+                except Exception as e:
+                    logger.error(f"❌ Error al aplicar {nombre} en {pair} (i={i}): {e}")
+            if rows:
+                chunks.append(pd.DataFrame(rows))
+        return chunks
@@ -9,6 +9,10 @@ Campos obligatorios (los únicos que realmente usa el flujo actual):
     strategy    → nombre de la estrategia
     timestamp   → fecha‑hora UTC auto‑generada
 
+Campos opcionales (los rellenan los workers para el SignalBus):
+    timeframe   → timeframe de la vela evaluada (define el TTL de la señal)
+    candle_ts   → timestamp Unix de la vela que originó la señal (deduplicación)
+
 Incluye:
     • Validación de dirección.
     • Serialización a/desde dict con timestamp ISO‑8601.
@@ -17,7 +21,7 @@ Incluye:
 
 from dataclasses import dataclass, field, asdict
 from datetime import datetime, timezone
-from typing import Dict, Any, Literal
+from typing import Dict, Any, Literal, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,6 +35,8 @@ class Signal:
     direction: Literal["CALL", "PUT"]
     strategy: str
     timestamp: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    timeframe: Optional[str] = None
+    candle_ts: Optional[int] = None
 
     # ------------------------------------------------------------------
     # Validación
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def core_workdir(tmp_path, monkeypatch):
+    """
+    Directorio de trabajo temporal con una copia de config.yml: AnimaCore
+    resuelve en relativo la BD de operaciones, el snapshot de StrategyStats,
+    el estado RL y el registro de pesos, así que nada se escribe en el repo.
+    """
+    shutil.copy(os.path.join(REPO_ROOT, "config.yml"), tmp_path / "config.yml")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
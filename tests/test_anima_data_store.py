@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from anima_data import AnimaData
+from anima_db import get_connection
+
+
+def _frame(n, start=0):
+    ts = np.arange(start, start + n * 60, 60, dtype=np.int64)
+    df = pd.DataFrame({"timestamp": ts, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 3.0})
+    df.insert(0, "timeframe", "1m")
+    df.insert(0, "symbol", "EURUSD")
+    return df
+
+
+@pytest.mark.parametrize("staging", [False, True])
+def test_bulk_insert_chunks_and_replaces(tmp_path, staging):
+    data = AnimaData(broker=None, data_dir=str(tmp_path), db_path=str(tmp_path / "ohlcv.sqlite"))
+    assert data.bulk_insert_ohlcv(_frame(25), "EURUSD", "1m", chunk_size=7, staging=staging) == 25
+
+    # Las velas repetidas se reemplazan en lugar de duplicarse
+    update = _frame(10, start=20 * 60)
+    update["close"] = 9.0
+    data.bulk_insert_ohlcv(update, "EURUSD", "1m", chunk_size=4, staging=staging)
+
+    conn = get_connection(data.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM ohlcv").fetchone()[0] == 30
+    rows = conn.execute("SELECT timestamp, close FROM ohlcv WHERE timestamp >= 1200 ORDER BY timestamp").fetchall()
+    assert rows[0] == (1200, 9.0) and isinstance(rows[0][0], int)
+
+
+class RangeBroker:
+    """Broker falso que sirve velas de 1m en [since, until] salvo las de `hole`."""
+
+    def __init__(self, hole=()):
+        self.calls = []
+        self.hole = set(hole)
+
+    def fetch_ohlcv(self, symbol, timeframe, since, until=None):
+        self.calls.append((since, until))
+        return [[ts, 1.0, 2.0, 0.5, 1.5, 3.0] for ts in range(since - since % 60, until + 1, 60)
+                if ts >= since and ts not in self.hole]
+
+
+def test_sync_fetches_only_missing_ranges(tmp_path):
+    data = AnimaData(broker=RangeBroker(), data_dir=str(tmp_path), db_path=str(tmp_path / "ohlcv.sqlite"))
+    # Histórico previo con un hueco entre 1200 y 1800
+    data.bulk_insert_ohlcv(pd.concat([_frame(11, start=600), _frame(5, start=1800)]), "EURUSD", "1m")
+
+    assert data.missing_ranges("EURUSD", "1m", 0, 2400) == [(0, 600), (1200, 1800), (2040, 2400)]
+    assert data.sync_ohlcv("EURUSD", "1m", 0, 2400, parquet=False) == 10 + 9 + 6
+    assert data.broker.calls == [(0, 600), (1200, 1800), (2040, 2400)]
+    # Tras la sincronización sólo queda la última vela por refrescar
+    assert data.missing_ranges("EURUSD", "1m", 0, 2400) == []
+    assert data.missing_ranges("EURUSD", "1m", 0, 2460) == [(2400, 2460)]
+
+
+def test_sync_records_known_empty_gaps(tmp_path):
+    closed = range(660, 1200, 60)  # mercado cerrado: el broker no devuelve velas
+    data = AnimaData(broker=RangeBroker(hole=closed), data_dir=str(tmp_path), db_path=str(tmp_path / "ohlcv.sqlite"))
+    data.bulk_insert_ohlcv(pd.concat([_frame(2, start=540), _frame(2, start=1200)]), "EURUSD", "1m")
+
+    assert data.sync_ohlcv("EURUSD", "1m", 540, 1260, parquet=False) == 0
+    assert data.missing_ranges("EURUSD", "1m", 540, 1260) == []
+
+
+class FlakyPagedBroker:
+    """Broker paginado que falla tras entregar la primera página en la primera llamada."""
+
+    def __init__(self):
+        self.calls = []
+
+    def iter_ohlcv(self, symbol, timeframe, since, until):
+        self.calls.append(since)
+        first = len(self.calls) == 1
+        for start in range(0, until, 300):
+            page = [[ts, 1.0, 2.0, 0.5, 1.5, 3.0] for ts in range(start, min(start + 300, until), 60) if ts >= since]
+            if not page:
+                continue
+            yield page
+            if first:
+                raise ConnectionError("conexión perdida")
+
+
+def test_generic_retry_resumes_without_duplicate_candles(tmp_path, monkeypatch):
+    import anima_data
+    monkeypatch.setattr(anima_data, "RETRY_BACKOFF", 0)
+    written = []
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", lambda self, path, **kw: written.append(self.copy()))
+    data = AnimaData(broker=FlakyPagedBroker(), data_dir=str(tmp_path), db_path=str(tmp_path / "ohlcv.sqlite"))
+    assert data.fetch_and_persist_ohlcv("EURUSD", "1m", since=0, until=900) == 15
+    # Reanuda tras la última vela guardada (240) en lugar de repetir la primera página
+    assert data.broker.calls == [0, 241]
+    assert written[0]["timestamp"].tolist() == list(range(0, 900, 60))
@@ -0,0 +1,58 @@
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+from anima_strategies.batch import BatchEvaluator, CandlePrimitives, KERNELS
+
+
+def _random_candles(n=160, seed=7):
+    # Precios discretos para forzar empates (doji, velas gemelas, gaps nulos)
+    rng = np.random.default_rng(seed)
+    open_ = rng.integers(95, 105, n).astype(float)
+    close = open_ + rng.integers(-2, 3, n)
+    high = np.maximum(open_, close) + rng.integers(0, 3, n)
+    low = np.minimum(open_, close) - rng.integers(0, 3, n)
+    # Algunas series monótonas para tres_mosqueteiros / flips
+    close[40:48] = open_[40:48] + 1
+    open_[60:63] = [100, 101, 102]
+    close[60:63] = [101, 102, 103]
+    open_[80:82] = 100
+    close[80:82] = 102
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': 1.0})
+
+
+PARAM_VARIANTS = {
+    'mhi2_maioria': [{}, {'window': 4, 'threshold': 2}],
+    'milhao_minoria': [{}, {'window': 6}],
+    'gaba': [{'body_threshold': 0.1, 'wick_multiplier': 2}, {'body_threshold': 0.3, 'wick_multiplier': 1}],
+    'reversao': [{'gap_threshold': 0.001, 'body_threshold': 0.8}, {'gap_threshold': 0.02, 'body_threshold': 0.5}],
+    'padrao_23': [{}, {'window': 4}],
+}
+
+
+@pytest.mark.parametrize('nombre', sorted(KERNELS))
+def test_kernels_match_module_generate_signal(nombre):
+    df = _random_candles()
+    prims = CandlePrimitives.from_frame(df)
+    modulo = importlib.import_module(f'anima_strategies.{nombre}')
+    ends = np.arange(len(df))
+    for params in PARAM_VARIANTS.get(nombre, [{}]):
+        dirs = KERNELS[nombre](prims, ends, params)
+        for e in ends:
+            senal = modulo.generate_signal(df.iloc[:e + 1], params)
+            expected = 0 if senal is None else (1 if senal.direction == 'CALL' else -1)
+            assert dirs[e] == expected, f"{nombre} {params} difiere en la vela {e}"
+
+
+def test_batch_evaluator_returns_all_signals_for_last_bar():
+    df = _random_candles()
+    estrategias = [{'nombre': n, 'params': {}} for n in sorted(KERNELS)]
+    signals = BatchEvaluator(estrategias).evaluate(df, pair='EURUSD')
+
+    expected = []
+    for cfg in estrategias:
+        senal = importlib.import_module(f"anima_strategies.{cfg['nombre']}").generate_signal(df, {})
+        if senal is not None:
+            expected.append((cfg['nombre'], senal.direction))
+    assert [(s.strategy, s.direction) for s in signals] == expected
+    assert all(s.pair == 'EURUSD' for s in signals)
@@ -0,0 +1,59 @@
+import threading
+import pytest
+from core.anima_broker import AnimaBroker, OHLCVPageError, _split_pages
+from core.rate_limiter import RateGovernor
+
+
+class FakeIq:
+    """get_candles falso: velas de 60s que terminan en `end`, con fallos programables."""
+
+    def __init__(self, fail_ends=()):
+        self.calls = []
+        self.fail_ends = set(fail_ends)
+        self.lock = threading.Lock()
+
+    def check_connect(self):
+        return True
+
+    def get_candles(self, symbol, tf, count, end):
+        with self.lock:
+            self.calls.append((count, end))
+        if end in self.fail_ends:
+            raise RuntimeError("timeout")
+        last = end - end % tf
+        return [{'from': t, 'open': 1, 'max': 2, 'min': 0, 'close': 1, 'volume': 5}
+                for t in range(last - (count - 1) * tf, last + 1, tf)]
+
+
+def _broker(iq):
+    broker = AnimaBroker.__new__(AnimaBroker)
+    broker.Iq = iq
+    broker.stop_event = threading.Event()
+    broker._lock = threading.Lock()
+    broker.governor = RateGovernor({'candles': {'rate': 1000.0, 'burst': 1000}})
+    return broker
+
+
+def test_split_pages_is_contiguous_and_bounded():
+    pages = _split_pages(0, 60 * 2499, 60, 1000)
+    assert [(lo, hi, n) for lo, hi, n in pages] == [(0, 60000, 1000), (60000, 120000, 1000), (120000, 149941, 500)]
+
+
+def test_iter_ohlcv_yields_pages_in_order_without_duplicates():
+    iq = FakeIq()
+    pages = list(_broker(iq).iter_ohlcv('EURUSD', '1m', 0, 60 * 2499, page_size=1000, max_workers=3))
+    ts = [c[0] for page in pages for c in page]
+    assert len(pages) == 3
+    assert ts == list(range(0, 60 * 2500, 60))
+    assert sorted(count for count, _ in iq.calls) == [500, 1000, 1000]
+
+
+def test_failed_page_reports_resume_point(monkeypatch):
+    monkeypatch.setattr('core.anima_broker.PAGE_RETRY_BACKOFF', 0)
+    iq = FakeIq(fail_ends={119999})
+    entregadas = []
+    with pytest.raises(OHLCVPageError) as exc:
+        for page in _broker(iq).iter_ohlcv('EURUSD', '1m', 0, 60 * 2499, page_size=1000, max_workers=1):
+            entregadas.append(page)
+    assert len(entregadas) == 1
+    assert exc.value.resume_since == 60000
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+from engine.candle_store import CandleStore, CandleStoreRegistry
+
+
+def _candles(start, n, step=60):
+    ts = np.arange(start, start + n * step, step, dtype=np.int64)
+    base = np.arange(n, dtype=np.float64)
+    return pd.DataFrame({
+        'timestamp': ts,
+        'open': base,
+        'high': base + 2,
+        'low': base - 1,
+        'close': base + 1,
+        'volume': base * 10,
+    })
+
+
+def test_view_is_zero_copy_and_ordered_after_wraparound():
+    store = CandleStore('EURUSD', '1m', capacity=5, loader=lambda *a: None)
+    store.append_frame(_candles(0, 4))
+    store.append_frame(_candles(240, 4))  # 8 velas en total, capacidad 5
+
+    assert len(store) == 5
+    v = store.view(3)
+    np.testing.assert_array_equal(v['timestamp'], [300, 360, 420])
+    np.testing.assert_array_equal(v['open'], [1, 2, 3])
+    # Las columnas son vistas del buffer interno, no copias
+    assert np.shares_memory(v['close'], store._buffers['close'])
+    # La ventana completa también es contigua y ordenada
+    np.testing.assert_array_equal(store.view()['timestamp'], [180, 240, 300, 360, 420])
+
+
+def test_append_discards_already_known_candles():
+    store = CandleStore('EURUSD', '1m', capacity=10, loader=lambda *a: None)
+    assert store.append_frame(_candles(0, 3)) == 3
+    assert store.append_frame(_candles(60, 3)) == 1
+    assert store.last_timestamp == 180
+
+
+def test_refresh_replaces_corrected_last_candle():
+    history = _candles(0, 3)
+
+    def loader(pair, timeframe, since):
+        return history if since is None else history[history['timestamp'] > since]
+
+    store = CandleStore('EURUSD', '1m', capacity=2, loader=loader, min_refresh_interval=0.0)
+    store.refresh()
+    # La ingesta reescribe la última vela (incompleta) con su cierre definitivo
+    history.loc[history['timestamp'] == 120, 'close'] = 42.0
+    assert store.refresh() == 0
+    assert store.view(1)['close'][0] == 42.0
+    # La copia espejada también se actualiza: la vela sigue correcta tras rotar el buffer
+    history = pd.concat([history, _candles(180, 1)], ignore_index=True)
+    assert store.refresh() == 1
+    np.testing.assert_array_equal(store.view()['close'], [42.0, 1.0])
+
+
+def test_refresh_loads_once_then_incremental():
+    calls = []
+    history = _candles(0, 6)
+
+    def loader(pair, timeframe, since):
+        calls.append(since)
+        if since is None:
+            return history
+        return history[history['timestamp'] > since]
+
+    store = CandleStore('EURUSD', '1m', capacity=4, loader=loader, min_refresh_interval=0.0)
+    assert store.refresh() == 4
+    assert store.refresh() == 0
+    history = pd.concat([history, _candles(360, 2)], ignore_index=True)
+    assert store.refresh() == 2
+    assert calls == [None, 299, 299]
+
+    df = store.frame(3)
+    assert list(df.columns) == ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    assert df['timestamp'].iloc[-1] == pd.Timestamp(420, unit='s')
+
+
+def test_registry_shares_store_per_pair_timeframe():
+    registry = CandleStoreRegistry(capacity=8, loader=lambda *a: None)
+    assert registry.get('EURUSD', '1m') is registry.get('EURUSD', '1m')
+    assert registry.get('EURUSD', '1m') is not registry.get('EURUSD', '5m')
+
+
+def test_pair_lock_readers_share_and_writer_is_exclusive():
+    import threading
+    from engine.pair_locks import RWLock
+
+    lock = RWLock('EURUSD')
+    lock.acquire_read()
+    # Un segundo lector entra sin esperar al primero
+    second = threading.Thread(target=lambda: (lock.acquire_read(), lock.release_read()))
+    second.start()
+    second.join(timeout=1)
+    assert not second.is_alive()
+
+    acquired = threading.Event()
+
+    def writer():
+        with lock.write():
+            acquired.set()
+
+    w = threading.Thread(target=writer)
+    w.start()
+    assert not acquired.wait(0.1)  # bloqueado mientras haya lectores
+    lock.release_read()
+    assert acquired.wait(1)
+    w.join(timeout=1)
+
+
+def test_registry_stores_of_same_pair_share_lock():
+    registry = CandleStoreRegistry(capacity=8, loader=lambda *a: None)
+    assert registry.get('EURUSD', '1m').lock is registry.get('EURUSD', '5m').lock
+    assert registry.get('EURUSD', '1m').lock is not registry.get('GBPUSD', '1m').lock
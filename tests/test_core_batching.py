@@ -0,0 +1,81 @@
+import queue
+import threading
+import core.anima_core as core_mod
+from core.anima_core import AnimaCore
+from signal_model import Signal
+
+
+class DummyBroker:
+    def get_balance(self): return 1000.0
+    def comprar(self, *args, **kwargs): return True, 1
+    def poll_results(self, tickets): return {}
+    def ping(self): pass
+    def conectar(self): pass
+
+
+class ScriptedBus:
+    """Entrega las señales programadas y después detiene el núcleo."""
+
+    def __init__(self, signals, stop_event):
+        self.signals = list(signals)
+        self.stop_event = stop_event
+
+    def get(self, timeout=None):
+        if self.signals:
+            return self.signals.pop(0)
+        self.stop_event.set()
+        raise queue.Empty()
+
+
+def test_core_evaluates_ensemble_once_per_pair_and_candle(monkeypatch, core_workdir):
+    calls = []
+
+    def fake_ensemble(records, strategy_list, payout, weights):
+        calls.append([(r['pair'], r['strategy']) for r in records])
+        return {'direction': 'CALL', 'weights': [1.0]}
+
+    monkeypatch.setattr(core_mod, 'conectar_broker', lambda creds, ev: DummyBroker())
+    monkeypatch.setattr(core_mod, 'generate_ensemble_signal', fake_ensemble)
+    stop_event = threading.Event()
+    core = AnimaCore(stop_event)
+    core.config.setdefault('engine', {})['coalesce_window'] = 1.0
+    core.bus = ScriptedBus([
+        Signal(pair='EURUSD', direction='CALL', strategy='mhi1_maioria', candle_ts=60),
+        Signal(pair='EURUSD', direction='PUT', strategy='five_flip', candle_ts=60),
+        Signal(pair='GBPUSD', direction='CALL', strategy='mhi1_maioria', candle_ts=60),
+        Signal(pair='EURUSD', direction='CALL', strategy='turno_over', candle_ts=60),
+    ], stop_event)
+    ordenes = []
+    monkeypatch.setattr(core, 'ejecutar_operacion', ordenes.append)
+    monkeypatch.setattr(core.rl_agent, 'select_action', lambda state: 1)
+
+    core.ejecutar_nucleo_tiempo_real()
+
+    assert calls == [
+        [('EURUSD', 'mhi1_maioria'), ('EURUSD', 'five_flip'), ('EURUSD', 'turno_over')],
+        [('GBPUSD', 'mhi1_maioria')],
+    ]
+    assert ordenes[0]['strategies'] == ['mhi1_maioria', 'turno_over']
+    assert ordenes[0]['strategy'] == 'mhi1_maioria+turno_over'
+    core.shutdown()
+
+
+def test_core_records_rl_metric_for_batches_without_direction(monkeypatch, core_workdir):
+    monkeypatch.setattr(core_mod, 'conectar_broker', lambda creds, ev: DummyBroker())
+    monkeypatch.setattr(core_mod, 'generate_ensemble_signal',
+                        lambda records, strategy_list, payout, weights: {'direction': None, 'weights': [0.5, 0.5]})
+    stop_event = threading.Event()
+    core = AnimaCore(stop_event)
+    core.bus = ScriptedBus([Signal(pair='EURUSD', direction='CALL', strategy='mhi1_maioria', candle_ts=60)],
+                           stop_event)
+    metrics = []
+    monkeypatch.setattr(core.db, 'registrar_rl_metric', lambda **kw: metrics.append(kw))
+    ordenes = []
+    monkeypatch.setattr(core, 'ejecutar_operacion', ordenes.append)
+
+    core.ejecutar_nucleo_tiempo_real()
+
+    assert ordenes == []
+    assert len(metrics) == 1
+    assert metrics[0]['action'] is None and metrics[0]['ensemble_signal'] is None
+    core.shutdown()
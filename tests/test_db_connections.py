@@ -0,0 +1,80 @@
+import threading
+from anima_db import DBHandler, get_connection
+
+
+def test_connection_is_reused_per_thread_with_wal(tmp_path):
+    path = str(tmp_path / "ops.db")
+    conn = get_connection(path)
+    assert get_connection(path) is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(get_connection(path)))
+    t.start()
+    t.join()
+    assert other[0] is not conn
+
+
+def test_dbhandler_writes_visible_on_shared_connection(tmp_path):
+    db = DBHandler(db_path=str(tmp_path / "ops.db"))
+    db.registrar_signal("EURUSD", "mhi1_maioria", "CALL")
+    df = db.load_signals()
+    assert len(df) == 1 and df["pair"].iloc[0] == "EURUSD"
+
+
+def test_write_behind_batches_and_drains_on_close(tmp_path):
+    db = DBHandler(db_path=str(tmp_path / "ops.db"))
+    writer = db.enable_write_behind(batch_size=1000, flush_interval=60.0)
+    for i in range(50):
+        db.registrar_rl_metric(step=i, action=1, reward=0.0, balance=100.0,
+                               ensemble_signal="CALL", weights=[1.0], epsilon=0.1)
+    db.registrar_signal("EURUSD", "mhi1_maioria", "PUT")
+    # Nada escrito todavía: el lote no está lleno ni ha vencido el intervalo
+    assert db.load_signals().empty
+
+    db.close()
+    assert not writer.is_alive()
+    conn = get_connection(db.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM rl_metrics").fetchone()[0] == 50
+    assert len(db.load_signals()) == 1
+
+
+def test_write_behind_failed_batch_falls_back_to_rows(tmp_path):
+    db = DBHandler(db_path=str(tmp_path / "ops.db"))
+    writer = db.enable_write_behind(batch_size=1000, flush_interval=60.0, retries=1, retry_backoff=0.0)
+    db.registrar_signal("EURUSD", "A", "CALL")
+    db.registrar_signal(None, "B", "PUT")   # viola NOT NULL: hace fallar el lote entero
+    db.registrar_signal("GBPUSD", "C", "PUT")
+    # Las operaciones no pasan por la cola: visibles sin esperar al escritor
+    db.registrar_operacion(pair="EURUSD", strategy="A", result="WIN", monto=1.0)
+    assert len(db.load_operations()) == 1
+
+    db.close()
+    assert not writer.is_alive()
+    assert db.load_signals()["pair"].tolist() == ["EURUSD", "GBPUSD"]
+
+
+def test_load_ohlcv_range_and_tail(tmp_path):
+    ohlcv = str(tmp_path / "ohlcv.sqlite")
+    with get_connection(ohlcv) as conn:
+        conn.execute("""CREATE TABLE ohlcv (symbol TEXT, timeframe TEXT, timestamp INTEGER, open REAL,
+                        high REAL, low REAL, close REAL, volume REAL, PRIMARY KEY(symbol, timeframe, timestamp))""")
+        conn.executemany("INSERT INTO ohlcv VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [("EURUSD", tf, ts, 1.0, 2.0, 0.5, 1.5, 10.0)
+                          for tf in ("1m", "5m") for ts in range(600, 0, -60)])
+    db = DBHandler(db_path=str(tmp_path / "ops.db"), ohlcv_path=ohlcv)
+
+    arrays = db.load_ohlcv("EURUSD", "1m", since=120, until=420, as_arrays=True)
+    assert arrays["timestamp"].tolist() == [180, 240, 300, 360, 420]
+    assert arrays["close"].dtype.kind == "f"
+
+    df = db.load_ohlcv("EURUSD", "1m", limit=3)
+    assert df["timestamp"].astype("int64").floordiv(10**9).tolist() == [480, 540, 600]
+    assert (df["timeframe"] == "1m").all()
+    assert db.load_ohlcv("GBPUSD", "1m").empty
+
+    plan = get_connection(ohlcv).execute(
+        "EXPLAIN QUERY PLAN SELECT timestamp FROM ohlcv WHERE symbol = ? AND timeframe = ? AND timestamp > ?",
+        ("EURUSD", "1m", 0)).fetchall()
+    assert "SEARCH ohlcv USING" in str(plan) and "timestamp>?" in str(plan)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from anima_ensemble import (EnsembleScorer, generate_ensemble_signal,
+                            _net_gains_serial, _net_gains_parallel)
+
+
+def test_serial_and_parallel_kernels_agree():
+    rng = np.random.default_rng(3)
+    ids = rng.integers(0, 7, 20_000).astype(np.int64)
+    results = rng.integers(0, 2, 20_000).astype(np.int64)
+    payouts = rng.uniform(0.7, 0.9, 7)
+    expected = np.zeros(7)
+    np.add.at(expected, ids, np.where(results == 1, payouts[ids], -payouts[ids]))
+    np.testing.assert_allclose(_net_gains_serial(ids, results, payouts, 7), expected)
+    np.testing.assert_allclose(_net_gains_parallel(ids, results, payouts, 7), expected)
+
+
+def test_scorer_matches_generate_and_uses_fixed_weights():
+    strategies = ['a', 'b', 'c']
+    records = [
+        {'strategy': 'a', 'direction': 'CALL', 'resultado': 'WIN'},
+        {'strategy': 'b', 'direction': 'PUT', 'resultado': 'LOSS'},
+        {'strategy': 'x', 'direction': 'PUT', 'resultado': 'WIN'},  # desconocida: se ignora
+    ]
+    scorer = EnsembleScorer(strategies, payout=0.8)
+    assert scorer.score(records) == generate_ensemble_signal(records, strategies, 0.8)
+    assert scorer.score(records)['direction'] == 'CALL'
+
+    fixed = EnsembleScorer(strategies, payout=0.8, weights=[1.0, 3.0, 0.0])
+    out = fixed.score_arrays(np.array([0, 1]), np.array([1, 0]), np.array([1.0, -1.0]))
+    assert out['direction'] == 'PUT'
+    assert out['weights'] == pytest.approx([0.25, 0.75, 0.0])
+
+
+def test_scorer_without_valid_votes_is_neutral():
+    out = EnsembleScorer(['a', 'b'], payout=0.8).score([])
+    assert out == {'direction': None, 'weights': [0.5, 0.5]}
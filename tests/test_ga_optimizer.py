@@ -0,0 +1,179 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from anima_db import DBHandler
+from anima_strategy_stats import StrategyStats
+from core.anima_ga_optimizer import GAOptimizer, converged, evaluate_population, migrate
+
+
+def _optimizer(tmp_path, **kw):
+    db = DBHandler(db_path=str(tmp_path / "ops.db"))
+    kw = {"population_size": 12, "generations": 5, **kw}
+    ga = GAOptimizer(stats=StrategyStats(snapshot_every=0), db=db, **kw)
+    ga.strategies = ["A", "B", "C"]
+    ga.payout = 1.0
+    return ga, db
+
+
+def _seed(db):
+    for _ in range(6):
+        db.registrar_operacion(pair="EURUSD", strategy="A", result="WIN", monto=1, nivel=1,
+                               balance_before=0, balance_after=0)
+    for _ in range(4):
+        db.registrar_operacion(pair="EURUSD", strategy="B+C", result="LOSS", monto=1, nivel=1,
+                               balance_before=0, balance_after=0)
+
+
+def test_gains_matrix_from_operations(tmp_path):
+    ga, db = _optimizer(tmp_path)
+    _seed(db)
+    gains = ga.load_gains()
+    assert gains.shape == (1, 3)
+    assert np.allclose(gains[0], [6.0, -4.0, -4.0])
+
+    ga.time_bucket = "hour"
+    assert ga.load_gains().shape == (24, 3)
+    assert np.allclose(ga.load_gains().sum(axis=0), [6.0, -4.0, -4.0])
+
+
+def test_population_evaluated_as_matrix(tmp_path):
+    ga, db = _optimizer(tmp_path)
+    _seed(db)
+    ga.gains = ga.load_gains()
+    population = ga._init_population(8)
+    batch = ga._evaluate_population(population)
+    assert np.allclose(batch, [ga._evaluate(w) for w in population])
+
+
+def test_optimize_prefers_winning_strategy(tmp_path, monkeypatch):
+    ga, db = _optimizer(tmp_path)
+    _seed(db)
+    monkeypatch.chdir(tmp_path)
+    best = ga.optimize()
+    assert np.isclose(best.sum(), 1.0)
+    assert best.argmax() == 0
+    assert (tmp_path / "ga_results" / "best_weights.npy").exists()
+    assert json.loads((tmp_path / "ga_results" / "registry" / "latest.json").read_text())["strategies"] == ["A", "B", "C"]
+
+
+def test_falls_back_to_stats_without_operations(tmp_path):
+    ga, _ = _optimizer(tmp_path)
+    assert ga.load_gains() is None
+    ga.stats.update("B", "WIN")
+    assert np.allclose(ga.load_gains(), [[0.0, 0.8, 0.0]])
+
+
+def test_migration_ring():
+    islands = [np.full((4, 2), float(i)) for i in range(3)]
+    out = migrate(islands, 1)
+    assert out[0][-1, 0] == 2.0 and out[1][-1, 0] == 0.0 and out[2][-1, 0] == 1.0
+    assert out[0][0, 0] == 0.0
+
+
+def test_islands_in_parallel(tmp_path, monkeypatch):
+    ga, db = _optimizer(tmp_path, generations=6)
+    _seed(db)
+    ga.islands, ga.migration_interval, ga.migration_size = 3, 2, 1
+    monkeypatch.chdir(tmp_path)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        ga.executor = executor
+        best = ga.optimize()
+    assert best.argmax() == 0
+    assert len(ga.history) == 6
+    assert ga.history == sorted(ga.history)  # el elitismo nunca empeora el mejor
+
+
+def _seed_timeline(db, days=8):
+    # A gana la primera mitad y pierde la segunda; B al revés
+    from anima_db import get_connection
+    conn = get_connection(db.db_path)
+    rows = []
+    for d in range(days):
+        ts = f"2026-01-{d + 1:02d}T12:00:00"
+        early = d < days // 2
+        rows.append((ts, "EURUSD", "A", "WIN" if early else "LOSS", 1, 1, 0, 0))
+        rows.append((ts, "EURUSD", "B", "LOSS" if early else "WIN", 1, 1, 0, 0))
+    with conn:
+        conn.executemany("INSERT INTO operations (timestamp, pair, strategy, result, monto, nivel, "
+                         "balance_before, balance_after) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def test_walk_forward_folds(tmp_path):
+    ga, db = _optimizer(tmp_path)
+    _seed_timeline(db)
+    ga.folds, ga.train_segments = 2, 2
+    folds = ga.build_folds(ga.load_history())
+    assert folds["train"].shape == folds["test"].shape == (2, 1, 3)
+    assert folds["test_trades"] == [4, 4]
+    assert folds["train_trades"] == [8, 8]
+    # Fold 0: entrena en días 1-4 (A gana), prueba en 5-6 (A pierde)
+    assert np.allclose(folds["train"][0, 0], [4.0, -4.0, 0.0])
+    assert np.allclose(folds["test"][0, 0], [-2.0, 2.0, 0.0])
+
+
+def test_walk_forward_fits_on_train_and_reports_out_of_sample(tmp_path, monkeypatch):
+    ga, db = _optimizer(tmp_path)
+    _seed_timeline(db)
+    ga.folds, ga.train_segments = 2, 2
+    monkeypatch.chdir(tmp_path)
+    best = ga.optimize()
+    # El entrenamiento favorece a A; el cambio de régimen aparece fuera de muestra
+    assert best[0] > best[1]
+    metrics = json.loads((tmp_path / "ga_results" / "fold_metrics.json").read_text())
+    assert len(metrics["folds"]) == 2
+    assert metrics["is_mean"] > 0 > metrics["oos_mean"]
+
+
+def test_walk_forward_does_not_reward_test_fold_fit(tmp_path):
+    ga, db = _optimizer(tmp_path)
+    _seed_timeline(db)
+    ga.folds, ga.train_segments = 2, 2
+    ga.gains, _, _ = ga._prepare_gains(None)
+    assert ga.gains is ga.fold_data["train"]
+    # B es perfecto en los folds de prueba, pero eso no mejora su fitness
+    fitted_to_test = np.array([0.0, 1.0, 0.0])
+    assert evaluate_population(fitted_to_test[np.newaxis, :], ga.fold_data["test"])[0] > 0
+    assert ga._evaluate(fitted_to_test) < ga._evaluate([1.0, 0.0, 0.0])
+
+
+def test_warm_start_reuses_state_and_reads_only_new_operations(tmp_path, monkeypatch):
+    ga, db = _optimizer(tmp_path)
+    _seed(db)
+    monkeypatch.chdir(tmp_path)
+    first = ga.optimize()
+    assert (tmp_path / "ga_results" / "ga_state.npz").exists()
+
+    db.registrar_operacion(pair="EURUSD", strategy="C", result="WIN", monto=1, nivel=1,
+                           balance_before=0, balance_after=0)
+    calls = []
+    original = db.load_operations
+    monkeypatch.setattr(db, "load_operations", lambda **kw: calls.append(kw) or original(**kw))
+    ga.optimize()
+    assert calls == [{"after_id": 10}]
+    assert np.allclose(ga.gains, [[6.0, -4.0, -3.0]])
+    # La población inicial incluye los mejores pesos de la ejecución anterior
+    state = ga.load_state()
+    assert state["populations"].shape == (1, 12, 3)
+    assert np.allclose(ga._initial_populations(state)[0][0], np.load("ga_results/best_weights.npy"))
+    assert first.argmax() == 0
+
+
+def test_state_ignored_when_strategies_change(tmp_path, monkeypatch):
+    ga, db = _optimizer(tmp_path)
+    _seed(db)
+    monkeypatch.chdir(tmp_path)
+    ga.optimize()
+    ga.strategies = ["A", "B"]
+    assert ga.load_state() is None
+
+
+def test_early_stopping(tmp_path, monkeypatch):
+    ga, db = _optimizer(tmp_path, generations=50)
+    _seed(db)
+    ga.patience, ga.tolerance = 3, 0.05
+    monkeypatch.chdir(tmp_path)
+    ga.optimize()
+    assert len(ga.history) < 50
+    assert converged(ga.history, 3, ga.tolerance)
@@ -25,7 +25,7 @@ class DummyBus:
             raise queue.Empty()
 
 
-def test_error_counter_db(monkeypatch):
+def test_error_counter_db(monkeypatch, core_workdir):
     # Monkeypatch broker constructor
     monkeypatch.setattr(core_mod, 'conectar_broker', lambda creds, ev: DummyBroker())
     # Monkeypatch generate_ensemble_signal to return valid direction and weights
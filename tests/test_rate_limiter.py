@@ -0,0 +1,80 @@
+import threading
+import pytest
+from core.rate_limiter import TokenBucket, RateGovernor
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_bucket_spends_burst_then_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock)
+    for _ in range(3):
+        assert bucket.acquire(timeout=0) == 0
+    with pytest.raises(TimeoutError):
+        bucket.acquire(timeout=0)
+    clock.t = 0.5  # medio segundo a 2 tokens/s → 1 token
+    assert bucket.acquire(timeout=0) == 0
+
+
+def test_pause_blocks_until_backoff_expires_and_stop_event_cancels():
+    bucket = TokenBucket(rate=100.0, burst=10)
+    bucket.pause(0.2)
+    assert bucket.acquire(timeout=1) >= 0.15
+
+    bucket.pause(30)
+    stop = threading.Event()
+    stop.set()
+    with pytest.raises(InterruptedError):
+        bucket.acquire(stop_event=stop)
+
+
+def test_governor_backoff_grows_with_jitter_and_resets_on_success():
+    governor = RateGovernor(backoff_base=1.0, backoff_max=8.0)
+    delays = [governor.rate_limited('candles') for _ in range(5)]
+    assert 0.5 <= delays[0] <= 1.0
+    assert 2.0 <= delays[2] <= 4.0
+    assert 4.0 <= delays[4] <= 8.0  # acotado por backoff_max
+    governor.success('candles')
+    assert governor.rate_limited('candles') <= 1.0
+
+
+def test_broker_call_retries_after_too_many_requests():
+    from core.anima_broker import AnimaBroker
+
+    calls = []
+
+    def get_balance():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError({'code': 'TooManyRequests'})
+        return 100.0
+
+    broker = AnimaBroker.__new__(AnimaBroker)
+    broker.stop_event = threading.Event()
+    broker.governor = RateGovernor(backoff_base=0.01)
+    broker.Iq = type('Iq', (), {'get_balance': staticmethod(get_balance)})()
+    assert broker.get_balance() == 100.0
+    assert len(calls) == 2
+
+
+def test_broker_call_gives_up_on_orders_after_max_retries():
+    from core.anima_broker import AnimaBroker
+
+    calls = []
+
+    def buy(*args):
+        calls.append(args)
+        raise RuntimeError({'code': 'TooManyRequests'})
+
+    broker = AnimaBroker.__new__(AnimaBroker)
+    broker.stop_event = threading.Event()
+    broker.governor = RateGovernor(backoff_base=0.01)
+    with pytest.raises(RuntimeError):
+        broker._call('orders', buy, 'EURUSD', 1, 'call', 1)
+    assert len(calls) == 1 + broker.governor.retries['orders']
@@ -3,7 +3,9 @@ import pytest
 from anima_rl_agent import AnimaTradingEnv, AnimaRLLightAgent
 
 
-def test_learn_q_update():
+def test_learn_q_update(tmp_path, monkeypatch):
+    # learn() persiste en el journal: aislar del directorio de trabajo
+    monkeypatch.chdir(tmp_path)
     # Crear entorno y agente con semilla fija
     env = AnimaTradingEnv(config={}, seed=0)
     agent = AnimaRLLightAgent(env, lr=0.1, gamma=0.99, epsilon=0.0, eps_decay=1.0, eps_min=0.0, seed=0)
@@ -28,7 +30,8 @@ def test_learn_q_update():
     np.testing.assert_allclose(agent.q_table[state_key][action], expected_q, rtol=1e-6)
 
 
-def test_exploitation_after_learning():
+def test_exploitation_after_learning(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
     env = AnimaTradingEnv(config={}, seed=0)
     agent = AnimaRLLightAgent(env, lr=0.1, gamma=0.99, epsilon=1.0, eps_decay=1.0, eps_min=0.0, seed=0)
 
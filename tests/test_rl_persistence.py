@@ -2,59 +2,118 @@ import os
 import pickle
 import numpy as np
 import pytest
-from anima_rl_agent import AnimaTradingEnv, AnimaRLLightAgent
+from anima_rl_agent import AnimaTradingEnv, AnimaRLLightAgent, QTable, StateEncoder
+
+# Clave v1/v2: índices discretos por dimensión de la observación (9)
+KEY = (1, 2, 3, 0, 0, 5, 5, 10, 0)
+
 
 def test_migration_from_v1(tmp_path, monkeypatch):
     # Trabajar en directorio temporal
     monkeypatch.chdir(tmp_path)
 
     # Crear archivos v1: q_table.pkl y epsilon.npy
-    old_q = {'a': np.array([1, 2, 3])}
+    old_q = {KEY: np.array([1, 2, 3, 4, 5]), 'a': np.array([1, 2, 3])}
     with open(tmp_path / 'q_table.pkl', 'wb') as f:
         pickle.dump(old_q, f)
     np.save(tmp_path / 'epsilon.npy', np.array(0.42))
 
-    # Instanciar agente (debería migrar automáticamente a v2)
+    # Instanciar agente (debería migrar automáticamente a v4)
     env = AnimaTradingEnv(config={}, seed=0)
     agent = AnimaRLLightAgent(env, seed=0)
 
-    # Debe existir rl_state.pkl v2
+    # Debe existir rl_state.pkl v4 apuntando a un snapshot en arrays
     state_path = tmp_path / 'rl_state.pkl'
     assert state_path.exists(), "No se creó rl_state.pkl"
-
-    # Cargar contenido
     with open(state_path, 'rb') as f:
         data = pickle.load(f)
-    assert data['version'] == 2
-    # Q-table debe coincidir
-    assert 'a' in data['q_table']
-    assert np.array_equal(data['q_table']['a'], old_q['a'])
-    # Epsilon debe coincidir
+    assert data['version'] == 4
     assert data['epsilon'] == pytest.approx(0.42)
+    assert os.path.exists(data['snapshot'] + '.codes.npy')
+
+    # La clave compatible se conserva; la incompatible ('a') se descarta
+    code = agent.encoder.encode_key(KEY)
+    assert len(agent.q_table) == 1
+    assert np.array_equal(agent.q_table[code], old_q[KEY])
+    assert agent.epsilon == pytest.approx(0.42)
 
     # Los archivos v1 originales deben haber sido borrados
     assert not (tmp_path / 'q_table.pkl').exists()
     assert not (tmp_path / 'epsilon.npy').exists()
 
 
+def test_migration_from_v1_keeps_compatible_keys(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    other = (0, 0, 0, 1, 1, 2, 2, 3, 1)
+    old_q = {KEY: np.array([1, 2, 3, 4, 5]), other: np.array([5, 4, 3, 2, 1])}
+    with open(tmp_path / 'q_table.pkl', 'wb') as f:
+        pickle.dump(old_q, f)
+
+    agent = AnimaRLLightAgent(AnimaTradingEnv(config={}, seed=0), seed=0)
+    assert len(agent.q_table) == 2
+    for key, values in old_q.items():
+        assert np.array_equal(agent.q_table[agent.encoder.encode_key(key)], values)
+
+
+def test_migration_from_v1_drops_incompatible_keys_with_warning(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+    old_q = {
+        KEY: np.array([1, 2, 3, 4, 5]),
+        'a': np.array([1, 2, 3]),                       # clave no codificable
+        (1, 2, 3): np.array([1, 2, 3, 4, 5]),           # dimensiones distintas
+        (0,) * 9: np.array([1, 2, 3]),                  # número de acciones distinto
+    }
+    with open(tmp_path / 'q_table.pkl', 'wb') as f:
+        pickle.dump(old_q, f)
+
+    with caplog.at_level('WARNING', logger='anima_rl_agent'):
+        agent = AnimaRLLightAgent(AnimaTradingEnv(config={}, seed=0), seed=0)
+    assert len(agent.q_table) == 1
+    assert "3 estados de la tabla Q antigua" in caplog.text
+
+
+def test_migration_from_v3_renames_old_arrays(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    env = AnimaTradingEnv(config={}, seed=0)
+    bins = StateEncoder(None, env.observation_space.shape[0]).bins.tolist()
+    table = QTable(n_actions=5, capacity=16)
+    table.row(42)[:] = [1, 2, 3, 4, 5]
+    table.save('rl_qtable')
+    with open(tmp_path / 'rl_state.pkl', 'wb') as f:
+        pickle.dump({'version': 3, 'table': 'rl_qtable', 'epsilon': 0.3, 'state_bins': bins}, f)
+
+    agent = AnimaRLLightAgent(env, seed=0)
+    assert np.array_equal(agent.q_table[42], [1, 2, 3, 4, 5])
+    assert agent.epsilon == pytest.approx(0.3)
+    assert not (tmp_path / 'rl_qtable.codes.npy').exists()
+    assert not (tmp_path / 'rl_qtable.values.npy').exists()
+    assert (tmp_path / 'rl_qtable.codes.npy.bak').exists()
+
+    # Recarga desde v4 sin depender de los arrays v3
+    reloaded = AnimaRLLightAgent(AnimaTradingEnv(config={}, seed=0), seed=0)
+    assert np.array_equal(reloaded.q_table[42], [1, 2, 3, 4, 5])
+
+
 def test_load_v2_direct(tmp_path, monkeypatch):
     # Trabajar en directorio temporal
     monkeypatch.chdir(tmp_path)
 
     # Crear rl_state.pkl v2 manualmente
-    original = {'x': np.array([9, 8, 7])}
+    original = {KEY: np.array([9, 8, 7, 6, 5])}
     versioned = {'version': 2, 'q_table': original, 'epsilon': 0.77}
     with open(tmp_path / 'rl_state.pkl', 'wb') as f:
         pickle.dump(versioned, f)
 
-    # Instanciar agente (debe cargar directamente v2)
+    # Instanciar agente (debe cargar v2 y reescribir en v4)
     env = AnimaTradingEnv(config={}, seed=1)
     agent = AnimaRLLightAgent(env, seed=1)
 
-    # Los valores del agente deben coincidir con los del archivo
-    assert 'x' in agent.q_table
-    assert np.array_equal(agent.q_table['x'], original['x'])
+    code = agent.encoder.encode_key(KEY)
+    assert code in agent.q_table
+    assert np.array_equal(agent.q_table[code], original[KEY])
     assert agent.epsilon == pytest.approx(0.77)
+    with open(tmp_path / 'rl_state.pkl', 'rb') as f:
+        assert pickle.load(f)['version'] == 4
 
 
 def test_save_on_learn(tmp_path, monkeypatch):
@@ -65,28 +124,113 @@ def test_save_on_learn(tmp_path, monkeypatch):
     agent = AnimaRLLightAgent(env, seed=2)
 
     # Configurar estado inicial
-    state_key = tuple((np.zeros(7) * 10).astype(int))
-    agent.q_table = {state_key: np.array([5, 6, 7])}
+    state = np.zeros(env.observation_space.shape)
+    code = agent._state_to_key(state)
+    agent.q_table.row(code)[:] = [5, 6, 7, 8, 9]
     agent.epsilon = 0.55
 
     # Llamar learn() con done=True para forzar persistencia
-    agent.learn(
-        state=np.zeros(7),
-        action=0,
-        reward=0.0,
-        next_state=np.zeros(7),
-        done=True
-    )
+    agent.learn(state=state, action=0, reward=0.0, next_state=state, done=True)
 
     # Debe existir rl_state.pkl actualizado
     state_path = tmp_path / 'rl_state.pkl'
     assert state_path.exists(), "No se guardó rl_state.pkl tras learn()"
-
     with open(state_path, 'rb') as f:
         data = pickle.load(f)
-    assert data['version'] == 2
-    # Q-table debería contener la clave configurada y coincidir con el estado del agente
-    assert state_key in data['q_table']
-    assert np.array_equal(data['q_table'][state_key], agent.q_table[state_key])
-    # Epsilon debería coincidir
-    assert data['epsilon'] == pytest.approx(agent.epsilon)
+    assert data['version'] == 4
+    # Sin snapshot todavía: el episodio sólo escribió el journal
+    assert data['snapshot'] is None
+    assert (tmp_path / 'rl_qtable.000000.journal').exists()
+
+    # Un agente nuevo recupera la misma tabla y el epsilon desde el journal
+    reloaded = AnimaRLLightAgent(AnimaTradingEnv(config={}, seed=2), seed=2)
+    assert np.array_equal(reloaded.q_table[code], agent.q_table[code])
+    assert reloaded.epsilon == pytest.approx(agent.epsilon)
+
+    # Tras un snapshot, la tabla puede abrirse mapeada en memoria
+    agent.save()
+    reloaded = AnimaRLLightAgent(AnimaTradingEnv(config={'rl': {'qtable_mmap': 'r+'}}, seed=2), seed=2)
+    assert isinstance(reloaded.q_table.values, np.memmap)
+    assert np.array_equal(reloaded.q_table[code], agent.q_table[code])
+    assert reloaded.epsilon == pytest.approx(agent.epsilon)
+
+
+def test_state_bins_change_discards_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    env = AnimaTradingEnv(config={}, seed=3)
+    agent = AnimaRLLightAgent(env, seed=3)
+    agent.learn(np.zeros(9), 1, 1.0, np.zeros(9), done=True)
+
+    other = AnimaRLLightAgent(AnimaTradingEnv(config={'rl': {'state_bins': 4}}, seed=3), seed=3)
+    assert len(other.q_table) == 0
+
+
+def test_journal_only_appends_changed_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    agent = AnimaRLLightAgent(AnimaTradingEnv(config={'rl': {'flush_every': 100}}, seed=4), seed=4)
+    states = [np.full(9, v) for v in (-1.0, -0.5, 0.0, 0.5)]
+    for s in states:
+        agent.learn(s, 1, 1.0, s, done=False)
+    agent.learn(states[0], 1, 1.0, states[0], done=True)
+    record = agent.store._record_dtype(agent.n_actions).itemsize
+    journal = tmp_path / 'rl_qtable.000000.journal'
+    assert journal.stat().st_size == 5 * record      # 4 filas + epsilon
+
+    agent.learn(states[1], 2, -1.0, states[1], done=True)
+    assert journal.stat().st_size == 7 * record      # sólo la fila tocada + epsilon
+
+
+def test_flush_without_episode_end(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # El núcleo nunca cierra episodio (done=False): el umbral de filas vuelca igualmente
+    agent = AnimaRLLightAgent(AnimaTradingEnv(config={'rl': {'flush_every': 2}}, seed=6), seed=6)
+    journal = tmp_path / 'rl_qtable.000000.journal'
+    agent.learn(np.full(9, -1.0), 1, 1.0, np.full(9, -1.0), done=False)
+    assert not journal.exists()
+    agent.learn(np.full(9, 0.5), 1, 1.0, np.full(9, 0.5), done=False)
+    assert journal.exists()
+
+    reloaded = AnimaRLLightAgent(AnimaTradingEnv(config={}, seed=6), seed=6)
+    code = agent.encoder.encode(np.full(9, 0.5))
+    assert np.array_equal(reloaded.q_table[code], agent.q_table[code])
+
+
+def test_compaction_and_truncated_journal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    env = AnimaTradingEnv(config={'rl': {'compact_every': 3}}, seed=5)
+    agent = AnimaRLLightAgent(env, seed=5)
+    for v in (-1.0, -0.5, 0.0):
+        agent.learn(np.full(9, v), 1, 1.0, np.full(9, v), done=True)
+    agent.store.wait()
+    with open('rl_state.pkl', 'rb') as f:
+        meta = pickle.load(f)
+    assert meta['generation'] >= 1 and meta['snapshot']
+    assert not (tmp_path / 'rl_qtable.000000.journal').exists()
+
+    agent.learn(np.full(9, 0.5), 3, 2.0, np.full(9, 0.5), done=True)
+    agent.close()
+    expected = {code: row.copy() for code, row in agent.q_table.items()}
+    # Caída a mitad de escritura: un registro incompleto al final del journal
+    journal = tmp_path / f"rl_qtable.{agent.store.generation:06d}.journal"
+    with open(journal, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    reloaded = AnimaRLLightAgent(AnimaTradingEnv(config={}, seed=5), seed=5)
+    assert {code: row.tolist() for code, row in reloaded.q_table.items()} == \
+        {code: row.tolist() for code, row in expected.items()}
+    assert reloaded.epsilon == pytest.approx(agent.epsilon)
+
+
+def test_encoder_and_table():
+    enc = StateEncoder([2, 3], 2)
+    codes = {enc.encode(np.array([a, b])) for a in (-1, 0, 1) for b in (-1, -0.2, 0.4, 1)}
+    assert codes == set(range(enc.size)) and enc.size == 12
+    assert enc.decode(enc.encode(np.array([1.0, -1.0]))) == (2, 0)
+    assert enc.encode(np.array([5.0, -7.0])) == enc.encode(np.array([1.0, -1.0]))
+
+    table = QTable(n_actions=2, capacity=16)
+    for code in range(100):
+        table.row(code * 7919)[1] = code
+    assert len(table) == 100 and len(table.codes) >= 200
+    assert all(table[code * 7919][1] == code for code in range(100))
+    assert 5 not in table
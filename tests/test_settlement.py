@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import core.anima_core as core_mod
+from core.anima_core import AnimaCore
+from anima_strategy_stats import StrategyStats
+from engine.settlement import SettlementTracker, PendingTrade, classify_result
+
+
+class SweepBroker:
+    """poll_results falso: los tickets de `closed` están cerrados con su ganancia."""
+
+    def __init__(self):
+        self.closed = {}
+        self.sweeps = []
+
+    def get_balance(self): return 1000.0
+    def comprar(self, par, direc, monto, tiempo): return True, 1
+    def ping(self): pass
+    def conectar(self): pass
+
+    def poll_results(self, tickets):
+        self.sweeps.append(sorted(tickets))
+        return {t: (t in self.closed, self.closed.get(t)) for t in tickets}
+
+
+class FakeClock:
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def test_sweep_polls_due_tickets_together_and_reschedules_open_ones():
+    broker, clock, settled = SweepBroker(), FakeClock(), []
+    tracker = SettlementTracker(lambda: broker, lambda trade, p: settled.append((trade.ticket, classify_result(p))),
+                                threading.Event(), poll_interval=1.0, settle_grace=0.5, clock=clock)
+    tracker.submit(PendingTrade(ticket=1, pair='EURUSD', direction='CALL', duracion=1, opened_at=0))
+    tracker.submit(PendingTrade(ticket=2, pair='EURUSD', direction='PUT', duracion=1, opened_at=10))
+    tracker.submit(PendingTrade(ticket=3, pair='EURUSD', direction='PUT', duracion=5, opened_at=0))
+
+    clock.t = 60.0
+    assert tracker._due_tickets() == []  # margen tras el vencimiento
+    clock.t = 70.5
+    due = tracker._due_tickets()
+    broker.closed = {1: 0.85}
+    tracker.sweep(due)
+    assert broker.sweeps == [[1, 2]] and settled == [(1, 'WIN')]
+
+    clock.t = 71.5  # el ticket 2 sigue abierto: se reagenda un poll_interval después
+    broker.closed[2] = -1.0
+    tracker.sweep(tracker._due_tickets())
+    assert broker.sweeps[-1] == [2] and settled[-1] == (2, 'LOSS')
+    assert tracker.pending == 1  # el de 5 minutos todavía no vence
+
+
+def test_expiry_rounds_to_minute_boundary_and_rejects_duplicate_tickets():
+    assert PendingTrade(ticket=1, pair='EURUSD', direction='CALL', duracion=1, opened_at=10).expires_at == 60
+    assert PendingTrade(ticket=1, pair='EURUSD', direction='CALL', duracion=5, opened_at=130).expires_at == 300
+    assert PendingTrade(ticket=1, pair='EURUSD', direction='CALL', duracion=1, opened_at=60).expires_at == 120
+
+    broker, clock, settled = SweepBroker(), FakeClock(), []
+    tracker = SettlementTracker(lambda: broker, lambda trade, p: settled.append(trade.direction),
+                                threading.Event(), settle_grace=0.5, clock=clock)
+    assert tracker.submit(PendingTrade(ticket=7, pair='EURUSD', direction='CALL', duracion=1, opened_at=10))
+    assert not tracker.submit(PendingTrade(ticket=7, pair='EURUSD', direction='PUT', duracion=1, opened_at=20))
+    assert tracker.pending == 1
+
+    clock.t = 60.5   # vence en el límite del minuto, no a los 70 s
+    broker.closed = {7: 0.85}
+    tracker.sweep(tracker._due_tickets())
+    assert settled == ['CALL']
+
+
+def test_core_order_returns_before_settlement_and_feeds_back(monkeypatch, core_workdir):
+    broker = SweepBroker()
+    monkeypatch.setattr(core_mod, 'conectar_broker', lambda creds, ev: broker)
+    core = AnimaCore(threading.Event())
+    registered = []
+    settled = threading.Event()
+    monkeypatch.setattr(core.supervisor, 'register_trade', lambda r: (registered.append(r), settled.set()))
+
+    ticket = core.ejecutar_operacion({'pair': 'EURUSD', 'direction': 'CALL', 'strategy': 'mhi1_maioria',
+                                      'duracion': 0})
+    assert ticket == 1 and registered == []  # la liquidación aún no ha ocurrido
+
+    broker.closed[1] = 0.85
+    assert settled.wait(3)
+    assert registered == ['WIN']
+    # La operación liquidada se registra en la BD del directorio temporal
+    assert os.path.abspath(core.db.db_path).startswith(str(core_workdir))
+    for _ in range(100):
+        if not core.db.load_operations().empty:
+            break
+        time.sleep(0.02)
+    assert core.db.load_operations()['result'].tolist() == ['WIN']
+    core.shutdown()
+
+
+def test_settlement_scores_every_vote_against_realized_direction(monkeypatch, core_workdir):
+    monkeypatch.setattr(core_mod, 'conectar_broker', lambda creds, ev: SweepBroker())
+    core = AnimaCore(threading.Event())
+    core.strategy_stats = StrategyStats(payout=1.0, snapshot_path=str(core_workdir / 'stats.json'), snapshot_every=0)
+    monkeypatch.setattr(core.db, 'registrar_operacion', lambda **kw: None)
+    trade = PendingTrade(ticket=9, pair='EURUSD', direction='CALL', strategy='A', opened_at=0,
+                         context={'votes': {'A': 'CALL', 'B': 'PUT'}})
+    core._on_trade_settled(trade, -1.0)   # perdió: el mercado fue PUT
+    assert core.strategy_stats.win_rate('A') == 0.0
+    assert core.strategy_stats.win_rate('B') == 1.0
+    assert core.strategy_stats.trades('B', 'EURUSD', 0) == 1
+    core.shutdown()
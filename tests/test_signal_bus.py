@@ -0,0 +1,46 @@
+import queue
+import pytest
+from engine.signal_bus import SignalBus
+from signal_model import Signal
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _sig(strategy, candle_ts=0, tf='1m'):
+    return Signal(pair='EURUSD', direction='CALL', strategy=strategy, timeframe=tf, candle_ts=candle_ts)
+
+
+def test_priority_order_and_fifo_within_priority():
+    bus = SignalBus(priorities={'fuerte': 2.0, 'debil': 0.5})
+    for s in (_sig('debil'), _sig('media'), _sig('fuerte'), _sig('media', candle_ts=60)):
+        bus.publish(s)
+    orden = [(s.strategy, s.candle_ts) for s in (bus.get(timeout=0) for _ in range(4))]
+    assert orden == [('fuerte', 0), ('debil', 0), ('media', 0), ('media', 60)]
+    with pytest.raises(queue.Empty):
+        bus.get(timeout=0)
+
+
+def test_expired_signals_are_dropped_by_timeframe_ttl():
+    clock = FakeClock()
+    bus = SignalBus(clock=clock)
+    bus.publish(_sig('a', tf='1m'))
+    bus.publish(_sig('b', tf='5m'))
+    clock.t = 61.0
+    assert bus.get(timeout=0).strategy == 'b'
+    assert bus.qsize() == 0
+
+
+def test_duplicates_ignored_and_capacity_evicts_lowest_priority():
+    bus = SignalBus(maxsize=2, priorities={'alta': 3.0, 'baja': 1.0})
+    assert bus.publish(_sig('baja'))
+    assert not bus.publish(_sig('baja'))  # misma (par, estrategia, vela)
+    assert bus.publish(_sig('media'))
+    assert not bus.publish(_sig('otra'))  # llena y sin más prioridad que la peor
+    assert bus.publish(_sig('alta'))      # desplaza a la de menor prioridad
+    assert [bus.get(timeout=0).strategy for _ in range(2)] == ['alta', 'baja']
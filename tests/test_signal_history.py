@@ -0,0 +1,80 @@
+import importlib
+import numpy as np
+import pandas as pd
+import services.anima_signal_history as history_mod
+from anima_strategies.batch import KERNELS
+from services.anima_signal_history import SignalHistory
+
+
+def _candles(n=120, seed=3):
+    rng = np.random.default_rng(seed)
+    open_ = rng.integers(95, 105, n).astype(float)
+    close = open_ + rng.integers(-2, 3, n)
+    return pd.DataFrame({
+        'timestamp': np.arange(n, dtype=np.int64) * 60 + 1_700_000_000,
+        'open': open_,
+        'high': np.maximum(open_, close) + 1,
+        'low': np.minimum(open_, close) - 1,
+        'close': close,
+        'volume': 1.0,
+    })
+
+
+def test_replay_matches_prefix_evaluation(monkeypatch):
+    df = _candles()
+    config = {
+        'pairs': ['EURUSD'],
+        'estrategias': [
+            {'nombre': 'mhi2_maioria', 'params': {'window': 5}},
+            {'nombre': 'gaba', 'params': {'body_threshold': 0.1, 'wick_multiplier': 2}},
+            {'nombre': 'ema_crossover', 'params': {'fast_period': 3, 'slow_period': 6}},
+        ],
+    }
+    monkeypatch.setattr(history_mod, 'cargar_config', lambda: config)
+    monkeypatch.setattr(history_mod, 'get_historical_ohlcv', lambda *a, **k: df)
+
+    result = SignalHistory(history_lookback=len(df)).run()
+
+    expected = []
+    for cfg in config['estrategias']:
+        modulo = importlib.import_module(f"anima_strategies.{cfg['nombre']}")
+        params = {**cfg['params'], 'pair': 'EURUSD'}
+        for i in range(len(df)):
+            senal = modulo.generate_signal(df.iloc[:i + 1], params)
+            if senal:
+                expected.append((pd.Timestamp(int(df['timestamp'][i]), unit='s'), cfg['nombre'], senal.direction))
+
+    got = sorted(zip(result['timestamp'], result['strategy'], result['direction']))
+    assert got == sorted(expected)
+    assert set(result['pair']) == {'EURUSD'}
+
+
+def test_replay_fallbacks_use_bounded_window(monkeypatch):
+    df = _candles()
+    lookback = 8
+    config = {
+        'pairs': ['EURUSD'],
+        'estrategias': [
+            {'nombre': 'mhi2_maioria', 'params': {'window': 5}},
+            {'nombre': 'ema_crossover', 'params': {'fast_period': 3, 'slow_period': 6}},
+        ],
+    }
+    assert 'ema_crossover' not in KERNELS and 'mhi2_maioria' in KERNELS
+    monkeypatch.setattr(history_mod, 'cargar_config', lambda: config)
+    monkeypatch.setattr(history_mod, 'get_historical_ohlcv', lambda *a, **k: df)
+
+    result = SignalHistory(history_lookback=lookback).run()
+
+    # Kernel: prefijo completo. Sin kernel: sólo las últimas `lookback` velas
+    expected = []
+    for cfg in config['estrategias']:
+        modulo = importlib.import_module(f"anima_strategies.{cfg['nombre']}")
+        params = {**cfg['params'], 'pair': 'EURUSD'}
+        start = (lambda i: 0) if cfg['nombre'] in KERNELS else (lambda i: max(0, i + 1 - lookback))
+        for i in range(len(df)):
+            senal = modulo.generate_signal(df.iloc[start(i):i + 1], params)
+            if senal:
+                expected.append((pd.Timestamp(int(df['timestamp'][i]), unit='s'), cfg['nombre'], senal.direction))
+
+    got = sorted(zip(result['timestamp'], result['strategy'], result['direction']))
+    assert got == sorted(expected)
@@ -0,0 +1,97 @@
+import numpy as np
+
+from anima_ensemble import EnsembleScorer
+from anima_strategy_stats import StrategyStats
+
+
+def test_rolling_window_and_levels():
+    stats = StrategyStats(payout=1.0, window=3, snapshot_every=0)
+    for res in ["WIN", "WIN", "LOSS", "LOSS"]:
+        stats.update("A", res, pair="EURUSD", hour=10)
+    stats.update("A", "WIN", pair="GBPUSD", hour=11)
+
+    assert stats.trades("A") == 5
+    assert stats.trades("A", "EURUSD") == 4
+    assert stats.trades("A", "EURUSD", 10) == 4
+    # Ventana de 3 en EURUSD: WIN, LOSS, LOSS
+    assert np.allclose(stats.net_gains(["A"], pair="EURUSD", kind="rolling"), [-1.0])
+    assert np.allclose(stats.net_gains(["A"], kind="total"), [1.0])
+    assert stats.win_rate("A", "EURUSD", rolling=True) == 1 / 3
+    assert len(stats) == 1
+
+
+def test_ewm_follows_recent_results():
+    stats = StrategyStats(payout=1.0, half_life=2, snapshot_every=0)
+    for _ in range(20):
+        stats.update("A", "LOSS")
+    for _ in range(5):
+        stats.update("A", "WIN")
+    gains = stats.net_gains(["A", "B"])
+    assert gains[0] > 0
+    assert gains[1] == 0.0
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = StrategyStats(payout=0.8, window=4, snapshot_path=path, snapshot_every=2)
+    stats.update("A", "WIN", pair="EURUSD", hour=3)
+    stats.update("B", "LOSS", pair="EURUSD", hour=3)  # dispara snapshot automático
+
+    loaded = StrategyStats.load(path, payout=0.8, window=4)
+    for kind in ("total", "rolling", "ewm"):
+        assert np.allclose(loaded.net_gains(["A", "B"], kind=kind), stats.net_gains(["A", "B"], kind=kind))
+    assert loaded.trades("B", "EURUSD", 3) == 1
+
+
+def test_ensemble_weights_from_stats():
+    stats = StrategyStats(payout=1.0, snapshot_every=0)
+    for _ in range(10):
+        stats.update("A", "LOSS")
+        stats.update("B", "WIN")
+    scorer = EnsembleScorer(["A", "B"], payout=1.0, stats=stats)
+    # Los votos no traen resultado: sin stats ambas pesarían lo mismo y ganaría CALL
+    out = scorer.score([
+        {"strategy": "A", "direction": "CALL"},
+        {"strategy": "B", "direction": "PUT"},
+    ])
+    assert out["direction"] == "PUT"
+    assert out["weights"][1] > out["weights"][0]
+
+
+def test_contextual_gains_fall_back_per_level():
+    stats = StrategyStats(payout=1.0, min_trades=3, snapshot_every=0)
+    for _ in range(3):
+        stats.update("A", "WIN", pair="EURUSD", hour=10)
+    stats.update("A", "LOSS", pair="EURUSD", hour=11)
+    for _ in range(5):
+        stats.update("B", "LOSS", pair="GBPUSD", hour=10)
+
+    # A: nivel (par, hora) con 3 operaciones; B: sin historial en EURUSD → global
+    gains = stats.contextual_gains(["A", "B"], pair="EURUSD", hour=10, kind="total")
+    assert np.allclose(gains, [3.0, -5.0])
+    # Hora 11 con una sola operación: se usa el nivel del par
+    assert np.allclose(stats.contextual_gains(["A"], pair="EURUSD", hour=11, kind="total"), [2.0])
+    assert stats.contextual_gains(["A", "C"], pair="EURUSD", hour=10) is None
+    assert np.allclose(stats.contextual_gains(["A", "C"], pair="EURUSD", hour=10, kind="total", default=0.0),
+                       [3.0, 0.0])
+    assert stats.covers(["A", "B"]) and not stats.covers(["A", "C"])
+
+
+def test_ensemble_uses_stats_of_voting_strategies_with_neutral_fallback():
+    stats = StrategyStats(payout=1.0, snapshot_every=0)
+    for _ in range(10):
+        stats.update("A", "LOSS")
+    # C está configurada pero nunca ha operado: no bloquea el uso de las estadísticas
+    scorer = EnsembleScorer(["A", "B", "C"], payout=1.0, stats=stats)
+    out = scorer.score([
+        {"strategy": "A", "direction": "CALL"},
+        {"strategy": "B", "direction": "PUT"},
+    ])
+    # B sin historial entra con ganancia neutra y pesa más que A, que viene perdiendo
+    assert out["direction"] == "PUT"
+    assert out["weights"][1] == out["weights"][2] > out["weights"][0]
+
+    # Ninguna estrategia del lote tiene historial: ganancias calculadas sobre los votos
+    out = scorer.score([{"strategy": "B", "direction": "CALL"}, {"strategy": "C", "direction": "PUT"}])
+    # (A no vota: su ganancia por votos es 0 y supera a las de B y C, que no traen resultado)
+    assert out["weights"][0] > out["weights"][1] == out["weights"][2]
@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+import pytest
+
+import core.anima_core as core_mod
+from core.anima_core import AnimaCore
+from core.weights_registry import WeightsRegistry, WeightsWatcher, strategies_hash
+
+
+class DummyBroker:
+    def get_balance(self): return 1000.0
+    def poll_results(self, tickets): return {}
+    def ping(self): pass
+    def conectar(self): pass
+
+
+def test_publish_and_load_versions(tmp_path):
+    reg = WeightsRegistry(str(tmp_path))
+    assert reg.latest() is None
+    v1 = reg.publish([0.2, 0.8], ["A", "B"], fitness=1.5, islands=2)
+    v2 = reg.publish([0.6, 0.4], ["A", "B"], fitness=2.0)
+    assert reg.versions() == [v1["version"], v2["version"]]
+    assert reg.latest()["version"] == v2["version"]
+    assert reg.latest()["strategies_hash"] == strategies_hash(["A", "B"])
+    weights, manifest = reg.load(v1["version"])
+    assert np.allclose(weights, [0.2, 0.8]) and manifest["islands"] == 2
+    with pytest.raises(ValueError):
+        reg.load_compatible(["B", "A"])
+
+
+def test_watcher_applies_compatible_and_rejects_others(tmp_path):
+    reg = WeightsRegistry(str(tmp_path))
+    swaps = []
+    watcher = WeightsWatcher(reg, ["A", "B"], lambda w, m: swaps.append((w.tolist(), m["version"])),
+                             threading.Event())
+    assert watcher.check() is False
+    ok = reg.publish([0.3, 0.7], ["A", "B"])
+    assert watcher.check() is True
+    assert watcher.check() is False  # misma versión: nada que hacer
+    reg.publish([0.5, 0.25, 0.25], ["A", "B", "C"])
+    assert watcher.check() is False
+    assert swaps == [([0.3, 0.7], ok["version"])]
+
+
+def test_core_hot_swaps_weights(core_workdir, monkeypatch):
+    monkeypatch.setattr(core_mod, 'conectar_broker', lambda creds, ev: DummyBroker())
+    core = AnimaCore(threading.Event())
+    try:
+        nombres = [e['nombre'] for e in core.estrategias]
+        reg = WeightsRegistry(str(core_workdir / "registry"))
+        core.weights_watcher.registry = reg
+        manifest = reg.publish(np.full(len(nombres), 1.0 / len(nombres)), nombres, fitness=3.0)
+        assert core.weights_watcher.check()
+        assert core.weights_version == manifest["version"]
+        assert np.allclose(core.best_weights, 1.0 / len(nombres))
+        assert core.bus.priorities[nombres[0]] == pytest.approx(1.0 / len(nombres))
+    finally:
+        core.shutdown()
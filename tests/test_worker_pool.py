@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+import pandas as pd
+from engine.candle_store import CandleStore
+from engine.worker_pool import StrategyWorker, CandleCloseDispatcher
+
+
+class ListBus:
+    def __init__(self):
+        self.signals = []
+
+    def publish(self, signal):
+        self.signals.append(signal)
+
+
+def _bullish(n, start=0):
+    ts = np.arange(start, start + n * 60, 60, dtype=np.int64)
+    return pd.DataFrame({'timestamp': ts, 'open': 1.0, 'high': 2.5, 'low': 0.5, 'close': 2.0, 'volume': 1.0})
+
+
+def _worker(tf, store=None, bus=None):
+    cfg = {'nombre': 'mhi1_maioria', 'timeframe': tf, 'params': {'window': 3, 'pair': 'EURUSD'}}
+    if store is None:
+        store = CandleStore('EURUSD', tf, capacity=50, loader=lambda *a: None)
+    return StrategyWorker('EURUSD', cfg, bus or ListBus(), threading.Event(), store=store)
+
+
+def test_next_close_wakes_only_closing_timeframes():
+    dispatcher = CandleCloseDispatcher(threading.Event())
+    w1, w5 = _worker('1m'), _worker('5m')
+    dispatcher.register(w1)
+    dispatcher.register(w5)
+    assert w1.event_driven and w5.event_driven
+
+    close_ts, tfs = dispatcher.next_close(1000.5)
+    assert (close_ts, tfs) == (1020, ['1m'])
+    close_ts, tfs = dispatcher.next_close(1190.0)
+    assert close_ts == 1200 and sorted(tfs) == ['1m', '5m']
+
+    assert dispatcher.dispatch(1020, ['1m']) == 1
+    assert w1._wake.is_set() and not w5._wake.is_set()
+
+
+def test_worker_skips_evaluation_without_new_bar():
+    history = _bullish(5)
+    store = CandleStore('EURUSD', '1m', capacity=50, min_refresh_interval=0.0,
+                        loader=lambda pair, tf, since: history if since is None else history[history['timestamp'] > since])
+    bus = ListBus()
+    worker = _worker('1m', store=store, bus=bus)
+
+    worker._tick()
+    worker._tick()  # misma vela: no se vuelve a evaluar
+    assert len(bus.signals) == 1
+    assert bus.signals[0].direction == 'CALL'
+
+    history = pd.concat([history, _bullish(1, start=300)], ignore_index=True)
+    worker._tick()
+    assert len(bus.signals) == 2
+
+
+def test_worker_evaluates_a_copy_detached_from_the_ring_buffer():
+    store = CandleStore('EURUSD', '1m', capacity=4, loader=lambda *a: None)
+    store.append_frame(_bullish(4))
+    seen = []
+    worker = _worker('1m', store=store)
+    worker._evaluate = lambda df: seen.append(df) or []
+
+    worker._tick()
+    # Un append posterior (fuera del lock de lectura) rota el buffer circular
+    store.append_frame(_bullish(4, start=240))
+    assert seen[0]['timestamp'].tolist() == list(pd.to_datetime([60, 120, 180], unit='s'))
+    assert not np.shares_memory(seen[0]['close'].to_numpy(), store._buffers['close'])
+
+
+def test_pair_batch_worker_publishes_all_strategies_in_one_pass():
+    from engine.worker_pool import PairBatchWorker
+
+    history = _bullish(10)
+    store = CandleStore('EURUSD', '1m', capacity=50, loader=lambda *a: history)
+    estrategias = [
+        {'nombre': 'mhi1_maioria', 'params': {'window': 3, 'pair': 'EURUSD'}},
+        {'nombre': 'five_flip', 'params': {'window': 5, 'pair': 'EURUSD'}},
+        {'nombre': 'turno_over', 'params': {'pair': 'EURUSD'}},
+    ]
+    bus = ListBus()
+    worker = PairBatchWorker('EURUSD', estrategias, bus, threading.Event(), store=store)
+    assert worker.window == 100  # turno_over sin 'window' usa el límite por defecto
+    worker._tick()
+    assert [(s.strategy, s.direction) for s in bus.signals] == [('mhi1_maioria', 'CALL'), ('five_flip', 'PUT')]